@@ -0,0 +1,669 @@
+import datetime
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+import requests
+
+from PulseOX.ring_buffer import RingBuffer
+from sensor_sources import WAVEFORM_DTYPE
+from uplink import TelemetryUplink, VitalsBatchStreamer
+from procedure_records import (ProcedureRecordReader, ProcedureRecordWriter, format_record, iter_records,
+                               parse_record_line)
+from record_chunks import (MAGIC, MISSING, ChunkRecordReader, ChunkRecordWriter, encode_vitals_chunk,
+                           encode_waveform_chunk)
+from infusion import InfusionIntegrator
+from scheduler import PeriodicScheduler
+from servo_control import ServoController, SERVO_STEP_HARDWARE, SERVO_STEP_SOFTWARE
+
+# Tests for the modules NORA.py runs on besides the GUI
+# To run type (from PI_Vital_Dashboard): python -m unittest Dashboard_tests.py
+
+
+class FakeClock:
+    """Stands in for time.monotonic; only moves when advanced"""
+
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeServo:
+    """Stands in for a gpiozero Servo; remembers every value written"""
+
+    def __init__(self, value=1.0):
+        self.value = value
+        self.values = []
+
+    def __setattr__(self, name, value):
+        if name == "value" and hasattr(self, "values"):
+            self.values.append(value)
+        super().__setattr__(name, value)
+
+
+class ServoController_tests(unittest.TestCase):
+
+    def make_controller(self, step, flow_rate=30, poll_interval=1.0):
+        self.clock = FakeClock()
+        self.servo = FakeServo()
+        self.volume = 0.0
+        self.flow_rate = flow_rate
+        controller = ServoController(self.servo, lambda: self.volume, lambda: self.flow_rate, syringe_size=50000,
+                                     step=step, poll_interval=poll_interval, clock=self.clock)
+        controller.reset()
+        return controller
+
+    def test_volume_smaller_than_a_step_is_delivered(self):
+        controller = self.make_controller(SERVO_STEP_SOFTWARE) # 250 μL per step
+        controller.step()
+        self.assertEqual(controller.steps, 0)
+
+        for volume in (1.0, 10.0, 25.0, 50.0):
+            self.volume = volume
+            controller.step()
+            self.assertEqual(controller.steps, 1)
+        self.assertAlmostEqual(controller.delivered, 250.0)
+        self.assertAlmostEqual(self.servo.values[-1], 1.0 - SERVO_STEP_SOFTWARE)
+        self.assertEqual(len(self.servo.values), 1)
+
+    def test_next_step_is_scheduled_from_the_flow_rate(self):
+        controller = self.make_controller(SERVO_STEP_HARDWARE, flow_rate=600, poll_interval=10.0) # 25 μL per step, 10 μL/s
+        self.volume = 5.0
+        self.assertAlmostEqual(controller.step(), 2.0) # 20 μL left on the step at 10 μL/s
+        self.assertEqual(controller.steps, 1)
+
+        self.flow_rate = 1200
+        self.assertAlmostEqual(controller.step(), 1.0)
+
+        self.clock.advance(1.0)
+        self.volume = 25.0 + 1e-6
+        controller.step()
+        self.assertEqual(controller.steps, 2)
+        self.assertAlmostEqual(controller.lateness_last, 0.0)
+        self.assertEqual(controller.missed_steps, 0)
+
+        self.volume = 100.0 # woke late: the steps are written at once
+        controller.step()
+        self.assertEqual(controller.steps, 4)
+        self.assertEqual(controller.missed_steps, 1)
+
+    def test_stopped_flow_polls(self):
+        controller = self.make_controller(SERVO_STEP_HARDWARE, flow_rate=0, poll_interval=0.5)
+        self.assertEqual(controller.step(), 0.5)
+
+    def test_reset_counts_from_the_current_position(self):
+        controller = self.make_controller(SERVO_STEP_HARDWARE)
+        self.volume = 30.0
+        controller.step()
+        self.assertEqual(controller.steps, 2)
+        position = controller.position
+
+        controller.reset()
+        self.assertEqual(controller.delivered, 0.0)
+        controller.step()
+        self.assertEqual(controller.position, position) # the plunger does not move back
+
+        self.volume = 31.0
+        controller.step()
+        self.assertAlmostEqual(controller.position, position - SERVO_STEP_HARDWARE)
+        self.assertAlmostEqual(controller.delivered, 25.0)
+
+    def test_stops_at_the_end_of_travel(self):
+        controller = self.make_controller(SERVO_STEP_SOFTWARE)
+        self.volume = 1e6
+        controller.step()
+        self.assertEqual(controller.steps, 200)
+        self.assertAlmostEqual(controller.position, -1.0)
+
+
+class PeriodicScheduler_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = PeriodicScheduler(clock=self.clock)
+        self.run_times = []
+
+    def work(self, seconds=0.0):
+        self.run_times.append(self.clock())
+        self.clock.advance(seconds)
+
+    def test_stays_on_the_fixed_grid(self):
+        start = self.clock()
+        task = self.scheduler.add("tick", 1.0, self.work, 0.3) # each run takes 0.3 s
+        for _ in range(5):
+            self.clock.advance(self.scheduler.run_due())
+        self.assertEqual(self.run_times, [start, start + 1, start + 2, start + 3, start + 4])
+        self.assertEqual(task.runs, 5)
+        self.assertEqual(task.overruns, 0)
+        self.assertAlmostEqual(task.stats()["duration_mean_ms"], 300.0)
+
+    def test_late_run_does_not_shift_the_grid(self):
+        task = self.scheduler.add("tick", 1.0, self.work)
+        self.scheduler.run_due()
+        self.clock.advance(1.4) # the loop woke late
+        self.scheduler.run_due()
+        self.assertAlmostEqual(self.scheduler.time_to_next(), 0.6)
+        self.assertAlmostEqual(task.lateness_max, 0.4)
+        self.assertEqual(task.skipped, 0)
+
+    def test_overruns_and_skipped_runs_are_counted(self):
+        start = self.clock()
+        task = self.scheduler.add("slow", 1.0, self.work, 1.5) # longer than its period
+        self.scheduler.run_due()
+        self.assertEqual(task.overruns, 1)
+        self.assertEqual(task.skipped, 1) # the run due at start + 1 had already gone by
+        self.assertAlmostEqual(task.next_due, start + 2)
+
+        task.callback = self.work
+        task.args = (3.2,)
+        self.clock.advance(self.scheduler.time_to_next())
+        self.scheduler.run_due()
+        self.assertEqual(task.overruns, 2)
+        self.assertEqual(task.skipped, 4) # start + 3, 4 and 5 skipped, never run back to back
+        self.assertAlmostEqual(task.next_due, start + 6)
+        self.assertEqual(task.runs, 2)
+
+    def test_tasks_run_earliest_deadline_first(self):
+        order = []
+        self.scheduler.add("b", 1.0, order.append, "b", delay=0.2)
+        self.scheduler.add("a", 1.0, order.append, "a", delay=0.1)
+        self.clock.advance(0.5)
+        self.scheduler.run_due()
+        self.assertEqual(order, ["a", "b"])
+
+    def test_raising_task_keeps_running(self):
+        def fail():
+            raise RuntimeError("sensor unplugged")
+        task = self.scheduler.add("fail", 1.0, fail)
+        other = self.scheduler.add("other", 1.0, self.work)
+        for _ in range(3):
+            self.scheduler.run_due()
+            self.clock.advance(1.0)
+        self.assertEqual(task.errors, 3)
+        self.assertEqual(task.runs, 3)
+        self.assertEqual(other.runs, 3)
+
+    def test_run_until_stopped(self):
+        scheduler = PeriodicScheduler()
+        stop_event = threading.Event()
+        runs = []
+        def tick():
+            runs.append(time.monotonic())
+            if len(runs) == 3:
+                stop_event.set()
+        scheduler.add("tick", 0.01, tick)
+        scheduler.run(stop_event)
+        self.assertEqual(len(runs), 3)
+
+    def test_rejects_bad_period(self):
+        self.assertEqual(self.scheduler.time_to_next(), float("inf"))
+        with self.assertRaises(ValueError):
+            self.scheduler.add("bad", 0, self.work)
+
+
+class InfusionIntegrator_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.flow_rate = 600 # 10 μL/s
+        self.target = 0
+        self.running = True
+        self.reached = []
+        self.infusion = InfusionIntegrator(lambda: self.flow_rate, lambda: self.target, lambda: self.running,
+                                           rate_hz=50, on_target=self.reached.append, clock=self.clock)
+        self.infusion.reset()
+        self.infusion.step()
+
+    def test_integrates_across_a_rate_change(self):
+        self.clock.advance(1.0)
+        self.infusion.step()
+        self.assertAlmostEqual(self.infusion.volume, 10.0)
+
+        self.flow_rate = 1200 # picked up at the next step; the time before it ran at the old rate
+        self.clock.advance(0.5)
+        self.infusion.step()
+        self.assertAlmostEqual(self.infusion.volume, 15.0)
+        self.clock.advance(0.5)
+        self.assertAlmostEqual(self.infusion.volume, 25.0) # includes the time since the last step
+        self.infusion.step()
+        self.assertAlmostEqual(self.infusion.volume, 25.0)
+
+    def test_nothing_is_given_while_stopped(self):
+        self.running = False
+        self.infusion.step()
+        self.clock.advance(5.0)
+        self.infusion.step()
+        self.assertEqual(self.infusion.volume, 0.0)
+
+    def test_stops_on_the_predicted_target(self):
+        self.target = 25
+        self.assertAlmostEqual(self.infusion.step(), self.infusion.period)
+        self.clock.advance(2.49)
+        delay = self.infusion.step()
+        self.assertAlmostEqual(delay, 0.01) # sleeps until the crossing, not a whole period
+        self.assertEqual(self.reached, [])
+
+        self.clock.advance(delay)
+        self.infusion.step()
+        self.assertEqual(self.reached, [25.0])
+        self.assertAlmostEqual(self.infusion.stop_error_last, 0.0)
+        self.assertEqual(self.infusion.targets_reached, 1)
+
+        self.clock.advance(10.0) # still running: the volume stays on the target, reported once
+        self.infusion.step()
+        self.assertEqual(self.infusion.volume, 25.0)
+        self.assertEqual(self.reached, [25.0])
+
+    def test_late_step_is_clamped_to_the_target(self):
+        self.target = 25
+        self.infusion.step()
+        self.clock.advance(3.0)
+        self.assertEqual(self.infusion.volume, 25.0)
+        self.infusion.step()
+        self.assertEqual(self.reached, [25.0])
+
+    def test_target_raised_after_it_was_reached(self):
+        self.target = 10
+        self.infusion.step()
+        self.clock.advance(1.0)
+        self.infusion.step()
+        self.assertEqual(self.reached, [10.0])
+
+        self.clock.advance(1.0) # held at the target meanwhile
+        self.target = 20
+        self.infusion.step()
+        self.assertEqual(self.infusion.volume, 10.0)
+        self.clock.advance(1.0)
+        self.infusion.step()
+        self.assertEqual(self.reached, [10.0, 20.0])
+        self.assertEqual(self.infusion.targets_reached, 2)
+
+    def test_reset(self):
+        self.clock.advance(2.0)
+        self.infusion.step()
+        self.infusion.reset()
+        self.assertEqual(self.infusion.volume, 0.0)
+        self.clock.advance(1.0)
+        self.infusion.step()
+        self.assertAlmostEqual(self.infusion.volume, 10.0)
+        self.infusion.reset(5.0)
+        self.assertEqual(self.infusion.volume, 5.0)
+
+
+class FakeResponse:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+
+class FakeSession:
+    """Stands in for requests.Session; answers posts with the scripted status codes, then 200"""
+
+    def __init__(self, *status_codes):
+        self.status_codes = list(status_codes)
+        self.posts = []
+
+    def post(self, url, json=None, timeout=None):
+        self.posts.append(json)
+        status = self.status_codes.pop(0) if self.status_codes else 200
+        if status is None:
+            raise requests.ConnectionError("connection refused")
+        return FakeResponse(status)
+
+    def close(self):
+        pass
+
+
+class TelemetryUplink_tests(unittest.TestCase):
+
+    def send_all(self, session, count):
+        uplink = TelemetryUplink("http://server/data", max_batch=1, retry_delay=0.001, session=session)
+        for i in range(count):
+            uplink.submit({"hr": i})
+        uplink.start()
+        deadline = time.monotonic() + 2.0
+        while uplink.sent + uplink.dropped < count and time.monotonic() < deadline:
+            time.sleep(0.005)
+        uplink.stop()
+        return uplink
+
+    def test_transient_failures_are_retried(self):
+        session = FakeSession(None, 503, 200, 200)
+        uplink = self.send_all(session, 2)
+        self.assertEqual(session.posts, [{"hr": 0}, {"hr": 0}, {"hr": 0}, {"hr": 1}])
+        self.assertEqual((uplink.sent, uplink.dropped, uplink.failures), (2, 0, 2))
+
+    def test_rejected_batch_is_dropped(self):
+        session = FakeSession(400, 200)
+        uplink = self.send_all(session, 2)
+        self.assertEqual(session.posts, [{"hr": 0}, {"hr": 1}])
+        self.assertEqual((uplink.sent, uplink.dropped, uplink.failures), (1, 1, 1))
+
+    def test_unencodable_batch_is_dropped(self):
+        uplink = TelemetryUplink("http://server/data", session=requests.Session())
+        self.assertTrue(uplink._send([{"hr": float("nan")}])) # requests refuses NaN before connecting
+        self.assertEqual(uplink.dropped, 1)
+
+
+class FakeSocket:
+    """Stands in for a connected socketio.Client; keeps every emitted payload"""
+
+    connected = True
+    fail = False
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, payload):
+        if self.fail:
+            raise ConnectionError("socket closed")
+        self.events.append((event, payload))
+
+
+class FakeUplink:
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, payload):
+        self.submitted.append(payload)
+
+
+class VitalsBatchStreamer_tests(unittest.TestCase):
+
+    def test_consecutive_blocks_are_contiguous(self):
+        rate = 250
+        waveform = RingBuffer(1000, dtype=WAVEFORM_DTYPE)
+        sio = FakeSocket()
+        streamer = VitalsBatchStreamer(sio, waveform, rate_hz=rate)
+        start = time.monotonic()
+        for block in range(3):
+            samples = np.empty(10, dtype=WAVEFORM_DTYPE)
+            samples["t"] = start + (block * 10 + np.arange(10)) / rate
+            samples["value"] = np.arange(10)
+            waveform.extend(samples)
+            streamer._emit()
+            time.sleep(0.01) # released late; must not move the block
+
+        starts = [payload["t0"] + payload["waveform_start"] for _, payload in sio.events]
+        self.assertEqual(len(starts), 3)
+        np.testing.assert_allclose(np.diff(starts), 10 / rate, atol=1e-6)
+        self.assertEqual(streamer.samples, 30)
+
+    def test_failed_emit_keeps_snapshots(self):
+        sio = FakeSocket()
+        streamer = VitalsBatchStreamer(sio)
+        streamer.submit({"timestamp": 1.0, "hr": 70})
+        sio.fail = True
+        with self.assertRaises(ConnectionError):
+            streamer._emit()
+        streamer.submit({"timestamp": 2.0, "hr": 71})
+        sio.fail = False
+        streamer._emit()
+        self.assertEqual(len(sio.events), 1)
+        self.assertEqual(np.frombuffer(sio.events[0][1]["vitals"], "<f4").reshape(-1, 5)[:, 1].tolist(), [70, 71])
+        self.assertEqual((streamer.errors, len(streamer.snapshots)), (1, 0))
+
+    def test_unsent_snapshots_go_to_fallback(self):
+        sio, uplink = FakeSocket(), FakeUplink()
+        streamer = VitalsBatchStreamer(sio, fallback=uplink)
+        streamer.submit({"timestamp": 1.0, "hr": 70})
+        sio.fail = True
+        with self.assertRaises(ConnectionError):
+            streamer._emit()
+        streamer.submit({"timestamp": 2.0, "hr": 71})
+        sio.connected = False
+        streamer._emit()
+        streamer.submit({"timestamp": 3.0, "hr": 72})
+        streamer.stop()
+        self.assertEqual([snapshot["hr"] for snapshot in uplink.submitted], [70, 71, 72])
+        self.assertEqual(len(streamer.snapshots), 0)
+
+
+LEGACY_BLOCKS = """2024-05-01 14:03:07.000001
+HR: 72
+O2: 98
+BP: (120, 80)
+
+2024-05-01 14:03:17.000001
+HR: None
+O2: 97
+BP: None
+
+"""
+
+
+class ProcedureRecords_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.started = datetime.datetime(2024, 5, 1, 14, 3, 7)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def write_lines(self, name, count, start=0, mode="w"):
+        with open(self.path(name), mode) as file:
+            for i in range(start, start + count):
+                file.write(format_record(self.started + datetime.timedelta(seconds=i),
+                                         {"hr": 60 + i % 40, "spo2": 98, "bp": (120, 80)}))
+        return self.path(name)
+
+    def test_record_line_round_trip(self):
+        snapshot = {"hr": 72, "spo2": None, "bp": (120, 80)}
+        line = format_record(self.started, snapshot)
+        self.assertEqual(line, "2024-05-01T14:03:07 hr=72 spo2=None bp=120/80\n")
+        self.assertEqual(parse_record_line(line), (self.started, snapshot))
+        self.assertIsNone(parse_record_line("HR: 72"))
+
+    def test_legacy_blocks(self):
+        path = self.path("output.txt")
+        with open(path, "w") as file:
+            file.write(LEGACY_BLOCKS)
+        with open(path, "rb") as file:
+            records = list(iter_records(file))
+        self.assertEqual([record[2] for record in records],
+                         [{"hr": 72, "spo2": 98, "bp": (120, 80)}, {"hr": None, "spo2": 97, "bp": None}])
+        self.assertEqual(records[1][1], datetime.datetime(2024, 5, 1, 14, 3, 17, 1))
+        with open(path, "rb") as file:
+            self.assertEqual(len(list(iter_records(file, records[1][0]))), 1) # resumes at a block's offset
+
+    def test_writer_thread(self):
+        writer = ProcedureRecordWriter(self.directory.name, flush_interval=0.01, fsync="never").start()
+        writer.start_procedure(self.started)
+        for i in range(3):
+            writer.write({"hr": 70 + i, "spo2": 98, "bp": None}, self.started + datetime.timedelta(seconds=i))
+        writer.end_procedure()
+        writer.stop()
+        self.assertFalse(writer.running)
+        with open(self.path("procedure-20240501-140307.txt"), "rb") as file:
+            self.assertEqual([snapshot["hr"] for _, _, snapshot in iter_records(file)], [70, 71, 72])
+        self.assertEqual(writer.stats()["records"], 3)
+
+    def test_rotation(self):
+        writer = ProcedureRecordWriter(self.directory.name, max_bytes=200, fsync="never")
+        writer.start_procedure(self.started)
+        for i in range(10):
+            writer.write({"hr": 70 + i, "spo2": 98, "bp": (120, 80)}, self.started + datetime.timedelta(seconds=i))
+        writer._drain()
+        writer.end_procedure()
+        writer._drain()
+
+        names = ["procedure-20240501-140307.txt", "procedure-20240501-140307.2.txt"]
+        self.assertEqual(sorted(os.listdir(self.directory.name)), sorted(names))
+        hr = []
+        for name in names:
+            self.assertLess(os.path.getsize(self.path(name)), 200 + 50) # rotated within one line of max_bytes
+            with open(self.path(name), "rb") as file:
+                hr.append([snapshot["hr"] for _, _, snapshot in iter_records(file)])
+        self.assertEqual(hr, [list(range(70, 75)), list(range(75, 80))])
+        self.assertEqual(writer.files, 2)
+
+    def test_fsync_policies(self):
+        expected = {"always": 3, "interval": 2, "close": 1, "never": 0} # two batches, then the procedure ends
+        for policy, fsyncs in expected.items():
+            directory = os.path.join(self.directory.name, policy)
+            writer = ProcedureRecordWriter(directory, fsync=policy, fsync_interval=3600)
+            writer.start_procedure(self.started)
+            for i in range(2):
+                writer.write({"hr": 70, "spo2": 98, "bp": None}, self.started + datetime.timedelta(seconds=i))
+                writer._drain()
+            writer.end_procedure()
+            writer._drain()
+            self.assertEqual((policy, writer.batches, writer.fsyncs), (policy, 2, fsyncs))
+        with self.assertRaises(ValueError):
+            ProcedureRecordWriter(self.directory.name, fsync="sometimes")
+
+    def test_reader_ranges_and_summary(self):
+        path = self.write_lines("records.txt", 300)
+        reader = ProcedureRecordReader(path, stride=64)
+        self.assertEqual(len(reader.times), 5) # records 0, 64, 128, 192 and 256
+        since = self.started + datetime.timedelta(seconds=100)
+        records = list(reader.records(since, since + datetime.timedelta(seconds=10)))
+        self.assertEqual([timestamp for timestamp, _ in records],
+                         [since + datetime.timedelta(seconds=i) for i in range(10)])
+
+        summary = reader.summary(since, since + datetime.timedelta(seconds=10))
+        self.assertEqual(summary["records"], 10)
+        self.assertEqual(summary["hr"], {"min": 80, "max": 89, "mean": 84.5, "count": 10})
+        self.assertEqual(summary["bp_sys"]["mean"], 120)
+        self.assertEqual(reader.summary()["records"], 300)
+
+    def test_reader_summarizes_legacy_blocks(self):
+        path = self.path("output.txt")
+        with open(path, "w") as file:
+            file.write(LEGACY_BLOCKS)
+        summary = ProcedureRecordReader(path).summary()
+        self.assertEqual(summary["records"], 2)
+        self.assertEqual(summary["hr"]["count"], 1)
+        self.assertEqual(summary["spo2"]["mean"], 97.5)
+
+    def test_index_is_reused_and_extended(self):
+        path = self.write_lines("records.txt", 300)
+        ProcedureRecordReader(path, stride=64)
+        self.assertTrue(os.path.exists(path + ".idx"))
+
+        reader = ProcedureRecordReader(path, stride=64) # loads the saved index instead of scanning
+        self.assertEqual(reader.refresh(), 0)
+        self.assertEqual(len(reader.times), 5)
+
+        self.write_lines("records.txt", 100, start=300, mode="a") # the file grows
+        self.assertEqual(reader.refresh(), 2) # records 320 and 384; only the new part is read
+        self.assertEqual(reader.summary()["records"], 400)
+        last = self.started + datetime.timedelta(seconds=399)
+        self.assertEqual([timestamp for timestamp, _ in reader.records(last)], [last])
+
+        self.write_lines("records.txt", 10) # replaced by a shorter file: the index is rebuilt
+        reader = ProcedureRecordReader(path, stride=64)
+        self.assertEqual(len(reader.times), 1)
+        self.assertEqual(reader.summary()["records"], 10)
+
+
+class ChunkRecords_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.started = datetime.datetime(2024, 5, 1, 14, 3, 7)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_file(self, *chunks):
+        path = os.path.join(self.directory.name, "test.nrc")
+        with open(path, "wb") as file:
+            file.write(MAGIC)
+            for data, _ in chunks:
+                file.write(data)
+        return path
+
+    def test_round_trip(self):
+        t0 = 1714572187.25
+        rows = [(t0 + i * 1.001, 70 + i, 98, 120, 80) for i in range(10)]
+        rows[3] = (rows[3][0], MISSING, 97, MISSING, MISSING)
+        values = np.round(1000 * np.sin(np.arange(500) / 10.0))
+        path = self.write_file(encode_vitals_chunk(rows), encode_waveform_chunk(t0, 250, values))
+
+        with ChunkRecordReader(path) as reader:
+            columns = reader.vitals()
+            np.testing.assert_allclose(columns["t"], [row[0] for row in rows], atol=1e-3)
+            self.assertEqual(columns["hr"].tolist(), [row[1] for row in rows])
+            records = list(reader.iter_records())
+            self.assertEqual(records[3][1], {"hr": None, "spo2": 97, "bp": None})
+            self.assertEqual(records[0][1], {"hr": 70, "spo2": 98, "bp": (120, 80)})
+
+            t, samples = reader.waveform()
+            self.assertEqual(samples.tolist(), values.astype(int).tolist())
+            np.testing.assert_allclose(t, t0 + np.arange(500) / 250)
+            self.assertEqual(len(reader.vitals(since=t0 + 2, until=t0 + 5)["t"]), 3)
+
+    def test_torn_final_chunk_is_ignored(self):
+        rows = [(1000.0 + i, 72, 98, 120, 80) for i in range(5)]
+        whole = encode_vitals_chunk(rows)
+        for torn in (whole[0][:10], whole[0][:-3]): # inside the header, inside the payload
+            path = self.write_file(whole, (torn, 0))
+            with ChunkRecordReader(path) as reader:
+                self.assertEqual(len(reader.chunks), 1)
+                self.assertEqual(len(list(reader.iter_records())), 5)
+
+    def test_rotation(self):
+        writer = ChunkRecordWriter(self.directory.name, max_bytes=100, fsync="never", chunk_seconds=5)
+        writer.start_procedure(self.started)
+        t0 = 1714572187.0
+        for i in range(30):
+            writer.write({"hr": 60 + i, "spo2": 98, "bp": (120, 80)}, t0 + i)
+            writer._drain()
+        writer.end_procedure()
+        writer._drain()
+
+        names = ["procedure-20240501-140307.nrc"] + [f"procedure-20240501-140307.{part}.nrc"
+                                                     for part in range(2, writer.files + 1)]
+        self.assertGreater(writer.files, 1)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), sorted(names))
+        hr = []
+        for name in names:
+            with ChunkRecordReader(os.path.join(self.directory.name, name)) as reader:
+                hr += reader.vitals()["hr"].tolist()
+        self.assertEqual(hr, list(range(60, 90)))
+        self.assertEqual(writer.records, 30)
+
+    def test_waveform_chunks_are_contiguous(self):
+        rate = 250
+        waveform = RingBuffer(1000, dtype=WAVEFORM_DTYPE)
+        writer = ChunkRecordWriter(self.directory.name, fsync="never", chunk_seconds=0.1, waveform=waveform, rate_hz=rate)
+        writer.start_procedure(self.started)
+        writer._drain()
+        start = time.monotonic()
+        for block in range(10):
+            samples = np.empty(20, dtype=WAVEFORM_DTYPE)
+            samples["t"] = start + (block * 20 + np.arange(20)) / rate
+            samples["value"] = block * 20 + np.arange(20)
+            waveform.extend(samples)
+            writer._drain()
+            time.sleep(0.005) # drained late; must not move the samples
+        writer.end_procedure()
+        writer._drain()
+
+        with ChunkRecordReader(writer.path) as reader:
+            self.assertGreater(sum(chunk[0] == b"WAVE" for chunk in reader.chunks), 1)
+            t, values = reader.waveform()
+        self.assertEqual(values.tolist(), list(range(200)))
+        np.testing.assert_allclose(np.diff(t), 1 / rate, atol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
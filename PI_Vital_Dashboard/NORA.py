@@ -1,17 +1,40 @@
 import datetime
-import tkinter as tk
-from tkinter import ttk
-import random as rand
-import matplotlib
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-import matplotlib.pyplot as plt
-from PIL import Image, ImageTk
+import sys
+import os
+
+# --headless runs acquisition, servo control, records and the server link without the GUI;
+# the GUI modules are then never imported, which saves their startup time and memory
+HEADLESS = "--headless" in sys.argv[1:] or os.environ.get("NORA_HEADLESS") == "1"
+if not HEADLESS:
+    import tkinter as tk
+    from tkinter import ttk
+    import matplotlib
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from matplotlib.figure import Figure
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Polygon
+    from PIL import Image, ImageTk
+import numpy as np
+from collections import deque
 import socketio
 import requests
 import time
 import threading
 import platform
+import re
+import resource
+import signal
+import subprocess
+from urllib.parse import quote
+from sensor_sources import WAVEFORM_DTYPE, create_sensor_source
+from PulseOX.ring_buffer import RingBuffer
+from PulseOX.display import minmax_decimate
+from uplink import TelemetryUplink, VitalsBatchStreamer
+from procedure_records import ProcedureRecordWriter
+from record_chunks import ChunkRecordWriter
+from scheduler import PeriodicScheduler
+from infusion import InfusionIntegrator
+from servo_control import ServoController
 
 
 is_raspberry_pi = platform.system() == "Linux" and platform.machine().startswith(("arm", "aarch"))
@@ -96,6 +119,7 @@ MAX_DESIRED_VOL = 50
 # Values for servo control with gpiozero
 SERVO_MIN_VALUE = -1  # gpiozero servo minimum position value
 SERVO_MAX_VALUE = 1   # gpiozero servo maximum position value
+SYRINGE_SIZE = 50000  # μL (50 ml) pushed over the full servo range
 
 PULSEOX_PIN_LED = 17
 
@@ -103,20 +127,49 @@ PULSEOX_SPI_MOSI = 10
 PULSEOX_SPI_MISO = 9
 PULSEOX_SPI_SCLK = 11
 PULSEOX_SPI_CE0 = 8   # Data channel select pin
+PULSEOX_RED_CHANNEL = 0 # MCP3008 channel carrying the RED photodiode signal
+PULSEOX_IR_CHANNEL = 1  # MCP3008 channel carrying the IR photodiode signal
+PULSEOX_SAMPLE_RATE = 250 # RED/IR pairs per second
+
+# Where vitals come from: auto (MCP3008 on a Pi, simulated elsewhere), simulated, mcp3008, serial,
+# replay (a ProcedureRecords file) or adc_replay (a raw .adc recording run through the pulse ox DSP)
+SENSOR_SOURCE = os.environ.get("NORA_SENSOR_SOURCE", "auto")
+SERIAL_PORT = os.environ.get("NORA_SERIAL_PORT", "/dev/ttyACM0")
+REPLAY_FILE = os.environ.get("NORA_REPLAY_FILE") # procedure record file (.nrc or .txt) for the replay source
+RAW_REPLAY_FILE = os.environ.get("NORA_RAW_REPLAY_FILE") # raw .adc recording for the adc_replay source
+RAW_RECORD_FILE = os.environ.get("NORA_RAW_RECORD_FILE") # if set, raw MCP3008 samples are recorded here (or a numbered name)
+RECORD_DIR = os.environ.get("NORA_RECORD_DIR", "ProcedureRecords") # one vitals record file per procedure
+RECORD_FSYNC = os.environ.get("NORA_RECORD_FSYNC", "interval") # always, interval, close or never
+RECORD_MAX_BYTES = int(os.environ.get("NORA_RECORD_MAX_BYTES", str(10 * 1024 * 1024))) # rotate to a new file past this
+# chunks: every tick in a compressed .nrc file; text: one line per LOG_INTERVAL; both
+RECORD_FORMAT = os.environ.get("NORA_RECORD_FORMAT", "chunks")
+RECORD_WAVEFORM = os.environ.get("NORA_RECORD_WAVEFORM", "0") == "1" # also keep the sensor waveform in the .nrc file
 
 
 UPDATE_INTERVAL = 1000 #in ms
+DISPLAY_INTERVAL = 40 #in ms; graph refresh period, independent of UPDATE_INTERVAL and of the sensor sample rate
+VOLUME_INTERVAL = 1000 #in ms; how often the volume given is displayed and shared
+INFUSION_RATE_HZ = float(os.environ.get("NORA_INFUSION_RATE_HZ", "50")) # volume integration steps per second, off the Tk thread
+SERVO_POLL_INTERVAL = 0.1 #in s; longest the servo thread sleeps between steps, so flow changes are picked up
 LOG_INTERVAL = 10000 # how often logs of vitals recorded
 time_since_log = LOG_INTERVAL # set to log interval so it prints first time
 vital_labels = {} #dict to store references to each vital's value label; we will use these to update the sensor values
-MAX_POINTS = 30 #number of points to store on the graph; 1 point for every tick/update interval
-
-#parallel arrays for graphing purposes.
-ecg_data = [] #data buffer to store ekg values
-time_axis = [] #data buffer for coordinates on x (time) axis
-t_step = 0 #counter to store update tick we are on (for x axis labels)
+MAX_POINTS = 2500 #number of points stored for the graph; 10 seconds of waveform at 250 Hz
+ECG_WINDOW_SECONDS = 10 #how much of the waveform is shown on the graph
+HR_TREND_WINDOW_SECONDS = 30 #graph window for sources without a waveform, graphed as 1 HR point per tick
+
+#circular buffer of (time, value) pairs for graphing; preallocated, so appending never allocates
+ecg_buffer = RingBuffer(MAX_POINTS, dtype=WAVEFORM_DTYPE)
+ecg_cursor = 0 #position in sensor_source.waveform already copied into ecg_buffer
+ecg_drawn_count = -1 #ecg_buffer.count when the graph was last drawn
 ecg_plot = None 
 ecg_canvas = None
+ecg_line = None # persistent line artist updated with set_data
+ecg_fill = None # persistent polygon under the line
+ecg_background = None # cached pixels of the static axes, restored before each blit
+ECG_FRAME_STATS_WINDOW = 100 # number of recent frame times kept
+ecg_frame_times = deque(maxlen=ECG_FRAME_STATS_WINDOW) # seconds spent in each blitted draw_graphs() call
+ecg_full_redraws = 0 # count of full canvas redraws (first frame, y rescale, resize)
 
 flow_rate = 0 #Default, initial flow rate setting in μL/min (whole number)
 flow_rate_changed_locally = False  # Flag to track local changes
@@ -126,9 +179,20 @@ socket_connected = False  # Flag to track socket connection status
 reconnect_happening = False # flag to check if a reconnect is happening
 
 procedure_running = False  # Flag to track if procedure is running
-vol_given = 0.0 # Used to track the total volume that should have been dispensed
+vol_given = 0.0 # Used to track the total volume that should have been dispensed; copied from infusion
 actual_vol_given = 0 # Used to track the amount dispensed based on servo position
 
+scheduler = PeriodicScheduler() # runs the periodic loops below on the Tk thread, on the monotonic clock
+infusion = None # InfusionIntegrator integrating flow_rate into the volume given on its own thread
+servo_controller = None # ServoController moving the servo to follow the volume given on its own thread
+sensor_source = None # SensorSource publishing the latest vitals from its own thread
+sensor_error = None # why the configured sensor source could not be started; vitals then show "--"
+uplink = None # TelemetryUplink posting vitals to the server from its own thread
+streamer = None # VitalsBatchStreamer sending vitals and the waveform over the socket while it is connected
+record_writer = None # ProcedureRecordWriter logging vitals as text from its own thread
+chunk_writer = None # ChunkRecordWriter recording every tick from its own thread
+recording_procedure = False # whether the record writers have a procedure open
+
 
 
 #Attempt to get Device's IP via socket trick; defaults to localhost
@@ -147,7 +211,9 @@ def get_local_ip():
 SERVER_IP = get_local_ip()
 SERVER_PORT = 5000
 SERVER_URL = f"http://{SERVER_IP}:{SERVER_PORT}"
-SOCKET_URL = f"http://{SERVER_IP}:{SERVER_PORT}"
+# Identifies this unit to a server shared by several NORA units; dashboards open /nora?device=<id>
+DEVICE_ID = os.environ.get("NORA_DEVICE_ID", "default")
+SOCKET_URL = f"http://{SERVER_IP}:{SERVER_PORT}?device_id={quote(DEVICE_ID)}"
 
 # Initialize Socket.IO client
 sio = socketio.Client()
@@ -195,9 +261,7 @@ def on_flow_rate_update(data):
     if new_flow_rate != flow_rate:
         flow_rate = new_flow_rate
         print(f"Flow rate updated from server: {flow_rate}")
-        
-        # Update hardware
-        # update_flow(flow_rate)
+        flow_rate_changed()
         
         # Update display (need to use Tkinter's after method to safely update UI from another thread)
         if flow_value_label and 'root' in globals():
@@ -245,6 +309,7 @@ def on_procedure_state_update(data):
         # If starting procedure, reset volume given
         if procedure_running:
             vol_given = 0.0
+            reset_delivery()
             if 'actual_vol_given' in globals():
                 actual_vol_given = 0.0
         
@@ -337,124 +402,119 @@ def create_vital_frame(parent, row, col, label_text, value_key, label_dict, colo
 
 def send_data(sensor_info):
     """
-    POST to /data with a timestamp and the current vitals
+    Queue a timestamp and the current vitals for the server: over the socket
+    (with the waveform) while it is connected, otherwise as a POST to /data
     """
-    bp_sys, bp_dia = sensor_info["bp"]  # sys, dia
+    bp_sys, bp_dia = sensor_info["bp"] if sensor_info["bp"] is not None else (None, None)  # sys, dia
     
     payload = {
+        "device_id": DEVICE_ID,
         "timestamp": time.time(),
         "hr": sensor_info["hr"],
         "spo2": sensor_info["spo2"],
         "bp_sys": bp_sys,
         "bp_dia": bp_dia,
     }
-    try:
-        requests.post(f"{SERVER_URL}/data", json=payload, timeout=2)
-    except Exception as e:
-        print("Error sending data to server:", e)
+    # Neither call blocks; a slow server only grows a queue on a background thread
+    if socket_connected and streamer is not None:
+        streamer.submit(payload)
+    elif uplink is not None:
+        uplink.submit(payload)
 
 
-def update_vitals(root):
+def update_vitals():
     """
-    Called once every UPDATE_INTERVAL to refresh displayed vital values
+    Called by the scheduler once every UPDATE_INTERVAL to refresh displayed vital values
     """
-    global t_step, time_since_log
-    
-    #TODO: retrieve sensor information and pass it into set vitals here; return it in format below
-    #sensor_info = getSensorInfo()
-    sensor_info = {
-        "hr": rand.randint(70,80), 
-        "spo2": rand.randint(96,100), 
-        "bp": (rand.randint(70,80),rand.randint(90,100))
-    }
+    global time_since_log, recording_procedure
+    
+    # Newest snapshot published by the sensor source's own thread; never blocks
+    sensor_info = sensor_source.latest() if sensor_source is not None else None
+    if sensor_info is None:
+        return
 
-    set_vitals(sensor_info) 
+    if not HEADLESS:
+        set_vitals(sensor_info)
 
+    writers = [writer for writer in (record_writer, chunk_writer) if writer is not None]
+    if writers and procedure_running != recording_procedure:
+        # Every procedure gets its own record files, opened by the writer threads
+        recording_procedure = procedure_running
+        started = datetime.datetime.now()
+        for writer in writers:
+            if procedure_running:
+                writer.start_procedure(started)
+            else:
+                writer.end_procedure()
+        time_since_log = LOG_INTERVAL # log the first snapshot right away
     if procedure_running:
+        if chunk_writer is not None:
+            chunk_writer.write(sensor_info) # every tick
         if time_since_log >= LOG_INTERVAL:
             output_to_file(sensor_info)
             time_since_log = 0
         else:
             time_since_log += UPDATE_INTERVAL
-    # Append data for graphing; update rolling window by chopping off old data.
-    ecg_data.append(sensor_info["hr"])
-    time_axis.append(t_step)
-    t_step = t_step + 1
-    if len(ecg_data) > MAX_POINTS:
-        ecg_data.pop(0)
-        time_axis.pop(0)
+    # Sources without a waveform are graphed as an HR trend; the ring buffer overwrites the oldest point once full
+    if source_waveform() is None:
+        ecg_buffer.append((time.monotonic(), sensor_info["hr"] if sensor_info["hr"] is not None else np.nan))
 
-    draw_graphs()
-    
-    if socket_connected:
-        send_data(sensor_info) # send data to the server
-  
-    root.after(UPDATE_INTERVAL, update_vitals, root) #Update with sensor data every 1000ms
+    send_data(sensor_info) # send data to the server
 
-def output_to_file(sensor_info):
-    file = open('ProcedureRecords/output.txt', 'a')
-    time = datetime.datetime.now()
-    file.write(str(time) + '\n')
-    file.write('HR: ' + str(sensor_info["hr"]) + '\n')
-    file.write('O2: ' + str(sensor_info["spo2"]) + '\n')
-    file.write('BP: ' + str(sensor_info["bp"]) + '\n')
-    file.write('\n')
-
-def update_flow():
+def source_waveform():
+    """The sensor source's waveform RingBuffer, or None if it only reports numbers"""
+    waveform = getattr(sensor_source, "waveform", None)
+    return waveform if isinstance(waveform, RingBuffer) else None
+
+def update_display():
     """
-    Updates the hardware with the current flow rate
-    
-    Maps the flow rate (0-30) to servo position (-1 to 1 in gpiozero)
+    Called by the scheduler once every DISPLAY_INTERVAL to copy new waveform
+    samples into the graph buffer and redraw the graph if anything changed
     """
-    global servo
-    global actual_vol_given
-    global vol_given
-    global SERVO_MAX_VALUE
-    # servo_position = SERVO_MAX_VALUE
-    step_size = 0.01 # 2000 total steps
-    syringe_size = 50000 # 50000 microliters = 50 ml
-    vol_per_step = syringe_size * step_size / 2 # Divide by 2 because range is -1 to 1
+    global ecg_cursor, ecg_drawn_count
 
+    waveform = source_waveform()
+    if waveform is not None:
+        samples, ecg_cursor, dropped = waveform.read_since(ecg_cursor)
+        ecg_buffer.extend(samples)
 
-    # Map flow rate from (0-30) to servo position range (-1 to 1)
-    if is_raspberry_pi and servo is not None:
-        try:
-            # Map from flow_rate (0-30) to servo position (-1 to 1)
-            # At 0 flow rate, position is -1 (min position)
-            # At MAX_FLOW_RATE, position is 1 (max position)
-            # position = SERVO_MIN_VALUE + (flow_-rate_value / MAX_FLOW_RATE) * (SERVO_MAX_VALUE - SERVO_MIN_VALUE)
-            
-            if procedure_running:   
-                if actual_vol_given < vol_given:
-                    servo.value = servo.value - step_size
-                    actual_vol_given = actual_vol_given + vol_per_step
-            else:
-                # Debug log for when procedure is stopped
-                print(f"DEBUG: Update flow - procedure stopped, servo idle")
+    if ecg_buffer.count != ecg_drawn_count:
+        ecg_drawn_count = ecg_buffer.count
+        draw_graphs()
 
-            root.after(1000, update_flow) 
+def output_to_file(sensor_info):
+    """Queue a one-line vitals record for the current procedure's file; the disk write happens on the writer thread"""
+    if record_writer is not None:
+        record_writer.write(sensor_info)
 
-        except Exception as e:
-            print(f"Error controlling servo: {e}")
-            return False
-    else:
-        # Not running on Pi or servo not initialized
-        print(f"Servo flow rate set to {flow_rate} μL/min (simulation mode)")
-        root.after(1000, update_flow)
-    
-    return True
+def flow_rate_changed():
+    """Have the infusion and servo threads pick up a new flow rate now rather than at their next step"""
+    if infusion is not None:
+        infusion.wake()
+    if servo_controller is not None:
+        servo_controller.wake()
+
+def reset_delivery():
+    """Start counting the volume given, and the servo steps pushing it, from zero"""
+    if infusion is not None:
+        infusion.reset()
+    if servo_controller is not None:
+        servo_controller.reset()
 
 
 
 def update_volume_given():
     """
-    Updates the anesthesia given based on flow rate and time.
+    Shows and shares the anesthesia given, as integrated by the infusion thread
     """
     global vol_given
-    global procedure_running
 
-    if procedure_running:   
-       vol_given = vol_given + (flow_rate / 60.0)
+    global actual_vol_given
+
+    if infusion is not None:
+        vol_given = infusion.volume
+    if servo_controller is not None:
+        actual_vol_given = servo_controller.delivered
 
     # Update UI elements
     if 'progress_bar' in globals() and 'vol_given_label' in globals():
@@ -472,62 +532,195 @@ def update_volume_given():
     except Exception as e:
         print(f"Error sending volume given update: {e}")
 
-    # Check if we've reached target volume
-    if procedure_running and vol_given >= desired_vol and desired_vol > 0:
-        print("DEBUG: Target volume reached! Stopping procedure...")
-        procedure_running = False
-        
-        # Update UI
-        if 'procedure_status_label' in globals() and 'start_stop_btn' in globals():
-            procedure_status_label.config(text="Status: Stopped", fg=COLORS["danger"])
-            start_stop_btn.config(text="Start Procedure", bg=COLORS["primary"])
-        
-        # Send procedure stopped state to server
-        try:
-            if sio.connected:
-                print("DEBUG: Sending procedure stopped state to server...")
-                sio.emit("procedure_state", {"running": False})
-        except Exception as e:
-            print(f"Error sending procedure state update: {e}")
+def on_target_volume(volume):
+    """
+    Called on the infusion thread at the moment the target volume is
+    reached: stop delivering right away, then finish up on the Tk thread
+    """
+    global procedure_running, vol_given
+    vol_given = volume
+    procedure_running = False
+    print("DEBUG: Target volume reached! Stopping procedure...")
+    if 'root' in globals():
+        root.after(0, finish_procedure)
+    else:
+        finish_procedure() # headless: nothing to hand over to
+
+def finish_procedure():
+    """Show and share that the procedure stopped at its target volume"""
+    update_volume_given()
+
+    # Update UI
+    if 'procedure_status_label' in globals() and 'start_stop_btn' in globals():
+        procedure_status_label.config(text="Status: Stopped", fg=COLORS["danger"])
+        start_stop_btn.config(text="Start Procedure", bg=COLORS["primary"])
 
-    root.after(1000, update_volume_given)
+    # Send procedure stopped state to server
+    try:
+        if sio.connected:
+            print("DEBUG: Sending procedure stopped state to server...")
+            sio.emit("procedure_state", {"running": False})
+    except Exception as e:
+        print(f"Error sending procedure state update: {e}")
 
 def set_vitals(vital_info):
     """Update vital sign displays with new values"""
-    vital_labels["hr"].config(text=f"{vital_info['hr']} bpm", fg=COLORS["danger"])
-    vital_labels["spo2"].config(text=f"{vital_info['spo2']}%", fg=COLORS["info"])
-    vital_labels["bp"].config(text=f"{vital_info['bp'][0]}/{vital_info['bp'][1]} mmHg", fg=COLORS["primary"])
-
-def draw_graphs():
+    hr_text = f"{vital_info['hr']} bpm" if vital_info["hr"] is not None else "--"
+    vital_labels["hr"].config(text=hr_text, fg=COLORS["danger"])
+    spo2_text = f"{vital_info['spo2']}%" if vital_info["spo2"] is not None else "--"
+    vital_labels["spo2"].config(text=spo2_text, fg=COLORS["info"])
+    bp_text = f"{vital_info['bp'][0]}/{vital_info['bp'][1]} mmHg" if vital_info["bp"] is not None else "--"
+    vital_labels["bp"].config(text=bp_text, fg=COLORS["primary"])
+
+def init_ecg_plot():
     """
-    Clears & redraws ECG graph
+    Style the ECG axes and create the line and fill artists once
+
+    Both artists are animated, so full canvas draws only render the static
+    axes; draw_graphs() then blits the data on top of a cached background.
+    The x axis is time relative to the newest point so it never scrolls.
     """
-    global ecg_plot
-    global ecg_canvas
-    global ecg_data
-    global time_axis 
+    global ecg_line, ecg_fill, ecg_background
 
     plt_bg_color = COLORS["bg_card"]
     plt_text_color = COLORS["text_primary"]
-    ecg_plot.clear()
     ecg_plot.set_facecolor(plt_bg_color)
     ecg_plot.set_title("ECG", color=plt_text_color, fontsize=12, fontweight='bold')
     ecg_plot.set_xlabel("Time (s)", color=plt_text_color, fontsize=10)
-    ecg_plot.plot(time_axis, ecg_data, color=COLORS["danger"], marker="o", markersize=4, linewidth=2, alpha=0.8)[0]
-    ecg_plot.fill_between(time_axis, ecg_data, color=COLORS["danger"], alpha=0.1)
     ecg_plot.grid(True, linestyle='--', linewidth=0.5, color="#E5E5E5")
-    
+
     #style graph edges
     for spine in ecg_plot.spines.values():
         spine.set_color("#E5E5E5") #Make spines a nice dark
         spine.set_linewidth(0.5)
-    
+
     #style graph interval lines
     ecg_plot.tick_params(axis='x', colors=plt_text_color, direction='out', length=5)
     ecg_plot.tick_params(axis='y', colors=plt_text_color, direction='out', length=5)
-    
+
+    marker = "o" if source_waveform() is None else "None" # dots only for the 1 point per tick HR trend
+    ecg_line = ecg_plot.plot([], [], color=COLORS["danger"], marker=marker, markersize=4, linewidth=2,
+                             alpha=0.8, animated=True)[0]
+    ecg_fill = Polygon(np.zeros((0, 2)), closed=True, facecolor=COLORS["danger"], edgecolor="none",
+                       alpha=0.1, animated=True)
+    ecg_plot.add_patch(ecg_fill)
+    ecg_plot.set_xlim(-ecg_window_seconds(), 0)
+    ecg_plot.set_ylim(0, 1)
+
     ecg_canvas.figure.tight_layout()
-    ecg_canvas.draw()
+    ecg_background = None
+    ecg_canvas.mpl_connect("draw_event", on_ecg_draw)
+
+def on_ecg_draw(event):
+    """Re-cache the static background after any full redraw (first draw, rescale, window resize)"""
+    global ecg_background
+    ecg_background = ecg_canvas.copy_from_bbox(ecg_plot.bbox)
+    blit_ecg()
+
+def blit_ecg():
+    """Paint the cached background and the data artists into the axes area only"""
+    if ecg_background is None:
+        return
+    ecg_canvas.restore_region(ecg_background)
+    ecg_plot.draw_artist(ecg_fill)
+    ecg_plot.draw_artist(ecg_line)
+    ecg_canvas.blit(ecg_plot.bbox)
+
+def ecg_window_seconds():
+    """Seconds shown on the graph: a waveform window, or a longer HR trend window"""
+    return ECG_WINDOW_SECONDS if source_waveform() is not None else HR_TREND_WINDOW_SECONDS
+
+def ecg_window(seconds):
+    """
+    Returns:
+        Zero-copy view of the buffered ECG points from the last `seconds`, oldest first
+    """
+    points = ecg_buffer.view()
+    if len(points) == 0:
+        return points
+    start = np.searchsorted(points["t"], points["t"][-1] - seconds, side="left")
+    return points[start:]
+
+def ecg_needs_rescale(y, low, high):
+    """True if the data left the y range or only uses a small part of it"""
+    finite = y[np.isfinite(y)]
+    if len(finite) == 0:
+        return False
+    y_min, y_max = finite.min(), finite.max()
+    return y_min < low or y_max > high or (y_max - y_min) < 0.25 * (high - low)
+
+def draw_graphs():
+    """
+    Updates the ECG graph incrementally: new data goes into the persistent
+    line and fill, and only the axes area is repainted via blitting. A full
+    redraw happens only when the y range or the time window has to change.
+
+    Waveforms are reduced to a min/max envelope per pixel column first, so
+    the cost depends on the plot width rather than the sample rate.
+    """
+    global ecg_full_redraws
+
+    start = time.perf_counter()
+    seconds = ecg_window_seconds()
+    points = ecg_window(seconds)
+    y = points["value"]
+    x = points["t"] - points["t"][-1] if len(points) else points["t"] # seconds before the newest point
+    x, y = minmax_decimate(x, y, ecg_plot.bbox.width, -seconds, 0)
+
+    window_changed = ecg_plot.get_xlim()[0] != -seconds
+    if window_changed:
+        ecg_plot.set_xlim(-seconds, 0)
+        ecg_line.set_marker("o" if seconds == HR_TREND_WINDOW_SECONDS else "None")
+
+    ecg_line.set_data(x, y)
+    finite = np.isfinite(y)
+    if finite.any():
+        fx, fy = x[finite], y[finite]
+        ecg_fill.set_xy(np.column_stack((np.concatenate(([fx[0]], fx, [fx[-1]])),
+                                         np.concatenate(([0], fy, [0])))))
+
+    low, high = ecg_plot.get_ylim()
+    if ecg_background is None or window_changed or ecg_needs_rescale(y, low, high):
+        if finite.any():
+            y_min, y_max = y[finite].min(), y[finite].max()
+            pad = max(5.0, 0.2 * (y_max - y_min))
+            ecg_plot.set_ylim(y_min - pad, y_max + pad)
+        ecg_full_redraws += 1
+        ecg_canvas.draw() # draw_event re-caches the background and blits the data
+    else:
+        blit_ecg()
+        ecg_frame_times.append(time.perf_counter() - start)
+
+def get_ecg_frame_stats():
+    """Frame times of recent blitted draw_graphs() calls, for comparing against full redraws"""
+    times = list(ecg_frame_times)
+    return {
+        "frames": len(times),
+        "full_redraws": ecg_full_redraws,
+        "last_ms": times[-1] * 1000.0 if times else 0.0,
+        "mean_ms": sum(times) / len(times) * 1000.0 if times else 0.0,
+        "max_ms": max(times) * 1000.0 if times else 0.0,
+    }
+
+def benchmark_draw_graphs(frames=50):
+    """
+    Compare the blitted draw_graphs() against a full canvas redraw per tick
+
+    Needs create_gui() to have run; prints and returns mean ms per frame
+    """
+    start = time.perf_counter()
+    for _ in range(frames):
+        ecg_canvas.draw()
+    full_ms = (time.perf_counter() - start) / frames * 1000.0
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        draw_graphs()
+    blit_ms = (time.perf_counter() - start) / frames * 1000.0
+
+    print(f"ECG full redraw | {full_ms:8.2f} ms/frame")
+    print(f"ECG blitted     | {blit_ms:8.2f} ms/frame ({full_ms / blit_ms:.1f}x faster)")
+    return {"full_ms": full_ms, "blit_ms": blit_ms}
 
 def create_styled_button(parent, text, command, width=8, height=3, color=COLORS["primary"]):
     """Creates a styled button with flat relief and custom colors"""
@@ -608,6 +801,11 @@ def create_gui():
     status_label = tk.Label(status_frame, text="● Disconnected", fg=COLORS["danger"],
                           bg=COLORS["bg_card"], font=FONTS["label"])
     status_label.pack()
+
+    if sensor_error is not None:
+        sensor_error_label = tk.Label(status_frame, text="● Sensor error: no vitals", fg=COLORS["danger"],
+                                      bg=COLORS["bg_card"], font=FONTS["label"])
+        sensor_error_label.pack()
     
     web_url = f"{SERVER_URL}/nora"
     server_url_label = tk.Label(status_frame, text=f"Web Dashboard: {web_url}",
@@ -778,13 +976,11 @@ def create_gui():
         
         # Set flag to ignore echo from server
         flow_rate_changed_locally = True
+        flow_rate_changed()
         
         # Update the display
         update_flow_display()
         
-        # Update the hardware
-        # update_flow(flow_rate)
-        
         # Send to server via WebSocket
         try:
             sio.emit("update_flow_rate", {"flow_rate": flow_rate})
@@ -808,13 +1004,11 @@ def create_gui():
         
         # Set flag to ignore echo from server
         flow_rate_changed_locally = True
+        flow_rate_changed()
         
         # Update the display
         update_flow_display()
         
-        # Update the hardware
-        # update_flow(flow_rate)
-        
         # Send to server via WebSocket
         try:
             sio.emit("update_flow_rate", {"flow_rate": flow_rate})
@@ -869,6 +1063,7 @@ def create_gui():
         if procedure_running:
             # Reset volume given when starting procedure
             vol_given = 0.0
+            reset_delivery()
             actual_vol_given = 0.0  # Reset this too if it's being used
             procedure_status_label.config(text="Status: Running", fg=COLORS["success"])
             start_stop_btn.config(text="Stop Procedure", bg=COLORS["danger"])
@@ -920,6 +1115,7 @@ def create_gui():
     
     ecg_canvas = FigureCanvasTkAgg(ecg_figure, master=ecg_container)
     ecg_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, pady=10)
+    init_ecg_plot()
     
     #FOOTER SECTION
     footer_frame = tk.Frame(main_frame, bg=COLORS["bg_main"])
@@ -941,11 +1137,12 @@ def initialize_servo():
     if is_raspberry_pi:
         print(f"Initializing servo on GPIO pin {SERVO_PIN}...")
         
-        # Try each pin factory in succession, starting with the most modern ones
+        # Try each pin factory in succession, starting with pigpio (hardware-timed pulses, needs
+        # pigpiod running), then the most modern software-timed ones
         factories = [
+            ('PiGPIOFactory', PiGPIOFactory),
             ('LGPIOFactory', LGPIOFactory),
             ('RPiGPIOFactory', RPiGPIOFactory),
-            ('PiGPIOFactory', PiGPIOFactory),
             ('NativeFactory', NativeFactory)
         ]
         
@@ -986,6 +1183,105 @@ def initialize_servo():
         print("Running in simulation mode - servo initialization skipped")
         return True
 
+def initialize_sensor_source():
+    """Create the configured sensor source and start it on its own thread"""
+    global sensor_source, sensor_error
+
+    options = {}
+    if SENSOR_SOURCE == "mcp3008" or (SENSOR_SOURCE == "auto" and is_raspberry_pi):
+        options = {"red_channel": PULSEOX_RED_CHANNEL, "ir_channel": PULSEOX_IR_CHANNEL,
+                   "rate_hz": PULSEOX_SAMPLE_RATE, "record_path": RAW_RECORD_FILE}
+    elif SENSOR_SOURCE == "serial":
+        options = {"port": SERIAL_PORT}
+    elif SENSOR_SOURCE in ("replay", "adc_replay"):
+        # A replay is only ever asked for on purpose; a missing or unreadable file stops NORA right here
+        variable, path = ("NORA_REPLAY_FILE", REPLAY_FILE) if SENSOR_SOURCE == "replay" else ("NORA_RAW_REPLAY_FILE", RAW_REPLAY_FILE)
+        if not path or not os.path.isfile(path):
+            sys.exit(f"ERROR: NORA_SENSOR_SOURCE={SENSOR_SOURCE} needs {variable} set to an existing file (got {path!r})")
+        options = {"path": path}
+
+    # Never substitute simulated vitals for a sensor that failed: they would be shown as the patient's.
+    # Simulation only runs when asked for (simulated, or auto off the Pi).
+    try:
+        sensor_source = create_sensor_source(SENSOR_SOURCE, is_raspberry_pi, **options)
+    except Exception as e:
+        if SENSOR_SOURCE in ("replay", "adc_replay"):
+            sys.exit(f"ERROR: cannot replay {options['path']}: {e}")
+        sensor_error = f"{SENSOR_SOURCE} sensor source failed: {e}"
+        print(f"ERROR: {sensor_error}")
+        print("ERROR: No vitals will be shown or sent until the sensor is fixed and NORA is restarted.")
+        return None
+
+    print(f"Reading vitals from {type(sensor_source).__name__}")
+    sensor_source.start()
+    return sensor_source
+
+def initialize_uplink():
+    """Start the background thread that sends vitals to the server"""
+    global uplink, streamer
+    uplink = TelemetryUplink(f"{SERVER_URL}/data").start()
+    streamer = VitalsBatchStreamer(sio, source_waveform(), getattr(sensor_source, "waveform_rate_hz", None),
+                                   fallback=uplink).start()
+    return uplink
+
+def cleanup_uplink():
+    """Give queued vitals one last chance to reach the server, then stop the uplink threads"""
+    if streamer is not None:
+        streamer.stop()
+    if uplink is not None:
+        uplink.stop()
+        print(f"Uplink stats: {uplink.stats()}")
+
+def initialize_records():
+    """Start the background threads that write procedure records in RECORD_FORMAT"""
+    global record_writer, chunk_writer
+    if RECORD_FORMAT in ("text", "both"):
+        record_writer = ProcedureRecordWriter(RECORD_DIR, max_bytes=RECORD_MAX_BYTES, fsync=RECORD_FSYNC).start()
+    if RECORD_FORMAT in ("chunks", "both"):
+        waveform = source_waveform() if RECORD_WAVEFORM else None
+        chunk_writer = ChunkRecordWriter(RECORD_DIR, max_bytes=RECORD_MAX_BYTES, fsync=RECORD_FSYNC,
+                                         waveform=waveform, rate_hz=getattr(sensor_source, "waveform_rate_hz", None)).start()
+
+def cleanup_records():
+    """Write out queued records and close the open record files"""
+    for writer in (record_writer, chunk_writer):
+        if writer is not None:
+            writer.stop()
+            print(f"Procedure record stats: {writer.stats()}")
+
+def initialize_infusion():
+    """Start integrating the volume given at INFUSION_RATE_HZ"""
+    global infusion
+    infusion = InfusionIntegrator(lambda: flow_rate, lambda: desired_vol, lambda: procedure_running,
+                                  rate_hz=INFUSION_RATE_HZ, on_target=on_target_volume).start()
+
+def initialize_servo_control():
+    """Start the thread that steps the servo (or a simulated position) to follow the volume given"""
+    global servo_controller
+    servo_controller = ServoController(servo if is_raspberry_pi else None, lambda: infusion.volume,
+                                       lambda: flow_rate if procedure_running else 0, syringe_size=SYRINGE_SIZE,
+                                       min_value=SERVO_MIN_VALUE, max_value=SERVO_MAX_VALUE,
+                                       poll_interval=SERVO_POLL_INTERVAL).start()
+    mode = "hardware-timed" if servo_controller.hardware_timed else "software-timed" if servo_controller.servo is not None else "simulated"
+    print(f"Servo control: {mode} pulses, step {servo_controller.step_size}")
+
+def cleanup_servo_control():
+    """Stop the servo control thread"""
+    if servo_controller is not None:
+        servo_controller.stop()
+        print(f"Servo control stats: {servo_controller.stats()}")
+
+def cleanup_infusion():
+    """Stop the infusion integration thread"""
+    if infusion is not None:
+        infusion.stop()
+        print(f"Infusion stats: {infusion.stats()}")
+
+def cleanup_sensor_source():
+    """Stop the sensor source thread and release its hardware"""
+    if sensor_source is not None:
+        sensor_source.stop()
+
 def cleanup_servo():
     """Clean up servo resources"""
     global servo
@@ -997,30 +1293,110 @@ def cleanup_servo():
         except Exception as e:
             print(f"Error cleaning up servo: {e}")
 
+STARTUP_PROBE = os.environ.get("NORA_STARTUP_PROBE") == "1" # print startup time and memory, then exit
+STARTUP_PROBE_PATTERN = re.compile(r"STARTUP_PROBE rss_kb=(\d+) gui_modules=(True|False)")
+
+def report_startup():
+    """Print the line benchmark_startup() waits for: peak RSS once everything is initialized"""
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KB on Linux
+    gui_modules = 'tkinter' in sys.modules or 'matplotlib' in sys.modules
+    # One write, so output from the other threads cannot land in the middle of the line
+    sys.stdout.write(f"STARTUP_PROBE rss_kb={rss_kb} gui_modules={gui_modules}\n")
+    sys.stdout.flush()
+
+def benchmark_startup(runs=3):
+    """
+    Compare headless and GUI startup: start NORA in each mode `runs` times
+    and time it from launch to the end of initialization, with its peak RSS
+
+    Returns:
+        dict of mode -> {"startup_s": mean seconds, "rss_mb": mean MB, "gui_modules": bool}, or
+        None for a mode that did not start (e.g. GUI mode without a display)
+    """
+    results = {}
+    for mode, args in (("headless", ["--headless"]), ("gui", [])):
+        times, rss, gui_modules = [], [], None
+        for _ in range(runs):
+            env = dict(os.environ, NORA_STARTUP_PROBE="1", NORA_HEADLESS="0")
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__)] + args, env=env,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            for line in process.stdout:
+                match = STARTUP_PROBE_PATTERN.search(line)
+                if match:
+                    times.append(time.perf_counter() - start)
+                    rss.append(int(match.group(1)) / 1024.0)
+                    gui_modules = match.group(2) == "True"
+            process.wait()
+        results[mode] = {"startup_s": sum(times) / len(times), "rss_mb": sum(rss) / len(rss),
+                         "gui_modules": gui_modules} if times else None
+    for mode, result in results.items():
+        if result is None:
+            print(f"{mode:>8}: did not start")
+        else:
+            print(f"{mode:>8}: startup {result['startup_s']:.2f} s, peak RSS {result['rss_mb']:.1f} MB, "
+                  f"GUI modules loaded: {result['gui_modules']}")
+    return results
+
+if __name__ == "__main__" and "--benchmark-startup" in sys.argv[1:]:
+    benchmark_startup()
+    sys.exit(0)
+
 if __name__ == "__main__":
     # Initialize servo motor
     servo_initialized = initialize_servo()
     if not servo_initialized and is_raspberry_pi:
         print("WARNING: Servo motor initialization failed!")
+
+    # Start reading vitals in the background
+    initialize_sensor_source()
     
     # Create GUI
-    app = create_gui()
+    app = None if HEADLESS else create_gui()
     
+    # Send vitals to the server in the background
+    initialize_uplink()
+
+    # Write procedure records in the background
+    initialize_records()
+
+    # Integrate the volume given, and step the servo to follow it, in the background
+    initialize_infusion()
+    initialize_servo_control()
+
     # Connect to WebSocket in a separate thread
     socket_thread = threading.Thread(target=connect_to_socket, daemon=True)
     socket_thread.start()
     
-    # Start the vital signs update loop
-    update_vitals(app)
-    update_volume_given()
-    update_flow()
+    # Run the periodic loops from one scheduler, on the Tk thread or (headless) on this one
+    scheduler.add("vitals", UPDATE_INTERVAL / 1000, update_vitals)
+    scheduler.add("volume", VOLUME_INTERVAL / 1000, update_volume_given)
+    if not HEADLESS:
+        scheduler.add("display", DISPLAY_INTERVAL / 1000, update_display)
+        scheduler.attach_tk(app)
 
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set() if HEADLESS else app.after(0, app.destroy))
     try:
         # Start the main loop
-        app.mainloop()
+        if STARTUP_PROBE:
+            report_startup()
+        elif HEADLESS:
+            print("Running headless; Ctrl+C to stop")
+            scheduler.run(stop_event)
+        else:
+            app.mainloop()
+    except KeyboardInterrupt:
+        pass
     finally:
         # Disconnect socket on exit
         if sio.connected:
             sio.disconnect()
         
+        cleanup_servo_control()
+        cleanup_infusion()
         cleanup_servo()
+        cleanup_sensor_source()
+        cleanup_uplink()
+        cleanup_records()
+        print(f"Scheduler stats: {scheduler.stats()}")
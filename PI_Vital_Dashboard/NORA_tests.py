@@ -89,55 +89,58 @@ class NORA_tests(unittest.TestCase):
     # The next 3 tests make sure that value updates work for heart rate, SpO2 change,
     # and blood pressure work
 
-    @patch('NORA.requests.post')
-    @patch('NORA.rand.randint')
-    def test_hr_change(self, mock_randint, mock_post):
-        mock_randint.side_effect = [80, 99, 120, 80]  # hr, spo2, bp_sys, bp_dia
-        mock_post.return_value = MagicMock(status_code=200)
-        mock_post.return_value.json.return_value = {}
+    @patch('NORA.uplink')
+    @patch('NORA.sensor_source')
+    def test_hr_change(self, mock_source, mock_uplink):
+        mock_source.latest.return_value = {"hr": 80, "spo2": 99, "bp": (120, 80)}
 
-        NORA.update_vitals(self.root)
+        NORA.update_vitals()
         hr_label = NORA.vital_labels["hr"]
         self.assertEqual(hr_label.cget("text"), "80 bpm")
 
-        mock_randint.side_effect = [90, 99, 120, 80]
-        NORA.update_vitals(self.root)
+        mock_source.latest.return_value = {"hr": 90, "spo2": 99, "bp": (120, 80)}
+        NORA.update_vitals()
         self.assertEqual(hr_label.cget("text"), "90 bpm")
 
-        # Ensure no unexpected HTTP request was made
-        mock_post.assert_called()  
+        # Vitals are handed to the uplink thread instead of posted from the GUI thread
+        mock_uplink.submit.assert_called()
 
 
-    @patch('NORA.requests.post')
-    @patch('NORA.rand.randint')
-    def test_spo2_change(self, mock_randint, mock_post):
-        mock_randint.side_effect = [80, 99, 120, 80]
-        mock_post.return_value = MagicMock(status_code=200)
-        mock_post.return_value.json.return_value = {}
+    @patch('NORA.uplink')
+    @patch('NORA.sensor_source')
+    def test_spo2_change(self, mock_source, mock_uplink):
+        mock_source.latest.return_value = {"hr": 80, "spo2": 99, "bp": (120, 80)}
 
-        NORA.update_vitals(self.root)
+        NORA.update_vitals()
         spo2_label = NORA.vital_labels["spo2"]
         self.assertEqual(spo2_label.cget("text"), "99%")
 
-        mock_randint.side_effect = [80, 95, 120, 80]
-        NORA.update_vitals(self.root)
+        mock_source.latest.return_value = {"hr": 80, "spo2": 95, "bp": (120, 80)}
+        NORA.update_vitals()
         self.assertEqual(spo2_label.cget("text"), "95%")
 
-        mock_post.assert_called()
+        mock_uplink.submit.assert_called()
 
-    @patch('NORA.requests.post')
-    @patch('NORA.rand.randint')
-    def test_bp_change(self, mock_randint, mock_post):
-        mock_randint.side_effect = [80, 99, 120, 80]
-        mock_post.return_value = MagicMock(status_code=200)
-        mock_post.return_value.json.return_value = {}
+    @patch('NORA.uplink')
+    @patch('NORA.sensor_source')
+    def test_bp_change(self, mock_source, mock_uplink):
+        mock_source.latest.return_value = {"hr": 80, "spo2": 99, "bp": (120, 80)}
 
-        NORA.update_vitals(self.root)
+        NORA.update_vitals()
         bp_label = NORA.vital_labels["bp"]
         self.assertEqual(bp_label.cget("text"), "120/80 mmHg")
 
-        mock_randint.side_effect = [80, 99, 130, 90]
-        NORA.update_vitals(self.root)
+        mock_source.latest.return_value = {"hr": 80, "spo2": 99, "bp": (130, 90)}
+        NORA.update_vitals()
         self.assertEqual(bp_label.cget("text"), "130/90 mmHg")
 
-        mock_post.assert_called()
+        mock_uplink.submit.assert_called()
+
+    # update_vitals only reads the newest snapshot, so a source that has not
+    # produced one yet leaves the display alone
+
+    @patch('NORA.sensor_source')
+    def test_no_snapshot_yet(self, mock_source):
+        mock_source.latest.return_value = None
+        NORA.update_vitals()
+        self.assertEqual(NORA.vital_labels["hr"].cget("text"), "--")
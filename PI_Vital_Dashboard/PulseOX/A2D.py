@@ -1,8 +1,10 @@
-<<<<<<< HEAD
 #!/usr/bin/env python3
 
 import time
 import platform
+import argparse
+import random
+import numpy as np
 
 # Check if running on a Raspberry Pi
 is_raspberry_pi = platform.system() == "Linux" and platform.machine().startswith(("arm", "aarch"))
@@ -56,6 +58,12 @@ PULSEOX_SPI_MISO = 9  # Data out (MISO)
 PULSEOX_SPI_SCLK = 11   # Clock
 PULSEOX_SPI_CE0 = 8    # Data channel select pin (CS/SHDN)
 
+# SPI bus settings used by the direct spidev readers
+SPI_BUS = 0
+SPI_DEVICE = 0
+SPI_MAX_SPEED_HZ = 1000000  # 1MHz
+MCP3008_MAX_RAW = 1023  # 10-bit converter
+
 # Function to initialize MCP3008 with different GPIO backends
 def initialize_mcp3008(channel=0):
     """
@@ -123,7 +131,6 @@ def read_analog(adc):
     """
     if adc is None:
         # Simulation mode - return random values
-        import random
         value = random.random()
         voltage = value * 3.3
         return value, voltage
@@ -134,10 +141,31 @@ def read_analog(adc):
     
     return value, voltage
 
+def mcp3008_command(channel):
+    """
+    Build the 3-byte single-ended read command for an MCP3008 channel
+
+    First byte: Start bit (1)
+    Second byte: Single/diff bit (1 for single) followed by the channel bits
+    Third byte: Don't care bits clocked out while the result is shifted in
+    """
+    return [0x01, (0x08 + channel) << 4, 0x00]
+
+def mcp3008_decode(resp):
+    """
+    Extract the 10-bit result from an MCP3008 response
+
+    Uses the lower 2 bits from the second byte and all 8 bits from the third byte
+    """
+    return ((resp[1] & 0x03) << 8) + resp[2]
+
 # Direct SPI implementation to bypass gpiozero
 def read_mcp3008_direct(channel=0):
     """
     Read directly from MCP3008 using spidev
+
+    Opens and closes the SPI device on every call; use MCP3008Reader for
+    anything that reads more than a handful of samples.
     
     Args:
         channel: The MCP3008 channel to read from (0-7)
@@ -147,26 +175,18 @@ def read_mcp3008_direct(channel=0):
         raw_value: The raw integer value (0-1023)
     """
     if not is_raspberry_pi:
-        import random
-        raw_value = int(random.random() * 1023)
-        return raw_value / 1023.0, raw_value
+        raw_value = int(random.random() * MCP3008_MAX_RAW)
+        return raw_value / float(MCP3008_MAX_RAW), raw_value
         
     try:
         import spidev
         spi = spidev.SpiDev()
-        spi.open(0, 0)  # Open SPI bus 0, device 0
-        spi.max_speed_hz = 1000000  # 1MHz
+        spi.open(SPI_BUS, SPI_DEVICE)  # Open SPI bus 0, device 0
+        spi.max_speed_hz = SPI_MAX_SPEED_HZ
         
-        # MCP3008 expects:
-        # First byte: Start bit (1) followed by single/diff bit (1 for single) and part of channel
-        # Second byte: Rest of channel bits followed by don't care bits
-        cmd = [0x01, (0x08 + channel) << 4, 0x00]
-        resp = spi.xfer2(cmd)
-        
-        # The returned data will be in the second and third bytes
-        # Use the lower 2 bits from the second byte and all 8 bits from the third byte
-        raw_value = ((resp[1] & 0x03) << 8) + resp[2]
-        normalized_value = raw_value / 1023.0
+        resp = spi.xfer2(mcp3008_command(channel))
+        raw_value = mcp3008_decode(resp)
+        normalized_value = raw_value / float(MCP3008_MAX_RAW)
         
         spi.close()
         return normalized_value, raw_value
@@ -174,261 +194,157 @@ def read_mcp3008_direct(channel=0):
         print(f"Error in direct SPI reading: {e}")
         return 0, 0
 
-# Debugging function for MCP3008
-def debug_mcp3008(adc, channel=0):
+class MCP3008Reader:
     """
-    Print debug information about the MCP3008 connection
+    Long-lived MCP3008 reader that keeps the SPI device open between reads
+
+    The MCP3008 starts a conversion on every falling edge of CS, so each
+    sample still needs its own transfer, but the open/configure/close cost
+    of read_mcp3008_direct() is paid once instead of per sample. Bursts are
+    written into a preallocated uint16 buffer so steady-state reads do not
+    allocate.
+
+    Falls back to simulated readings when not running on a Raspberry Pi.
     """
-    print("\nDEBUG INFORMATION:")
-    print(f"Raspberry Pi Detected: {is_raspberry_pi}")
-    print(f"SPI Pins Configured: CLK={PULSEOX_SPI_SCLK}, MOSI={PULSEOX_SPI_MOSI}, MISO={PULSEOX_SPI_MISO}, CS={PULSEOX_SPI_CE0}")
-    
-    if adc is None:
-        print("DEBUG: No MCP3008 object available (initialization failed or simulation mode)")
-    else:
-        print(f"ADC Object Type: {type(adc)}")
-        print(f"ADC Channel: {adc.channel}")
-        print(f"ADC Pin Factory: {adc.pin_factory}")
-    
-    # Check for SPI interface
-    if is_raspberry_pi:
-        import os
-        if os.path.exists("/dev/spidev0.0"):
-            print("\nSPI Device: /dev/spidev0.0 exists")
-        else:
-            print("\nWARNING: /dev/spidev0.0 does not exist!")
-            print("SPI may not be enabled. Run 'sudo raspi-config' and enable SPI interface")
-    
-    # Try direct SPI method
-    print("\nTesting direct SPI access:")
-    try:
-        value, raw = read_mcp3008_direct(channel)
-        print(f"Direct SPI read successful from channel {channel}")
-        print(f"Raw value: {raw} (0-1023)")
-        print(f"Normalized value: {value:.4f}")
-        print(f"Voltage estimate: {value * 3.3:.2f}V")
-    except Exception as e:
-        print(f"Direct SPI access failed: {e}")
-    
-    print("\nPossible issue causes if readings are 0:")
-    print("1. Incorrect wiring - double check all connections")
-    print("2. MCP3008 not powered correctly - verify VDD and VREF connections")
-    print("3. SPI not enabled - run 'sudo raspi-config' and enable SPI")
-    print("4. Sensor not providing a signal to channel 0")
-    print("5. Pin configuration in code doesn't match hardware connections")
-    print("6. Channel selection is incorrect - ensure sensor is on channel 0")
 
-# Main program to continuously read from MCP3008
-if __name__ == "__main__":
-    print("MCP3008 A2D Converter Test Program")
-    print("----------------------------------")
-    print(f"Using Channel Select Pin: {PULSEOX_SPI_CE0}")
-    print(f"Reading from MCP3008 Channel 0")
-    
-    # Initialize MCP3008 on channel 0
-    adc = initialize_mcp3008(channel=0)
-    
-    if adc is None:
-        print("Could not initialize MCP3008 through gpiozero, will try direct SPI")
-    
-    # Run the debug function first
-    debug_mcp3008(adc)
-    
-    try:
-        print("\nStarting continuous reading (Press CTRL+C to exit)")
-        print("Method   | Raw Value  | Voltage")
-        print("------------------------------")
-        
-        while True:
-            # Try both methods
-            gpiozero_value, gpiozero_voltage = read_analog(adc)
-            direct_value, direct_raw = read_mcp3008_direct(0)
-            direct_voltage = direct_value * 3.3
-            
-            # Display the readings
-            print(f"GPIOZero | {gpiozero_value:.4f} | {gpiozero_voltage:.2f}V")
-            print(f"Direct   | {direct_value:.4f} ({direct_raw}) | {direct_voltage:.2f}V")
-            print("-" * 30)
-            
-            # Wait before taking another reading
-            time.sleep(1)
-            
-    except KeyboardInterrupt:
-=======
-#!/usr/bin/env python3
+    def __init__(self, channels=(0,), burst_size=256, bus=SPI_BUS, device=SPI_DEVICE,
+                 max_speed_hz=SPI_MAX_SPEED_HZ):
+        """
+        Args:
+            channels: MCP3008 channels (0-7) read on every sample
+            burst_size: Number of samples the internal buffer can hold
+            bus: SPI bus number
+            device: SPI chip select number
+            max_speed_hz: SPI clock speed
+        """
+        self.channels = tuple(channels)
+        for channel in self.channels:
+            if not 0 <= channel <= 7:
+                raise ValueError(f"MCP3008 channel must be between 0 and 7, got {channel}")
+        self.bus = bus
+        self.device = device
+        self.max_speed_hz = max_speed_hz
+        self.simulated = not is_raspberry_pi
+        self.spi = None
 
-import time
-import platform
+        # Commands are built once; xfer2 overwrites its argument, so each read copies them
+        self._commands = [mcp3008_command(channel) for channel in self.channels]
+        self.buffer = np.zeros((burst_size, len(self.channels)), dtype=np.uint16)
 
-# Check if running on a Raspberry Pi
-is_raspberry_pi = platform.system() == "Linux" and platform.machine().startswith(("arm", "aarch"))
+    def open(self):
+        """Open the SPI device once for the lifetime of the reader"""
+        if self.simulated or self.spi is not None:
+            return self
+        import spidev
+        self.spi = spidev.SpiDev()
+        self.spi.open(self.bus, self.device)
+        self.spi.max_speed_hz = self.max_speed_hz
+        return self
 
-# Import GPIO libraries if on Raspberry Pi
-if is_raspberry_pi:
-    try:
-        from gpiozero import MCP3008
-        from gpiozero.pins.rpigpio import RPiGPIOFactory
-        from gpiozero.pins.lgpio import LGPIOFactory
-        from gpiozero.pins.pigpio import PiGPIOFactory
-        from gpiozero.pins.native import NativeFactory
-        
-        # Import backend libraries directly to ensure they're available
-        try:
-            import RPi.GPIO
-            print("RPi.GPIO imported successfully")
-        except ImportError:
-            print("RPi.GPIO not available")
-            
-        try:
-            import lgpio
-            print("lgpio imported successfully")
-        except ImportError:
-            print("lgpio not available")
-            
-        try:
-            import pigpio
-            print("pigpio imported successfully")
-        except ImportError:
-            print("pigpio not available")
-            
-        # Try to import spidev for direct SPI access
-        try:
-            import spidev
-            print("spidev imported successfully")
-        except ImportError:
-            print("spidev not available")
-            
-        print("Running on Raspberry Pi. gpiozero imported successfully.")
-    except ImportError as e:
-        print(f"Warning: GPIO import error: {e}")
-        print("Analog reading will be simulated.")
-        is_raspberry_pi = False
-else:
-    print("Not running on Raspberry Pi. Analog reading will be simulated.")
+    def close(self):
+        """Release the SPI device"""
+        if self.spi is not None:
+            self.spi.close()
+            self.spi = None
 
-# MCP3008 Pin Configuration (same as NORA.py)
-PULSEOX_SPI_MOSI = 10   # Data in (MOSI)
-PULSEOX_SPI_MISO = 9  # Data out (MISO)
-PULSEOX_SPI_SCLK = 11   # Clock
-PULSEOX_SPI_CE0 = 8    # Data channel select pin (CS/SHDN)
+    def __enter__(self):
+        return self.open()
 
-# Function to initialize MCP3008 with different GPIO backends
-def initialize_mcp3008(channel=0):
-    """
-    Initialize the MCP3008 with different GPIO backends
-    
-    Args:
-        channel: The MCP3008 channel to read from (0-7)
-        
-    Returns:
-        The MCP3008 object if successful, None otherwise
-    """
-    if not is_raspberry_pi:
-        print("Running in simulation mode - MCP3008 initialization skipped")
-        return None
-        
-    # Try each pin factory in succession, starting with the most modern ones
-    factories = [
-        ('LGPIOFactory', LGPIOFactory),
-        ('RPiGPIOFactory', RPiGPIOFactory),
-        ('PiGPIOFactory', PiGPIOFactory),
-        ('NativeFactory', NativeFactory)
-    ]
-    
-    for factory_name, factory_class in factories:
-        try:
-            print(f"Trying {factory_name} for MCP3008...")
-            pin_factory = factory_class()
-            
-            # Initialize MCP3008 with explicit pin factory and pin configuration
-            adc = MCP3008(
-                channel=channel,
-                clock_pin=PULSEOX_SPI_SCLK,
-                mosi_pin=PULSEOX_SPI_MOSI,
-                miso_pin=PULSEOX_SPI_MISO,
-                select_pin=PULSEOX_SPI_CE0,
-                pin_factory=pin_factory
-            )
-            print(f"MCP3008 initialized successfully on channel {channel} using {factory_name}")
-            print(f"Using pins: CLK={PULSEOX_SPI_SCLK}, MOSI={PULSEOX_SPI_MOSI}, MISO={PULSEOX_SPI_MISO}, CS={PULSEOX_SPI_CE0}")
-            return adc
-        except Exception as e:
-            print(f"Failed to initialize MCP3008 with {factory_name}: {e}")
-    
-    # If we get here, all attempts failed
-    print("\nMCP3008 initialization failed with all pin factories!")
-    print("Possible solutions:")
-    print("1. Ensure you have GPIO libraries installed:")
-    print("   sudo apt-get install python3-lgpio python3-rpi.gpio")
-    print("   sudo pip install RPi.GPIO lgpio")
-    print("2. Try running with sudo")
-    print("3. Verify GPIO permissions (run sudo usermod -a -G gpio $USER)")
-    print("4. Make sure SPI is enabled (sudo raspi-config)")
-    return None
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-def read_analog(adc):
-    """
-    Read the analog value from the MCP3008
-    
-    Args:
-        adc: The MCP3008 object
-    
-    Returns:
-        value: A float between 0 and 1 representing the analog reading
-        voltage: The voltage (assuming 3.3V reference)
-    """
-    if adc is None:
-        # Simulation mode - return random values
-        import random
-        value = random.random()
-        voltage = value * 3.3
-        return value, voltage
-    
-    # Read the actual value from the MCP3008
-    value = adc.value
-    voltage = value * 3.3  # Assuming 3.3V reference voltage
-    
-    return value, voltage
+    def read_channels(self, out=None):
+        """
+        Read one sample from every configured channel
 
-# Direct SPI implementation to bypass gpiozero
-def read_mcp3008_direct(channel=0):
+        Args:
+            out: Optional uint16 array with one slot per channel
+
+        Returns:
+            uint16 array of raw values (0-1023), one per channel
+        """
+        if out is None:
+            out = np.empty(len(self.channels), dtype=np.uint16)
+        if self.simulated:
+            for i in range(len(self.channels)):
+                out[i] = int(random.random() * MCP3008_MAX_RAW)
+            return out
+
+        xfer2 = self.spi.xfer2
+        for i, command in enumerate(self._commands):
+            resp = xfer2(list(command))
+            out[i] = ((resp[1] & 0x03) << 8) + resp[2]
+        return out
+
+    def read_burst(self, n_samples, out=None):
+        """
+        Read n_samples back-to-back from every configured channel
+
+        Args:
+            n_samples: Number of samples per channel
+            out: Optional uint16 array of shape (n_samples, channels); defaults
+                to a view of the reader's preallocated buffer, which is
+                overwritten by the next burst
+
+        Returns:
+            uint16 array of shape (n_samples, channels)
+        """
+        if out is None:
+            if n_samples > len(self.buffer):
+                self.buffer = np.zeros((n_samples, len(self.channels)), dtype=np.uint16)
+            out = self.buffer[:n_samples]
+        elif out.shape != (n_samples, len(self.channels)):
+            raise ValueError(f"out must have shape {(n_samples, len(self.channels))}, got {out.shape}")
+
+        if self.simulated:
+            out[:] = np.random.randint(0, MCP3008_MAX_RAW + 1, size=out.shape)
+            return out
+
+        xfer2 = self.spi.xfer2
+        commands = self._commands
+        for n in range(n_samples):
+            row = out[n]
+            for i, command in enumerate(commands):
+                resp = xfer2(list(command))
+                row[i] = ((resp[1] & 0x03) << 8) + resp[2]
+        return out
+
+def benchmark_read_rate(n_samples=2000, channels=(0,)):
     """
-    Read directly from MCP3008 using spidev
-    
+    Compare sample throughput of read_mcp3008_direct() against MCP3008Reader
+
     Args:
-        channel: The MCP3008 channel to read from (0-7)
-        
+        n_samples: Number of samples per channel to read with each method
+        channels: Channels to read on every sample
+
     Returns:
-        value: A float between 0 and 1 representing the reading
-        raw_value: The raw integer value (0-1023)
+        dict with samples/second for the per-call and persistent paths
     """
-    if not is_raspberry_pi:
-        import random
-        raw_value = int(random.random() * 1023)
-        return raw_value / 1023.0, raw_value
-        
-    try:
-        import spidev
-        spi = spidev.SpiDev()
-        spi.open(0, 0)  # Open SPI bus 0, device 0
-        spi.max_speed_hz = 1000000  # 1MHz
-        
-        # MCP3008 expects:
-        # First byte: Start bit (1) followed by single/diff bit (1 for single) and part of channel
-        # Second byte: Rest of channel bits followed by don't care bits
-        cmd = [0x01, (0x08 + channel) << 4, 0x00]
-        resp = spi.xfer2(cmd)
-        
-        # The returned data will be in the second and third bytes
-        # Use the lower 2 bits from the second byte and all 8 bits from the third byte
-        raw_value = ((resp[1] & 0x03) << 8) + resp[2]
-        normalized_value = raw_value / 1023.0
-        
-        spi.close()
-        return normalized_value, raw_value
-    except Exception as e:
-        print(f"Error in direct SPI reading: {e}")
-        return 0, 0
+    total = n_samples * len(channels)
+
+    start = time.perf_counter()
+    for _ in range(n_samples):
+        for channel in channels:
+            read_mcp3008_direct(channel)
+    per_call_rate = total / (time.perf_counter() - start)
+
+    with MCP3008Reader(channels=channels, burst_size=n_samples) as reader:
+        reader.read_burst(1)  # warm up outside the timed region
+        start = time.perf_counter()
+        reader.read_burst(n_samples)
+        burst_rate = total / (time.perf_counter() - start)
+
+    results = {
+        "per_call_samples_per_s": per_call_rate,
+        "burst_samples_per_s": burst_rate,
+        "speedup": burst_rate / per_call_rate,
+    }
+    print(f"MCP3008 read benchmark ({n_samples} samples x {len(channels)} channel(s), "
+          f"{'simulated' if not is_raspberry_pi else 'SPI'})")
+    print(f"read_mcp3008_direct | {per_call_rate:12.0f} samples/s")
+    print(f"MCP3008Reader burst | {burst_rate:12.0f} samples/s")
+    print(f"Speedup             | {results['speedup']:12.1f}x")
+    return results
 
 # Debugging function for MCP3008
 def debug_mcp3008(adc, channel=0):
@@ -475,7 +391,21 @@ def debug_mcp3008(adc, channel=0):
     print("6. Channel selection is incorrect - ensure sensor is on channel 0")
 
 # Main program to continuously read from MCP3008
+# Usage (from PI_Vital_Dashboard): python -m PulseOX.A2D [--benchmark]
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MCP3008 A2D converter test program")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare per-call and persistent SPI read throughput, then exit")
+    parser.add_argument("--samples", type=int, default=2000,
+                        help="samples per channel for --benchmark")
+    parser.add_argument("--channels", type=int, nargs="+", default=[0],
+                        help="MCP3008 channels to read for --benchmark")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_read_rate(args.samples, tuple(args.channels))
+        raise SystemExit(0)
+
     print("MCP3008 A2D Converter Test Program")
     print("----------------------------------")
     print(f"Using Channel Select Pin: {PULSEOX_SPI_CE0}")
@@ -490,25 +420,23 @@ if __name__ == "__main__":
     # Run the debug function first
     debug_mcp3008(adc)
     
-    try:
-        print("\nStarting continuous reading (Press CTRL+C to exit)")
-        print("Method   | Raw Value  | Voltage")
-        print("------------------------------")
-        
-        while True:
-            # Try both methods
-            gpiozero_value, gpiozero_voltage = read_analog(adc)
-            direct_value, direct_raw = read_mcp3008_direct(0)
-            direct_voltage = direct_value * 3.3
-            
-            # Display the readings
-            print(f"GPIOZero | {gpiozero_value:.4f} | {gpiozero_voltage:.2f}V")
-            print(f"Direct   | {direct_value:.4f} ({direct_raw}) | {direct_voltage:.2f}V")
-            print("-" * 30)
-            
-            # Wait before taking another reading
-            time.sleep(1)
-            
-    except KeyboardInterrupt:
->>>>>>> 2e890db6b809ad7e1654cd8455a1fdf4a23cbe82
-        print("\nExiting program")
\ No newline at end of file
+    # Continuous reading runs on the fixed-rate AcquisitionEngine; this loop only reports once a second
+    from PulseOX.acquisition import AcquisitionEngine, DEFAULT_SAMPLE_RATE_HZ
+
+    with MCP3008Reader(channels=(0,)) as reader:
+        engine = AcquisitionEngine(reader, rate_hz=DEFAULT_SAMPLE_RATE_HZ)
+        engine.start()
+        try:
+            print(f"\nSampling channel 0 at {DEFAULT_SAMPLE_RATE_HZ} Hz (Press CTRL+C to exit)")
+            print("Samples  | Raw Value  | Voltage")
+            print("------------------------------")
+            while True:
+                time.sleep(1)
+                latest = engine.buffer.view(1)
+                if len(latest):
+                    raw = int(latest["raw"][0, 0])
+                    print(f"{engine.samples:8d} | {raw:10d} | {raw / MCP3008_MAX_RAW * 3.3:.2f}V")
+        except KeyboardInterrupt:
+            print("\nExiting program")
+        finally:
+            engine.stop()
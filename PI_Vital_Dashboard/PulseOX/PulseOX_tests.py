@@ -0,0 +1,261 @@
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from PulseOX.ring_buffer import RingBuffer
+from PulseOX.acquisition import AcquisitionEngine, sample_dtype
+from PulseOX.spo2 import SlidingWindow, SpO2Estimator
+from PulseOX.heart_rate import HeartRateDetector
+from PulseOX.synthetic import synthetic_ppg
+from PulseOX.raw_recording import RawRecorder, RawReplayer
+from PulseOX.display import minmax_decimate
+
+# To run type (from PI_Vital_Dashboard): python -m unittest PulseOX/PulseOX_tests.py
+
+
+class FakeReader:
+    """Stands in for MCP3008Reader; returns an increasing count on every channel"""
+
+    def __init__(self, channels=(0, 1)):
+        self.channels = channels
+        self.reads = 0
+
+    def read_channels(self, out=None):
+        self.reads += 1
+        out[:] = self.reads % 1024
+        return out
+
+
+class RingBuffer_tests(unittest.TestCase):
+
+    def test_view_is_in_order_after_wrap(self):
+        ring = RingBuffer(4)
+        for value in range(6):
+            ring.append(value)
+        self.assertEqual(ring.view().tolist(), [2, 3, 4, 5])
+        self.assertEqual(ring.view(2).tolist(), [4, 5])
+
+    def test_view_shares_storage(self):
+        ring = RingBuffer(4)
+        ring.extend([1, 2, 3])
+        self.assertTrue(np.shares_memory(ring.view(), ring._data))
+
+    def test_extend_longer_than_capacity_keeps_newest(self):
+        ring = RingBuffer(4)
+        ring.extend(np.arange(3))
+        ring.extend(np.arange(10, 20))
+        self.assertEqual(ring.count, 13)
+        self.assertEqual(ring.view().tolist(), [16, 17, 18, 19])
+
+    def test_read_since_reports_dropped(self):
+        ring = RingBuffer(4)
+        ring.extend(np.arange(3))
+        view, cursor, dropped = ring.read_since(0)
+        self.assertEqual((view.tolist(), cursor, dropped), ([0, 1, 2], 3, 0))
+
+        ring.extend(np.arange(3, 10))
+        view, cursor, dropped = ring.read_since(cursor)
+        self.assertEqual((view.tolist(), cursor, dropped), ([6, 7, 8, 9], 10, 3))
+
+
+class AcquisitionEngine_tests(unittest.TestCase):
+
+    def test_rejects_rate_out_of_range(self):
+        with self.assertRaises(ValueError):
+            AcquisitionEngine(FakeReader(), rate_hz=5000)
+
+    def test_samples_are_timestamped_in_order(self):
+        engine = AcquisitionEngine(FakeReader(), rate_hz=500, buffer_seconds=1)
+        engine.start()
+        time.sleep(0.2)
+        engine.stop()
+
+        timestamps, raw, cursor, dropped = engine.read_since(0)
+        self.assertGreater(len(timestamps), 10)
+        self.assertEqual(raw.shape[1], 2)
+        self.assertTrue(np.all(np.diff(timestamps) > 0))
+        self.assertEqual(cursor, engine.samples)
+        self.assertEqual(engine.stats()["samples"], engine.samples)
+
+
+class SlidingWindow_tests(unittest.TestCase):
+
+    def test_push_and_extend_match_full_rescan(self):
+        samples = np.random.default_rng(0).integers(0, 1024, 1000).astype(float)
+        pushed, extended = SlidingWindow(80), SlidingWindow(80)
+        for start in range(0, len(samples), 37):
+            block = samples[start:start + 37]
+            for value in block:
+                pushed.push(value)
+            extended.extend(block)
+
+            expected = samples[max(0, start + len(block) - 80):start + len(block)]
+            for window in (pushed, extended):
+                self.assertEqual(window.min, expected.min())
+                self.assertEqual(window.max, expected.max())
+                self.assertAlmostEqual(window.mean, expected.mean())
+
+
+class SpO2Estimator_tests(unittest.TestCase):
+
+    def pulse(self, rate, seconds, dc, ac):
+        t = np.arange(int(rate * seconds)) / rate
+        return dc + ac * np.sin(2 * np.pi * 1.2 * t)
+
+    def test_warming_up_returns_none(self):
+        estimator = SpO2Estimator(100)
+        self.assertIsNone(estimator.push(500, 600))
+
+    def test_known_ratio(self):
+        # R = (AC_red / DC_red) / (AC_ir / DC_ir) = 0.6 -> SpO2 = 110 - 25 * 0.6 = 95
+        red = self.pulse(250, 10, 500, 20)
+        ir = self.pulse(250, 10, 600, 40)
+        estimator = SpO2Estimator(250)
+        for start in range(0, len(red), 50):
+            spo2 = estimator.process_block(red[start:start + 50], ir[start:start + 50])
+        self.assertAlmostEqual(spo2, 95.0, delta=0.5)
+
+
+class HeartRateDetector_tests(unittest.TestCase):
+
+    def run_detector(self, samples, rate, block_size):
+        detector = HeartRateDetector(rate)
+        history = []
+        for start in range(0, len(samples), block_size):
+            history.append(detector.process_block(samples[start:start + block_size]))
+        return detector, history
+
+    def test_steady_rate(self):
+        samples = synthetic_ppg(500, 20, bpm=72, seed=0)
+        detector, _ = self.run_detector(samples, 500, 50)
+        self.assertAlmostEqual(detector.hr, 72, delta=1)
+
+    def test_block_size_does_not_change_beats(self):
+        samples = synthetic_ppg(250, 20, bpm=90, seed=1)
+        whole, _ = self.run_detector(samples, 250, len(samples))
+        split, _ = self.run_detector(samples, 250, 7)
+        self.assertEqual(whole.beats, split.beats)
+        self.assertAlmostEqual(whole.hr, split.hr)
+
+    def test_rate_change_shows_within_one_beat(self):
+        # 60 bpm for 20 s, then 100 bpm; one beat at the new rate is 0.6 s
+        bpm = (np.array([0, 20, 20.001, 40]), np.array([60, 60, 100, 100]))
+        samples = synthetic_ppg(250, 30, bpm=bpm, seed=2)
+        _, history = self.run_detector(samples, 250, 25)
+        self.assertAlmostEqual(history[int(19.9 * 10)], 60, delta=2)
+        self.assertAlmostEqual(history[int(21.5 * 10)], 100, delta=3)
+
+    def test_rate_halving_is_not_taken_for_missed_beats(self):
+        # 120 bpm for 20 s, then 60 bpm; the first 1 s interval alone could be a missed beat, the second is not
+        bpm = (np.array([0, 20, 20.001, 40]), np.array([120, 120, 60, 60]))
+        samples = synthetic_ppg(250, 30, bpm=bpm, seed=3)
+        _, history = self.run_detector(samples, 250, 25)
+        self.assertAlmostEqual(history[int(19.9 * 10)], 120, delta=3)
+        self.assertAlmostEqual(history[int(22.5 * 10)], 60, delta=2)
+        self.assertAlmostEqual(history[-1], 60, delta=2)
+
+    def test_taller_peak_in_refractory_period_redoes_interval(self):
+        detector = HeartRateDetector(250)
+        for index, height in ((0, 1.0), (250, 1.0), (500, 1.0), (750, 1.0), (760, 2.0)):
+            detector._consider(index, height)
+        self.assertEqual(detector.last_beat, 760)
+        self.assertEqual(list(detector.intervals), [250, 250, 260])
+        detector._consider(1010, 2.0)
+        self.assertEqual(list(detector.intervals), [250, 250, 260, 250])
+
+    def test_single_missed_beat_keeps_rate(self):
+        samples = synthetic_ppg(250, 20, bpm=72, seed=4)
+        beat = int(250 * 60 / 72)
+        samples[10 * 250:10 * 250 + beat] = samples[10 * 250] # flatten one pulse
+        _, history = self.run_detector(samples, 250, 25)
+        self.assertTrue(all(abs(hr - 72) < 3 for hr in history[int(8 * 10):]))
+
+
+class RawRecording_tests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "capture.adc")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_records(self, n, start=0):
+        records = np.zeros(n, dtype=sample_dtype(2))
+        records["t"] = (np.arange(n) + start) / 500.0
+        records["raw"] = (np.arange(n * 2).reshape(n, 2) + start) % 1024
+        return records
+
+    def test_round_trip_and_new_session_file(self):
+        recorder = RawRecorder(self.path, (0, 1), 500)
+        recorder.write(self.make_records(100))
+        recorder.close()
+        recorder = RawRecorder(self.path, (0, 1), 500)
+        recorder.write(self.make_records(50, start=100))
+        recorder.close()
+        self.assertEqual(recorder.path, os.path.join(self.directory.name, "capture.2.adc"))
+
+        replayer = RawReplayer(self.path)
+        self.assertEqual(replayer.channels, (0, 1))
+        self.assertEqual(len(replayer), 100)
+        self.assertTrue(np.array_equal(replayer.records["raw"], self.make_records(100)["raw"]))
+        blocks = list(replayer.iter_blocks(64))
+        self.assertEqual([len(t) for t, raw in blocks], [64, 36])
+        self.assertEqual(len(RawReplayer(recorder.path)), 50)
+
+    def test_timed_replay_feeds_buffer(self):
+        recorder = RawRecorder(self.path, (0, 1), 500)
+        recorder.write(self.make_records(100))
+        recorder.close()
+
+        replayer = RawReplayer(self.path, speed=10.0)
+        replayer.start()
+        time.sleep(0.2)
+        replayer.stop()
+        timestamps, raw, cursor, dropped = replayer.read_since(0)
+        self.assertTrue(replayer.finished)
+        self.assertEqual(cursor, 100)
+        self.assertEqual(raw[-1].tolist(), [198, 199])
+
+    def test_replay_is_on_the_replay_clock(self):
+        # Two sessions on unrelated monotonic clocks in one file, as older recorders appended them
+        recorder = RawRecorder(self.path, (0, 1), 500)
+        recorder.write(self.make_records(100, start=500000))
+        recorder.write(self.make_records(100))
+        recorder.close()
+
+        replayer = RawReplayer(self.path, speed=10.0, loop=True)
+        self.assertEqual(replayer.sessions, [(0, 100), (100, 200)])
+        self.assertAlmostEqual(replayer.duration, 2 * 99 / 500.0)
+        started = time.monotonic()
+        replayer.start()
+        time.sleep(0.15)
+        replayer.stop()
+        timestamps, raw, cursor, dropped = replayer.read_since(0)
+        self.assertGreater(cursor, 400) # looped at least once
+        self.assertTrue(np.all(np.diff(timestamps) > 0))
+        self.assertGreaterEqual(timestamps[0], started)
+        self.assertLessEqual(timestamps[-1], time.monotonic())
+        self.assertTrue(np.allclose(np.diff(timestamps), 1 / 5000.0))
+
+
+class MinMaxDecimate_tests(unittest.TestCase):
+
+    def test_short_input_unchanged(self):
+        x = np.arange(10.0)
+        out_x, out_y = minmax_decimate(x, x * 2, 100)
+        self.assertEqual(len(out_x), 10)
+
+    def test_envelope_per_column(self):
+        x = np.arange(1000) / 100.0
+        y = np.sin(x * 7)
+        y[500] = 5.0
+        y[510:520] = np.nan
+        out_x, out_y = minmax_decimate(x, y, 50, 0.0, 10.0)
+        self.assertEqual(len(out_x), 100)
+        self.assertEqual(np.nanmax(out_y), 5.0)
+        self.assertAlmostEqual(np.nanmin(out_y), y[~np.isnan(y)].min())
+        self.assertTrue(np.all(np.diff(out_x) >= 0))
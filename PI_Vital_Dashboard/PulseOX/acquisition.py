@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from PulseOX.A2D import MCP3008Reader
+from PulseOX.ring_buffer import RingBuffer
+
+MIN_SAMPLE_RATE_HZ = 100
+MAX_SAMPLE_RATE_HZ = 1000
+DEFAULT_SAMPLE_RATE_HZ = 250
+DEFAULT_BUFFER_SECONDS = 10
+
+
+def sample_dtype(n_channels):
+    """Record layout used by the acquisition ring: monotonic timestamp + raw ADC values"""
+    return np.dtype([("t", np.float64), ("raw", np.uint16, (n_channels,))])
+
+
+class AcquisitionEngine:
+    """
+    Samples an ADC reader at a fixed rate on a background thread
+
+    Sample times are scheduled on time.monotonic() as start + k * period, so
+    a late sample does not push back the ones after it. Each sample is
+    written with its timestamp into a RingBuffer that consumers (DSP, GUI,
+    uplink) read as zero-copy views with buffer.view() or read_since().
+
+    Counters:
+        samples: Samples written to the buffer
+        overruns: Times the loop fell at least a whole period behind
+        dropped: Sample slots skipped to catch up after an overrun
+        jitter: Lateness of each sample against its scheduled time
+    """
+
+    def __init__(self, reader, rate_hz=DEFAULT_SAMPLE_RATE_HZ, buffer_seconds=DEFAULT_BUFFER_SECONDS,
+                 clock=time.monotonic):
+        """
+        Args:
+            reader: Object with a `channels` tuple and read_channels(out) (e.g. MCP3008Reader)
+            rate_hz: Sample rate, between MIN_SAMPLE_RATE_HZ and MAX_SAMPLE_RATE_HZ
+            buffer_seconds: How much history the ring buffer holds
+            clock: Monotonic clock returning seconds
+        """
+        if not MIN_SAMPLE_RATE_HZ <= rate_hz <= MAX_SAMPLE_RATE_HZ:
+            raise ValueError(f"rate_hz must be between {MIN_SAMPLE_RATE_HZ} and "
+                             f"{MAX_SAMPLE_RATE_HZ} Hz, got {rate_hz}")
+        self.reader = reader
+        self.rate_hz = float(rate_hz)
+        self.period = 1.0 / self.rate_hz
+        self.clock = clock
+        self.channels = tuple(reader.channels)
+        self.buffer = RingBuffer(int(self.rate_hz * buffer_seconds), dtype=sample_dtype(len(self.channels)))
+
+        self.samples = 0
+        self.overruns = 0
+        self.dropped = 0
+        self.jitter_last = 0.0
+        self.jitter_max = 0.0
+        self._jitter_total = 0.0
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Start sampling on a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="AcquisitionEngine", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stop sampling and wait for the thread to exit"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        clock = self.clock
+        period = self.period
+        stop_event = self._stop_event
+        buffer = self.buffer
+        row = np.zeros(len(self.channels), dtype=np.uint16)
+        record = np.zeros((), dtype=buffer.dtype)
+
+        next_t = clock()
+        while not stop_event.is_set():
+            delay = next_t - clock()
+            if delay > 0:
+                time.sleep(delay)
+
+            t = clock()
+            self.reader.read_channels(out=row)
+            record["t"] = t
+            record["raw"] = row
+            buffer.append(record)
+            self.samples += 1
+
+            jitter = t - next_t
+            self.jitter_last = jitter
+            self._jitter_total += jitter
+            if jitter > self.jitter_max:
+                self.jitter_max = jitter
+
+            next_t += period
+            behind = clock() - next_t
+            if behind >= period:
+                # Skip the slots we can no longer take on time instead of bursting to catch up
+                missed = int(behind / period)
+                self.overruns += 1
+                self.dropped += missed
+                next_t += missed * period
+
+    def read_since(self, cursor):
+        """
+        Samples written since cursor as zero-copy views
+
+        Returns:
+            (timestamps, raw, new_cursor, dropped) where raw has one column per channel
+        """
+        view, cursor, dropped = self.buffer.read_since(cursor)
+        return view["t"], view["raw"], cursor, dropped
+
+    def stats(self):
+        """Snapshot of the timing counters"""
+        return {
+            "rate_hz": self.rate_hz,
+            "samples": self.samples,
+            "overruns": self.overruns,
+            "dropped": self.dropped,
+            "jitter_last_ms": self.jitter_last * 1000.0,
+            "jitter_mean_ms": (self._jitter_total / self.samples * 1000.0) if self.samples else 0.0,
+            "jitter_max_ms": self.jitter_max * 1000.0,
+        }
+
+
+# Run the engine and print its counters once per second
+# Usage (from PI_Vital_Dashboard): python -m PulseOX.acquisition --rate 500
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fixed-rate MCP3008 acquisition test")
+    parser.add_argument("--rate", type=float, default=DEFAULT_SAMPLE_RATE_HZ, help="sample rate in Hz")
+    parser.add_argument("--channels", type=int, nargs="+", default=[0], help="MCP3008 channels to sample")
+    parser.add_argument("--seconds", type=float, default=10, help="how long to run")
+    args = parser.parse_args()
+
+    with MCP3008Reader(channels=args.channels) as reader:
+        engine = AcquisitionEngine(reader, rate_hz=args.rate)
+        engine.start()
+        try:
+            end = time.monotonic() + args.seconds
+            while time.monotonic() < end:
+                time.sleep(1)
+                stats = engine.stats()
+                latest = engine.buffer.view(1)
+                print(f"samples={stats['samples']} overruns={stats['overruns']} dropped={stats['dropped']} "
+                      f"jitter mean={stats['jitter_mean_ms']:.3f}ms max={stats['jitter_max_ms']:.3f}ms "
+                      f"latest={latest['raw'][0].tolist() if len(latest) else None}")
+        except KeyboardInterrupt:
+            print("\nExiting program")
+        finally:
+            engine.stop()
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def minmax_decimate(x, y, columns, x_min=None, x_max=None):
+    """
+    Reduce a sorted waveform to a min/max envelope with one pair per pixel column
+
+    Samples are split into `columns` equal-width bins over [x_min, x_max];
+    each non-empty bin becomes two points at the bin's first sample, its
+    minimum then its maximum. Drawn as a line this looks the same as the
+    full waveform at that width, so rendering cost depends on the plot
+    width instead of the sample count. NaNs are ignored unless a whole bin
+    is NaN, which keeps signal gaps visible.
+
+    Args:
+        x: Sorted sample times
+        y: Sample values
+        columns: Number of bins, normally the plot width in pixels
+        x_min: Left edge of the first bin (default x[0])
+        x_max: Right edge of the last bin (default x[-1])
+
+    Returns:
+        (x, y) arrays of at most 2 * columns points; the inputs unchanged if
+        they are already that short
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    columns = int(columns)
+    if len(x) <= 2 * columns or columns < 1:
+        return x, y
+    x_min = x[0] if x_min is None else x_min
+    x_max = x[-1] if x_max is None else x_max
+    if x_max <= x_min:
+        return x, y
+
+    # First sample of every bin, then keep only bins that contain samples
+    edges = x_min + (x_max - x_min) * np.arange(columns) / columns
+    starts = np.unique(np.searchsorted(x, edges, side="left"))
+    starts = starts[starts < len(x)]
+
+    low = np.fmin.reduceat(y, starts)
+    high = np.fmax.reduceat(y, starts)
+    out_x = np.repeat(x[starts], 2)
+    out_y = np.empty(2 * len(starts))
+    out_y[0::2] = low
+    out_y[1::2] = high
+    return out_x, out_y
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+from collections import deque
+
+import numpy as np
+
+from PulseOX.synthetic import synthetic_ppg
+from PulseOX.raw_recording import RAW_EXTENSION, RawReplayer
+
+MIN_BPM = 30
+MAX_BPM = 220
+
+# Band-pass made of two moving averages: the short one smooths noise, the
+# long one tracks the baseline that gets subtracted
+SMOOTHING_SECONDS = 0.04
+BASELINE_SECONDS = 0.75
+
+THRESHOLD_FRACTION = 0.5   # a peak must reach this fraction of the amplitude envelope
+ENVELOPE_HALF_LIFE = 2.0   # seconds for the envelope to halve without a beat
+ENVELOPE_SMOOTHING = 0.25  # weight of each new beat in the envelope
+INTERVALS_AVERAGED = 4
+RATE_CHANGE_FRACTION = 0.2  # an interval this far off the average restarts the average
+
+
+class HeartRateDetector:
+    """
+    Streaming pulse-peak detector for photodiode (PPG) samples
+
+    Blocks of samples go through a band-pass filter and local-maximum
+    search in NumPy. Only the few candidate peaks per second are looked at
+    in Python, where an adaptive threshold and a refractory period decide
+    which are beats. Filter tails, the threshold envelope and recent
+    beat-to-beat intervals carry over between blocks, so a block boundary
+    never splits or doubles a beat.
+
+    The rate is the mean of the last INTERVALS_AVERAGED intervals. An
+    interval more than RATE_CHANGE_FRACTION away from that mean restarts
+    the average, so a real rate change shows up on the next beat. A single
+    interval close to twice the mean is treated as one missed beat instead;
+    if the next one is about twice the mean too, the rate really halved and
+    the average restarts from the two of them.
+    """
+
+    def __init__(self, sample_rate_hz):
+        """
+        Args:
+            sample_rate_hz: Rate of the incoming samples
+        """
+        self.rate = float(sample_rate_hz)
+        self.short_len = max(1, int(round(self.rate * SMOOTHING_SECONDS)))
+        self.long_len = max(self.short_len + 1, int(round(self.rate * BASELINE_SECONDS)))
+        self.refractory = int(self.rate * 60.0 / MAX_BPM)
+        self.max_interval = int(self.rate * 60.0 / MIN_BPM)
+        self.envelope_decay = 0.5 ** (1.0 / (ENVELOPE_HALF_LIFE * self.rate))
+        self.reset()
+
+    def reset(self):
+        """Forget all filter state and beats"""
+        self.samples_seen = 0
+        self._raw_tail = np.zeros(0)
+        self._filtered_tail = np.zeros(0)  # last two filtered samples, for peak edges
+        self.envelope = 0.0
+        self._envelope_index = 0
+        self.last_beat = None  # absolute sample index of the last accepted beat
+        self._previous_beat = None  # the beat before it
+        self._last_height = 0.0
+        self.intervals = deque(maxlen=INTERVALS_AVERAGED)
+        self._doubled = None  # last interval if it was taken as a missed beat
+        self._before_interval = None  # (intervals, hr, _doubled) before the last interval was added
+        self.hr = None
+        self.beats = 0
+
+    def _filter(self, block):
+        # Moving averages over the raw tail + block via one cumulative sum;
+        # output only for the samples of this block
+        ext = np.concatenate((self._raw_tail, block))
+        self._raw_tail = ext[-(self.long_len - 1):]
+        csum = np.concatenate(([0.0], np.cumsum(ext)))
+        ends = np.arange(len(ext) - len(block), len(ext)) + 1
+        short_start = np.maximum(ends - self.short_len, 0)
+        long_start = np.maximum(ends - self.long_len, 0)
+        short = (csum[ends] - csum[short_start]) / (ends - short_start)
+        long = (csum[ends] - csum[long_start]) / (ends - long_start)
+        return short - long
+
+    def process_block(self, block):
+        """
+        Add a block of samples
+
+        Args:
+            block: 1-D array of samples (raw ADC units)
+
+        Returns:
+            The current heart rate in bpm, or None until two beats are found
+        """
+        block = np.asarray(block, dtype=np.float64)
+        if len(block) == 0:
+            return self.hr
+        filtered = self._filter(block)
+
+        # Local maxima, including one that straddles the previous block edge
+        ext = np.concatenate((self._filtered_tail, filtered))
+        offset = self.samples_seen - len(self._filtered_tail)
+        self.samples_seen += len(block)
+        self._filtered_tail = ext[-2:]
+        if len(ext) < 3:
+            return self.hr
+        is_peak = (ext[1:-1] > ext[:-2]) & (ext[1:-1] >= ext[2:]) & (ext[1:-1] > 0)
+        candidates = np.nonzero(is_peak)[0] + 1
+
+        for position, height in zip((candidates + offset).tolist(), ext[candidates].tolist()):
+            self._consider(position, height)
+        return self.hr
+
+    def _consider(self, index, height):
+        envelope = self.envelope * self.envelope_decay ** (index - self._envelope_index)
+        if height < THRESHOLD_FRACTION * envelope:
+            return
+        if self.last_beat is not None and index - self.last_beat < self.refractory:
+            # Keep the taller of two peaks inside one refractory period, and
+            # redo the interval that ended at the shorter one
+            if height > self._last_height:
+                if self._before_interval is not None:
+                    intervals, self.hr, self._doubled = self._before_interval
+                    self.intervals = deque(intervals, maxlen=INTERVALS_AVERAGED)
+                    self._add_interval(index - self._previous_beat)
+                self.last_beat = index
+                self._last_height = height
+                self._update_envelope(index, height)
+            return
+
+        self._before_interval = None
+        if self.last_beat is not None:
+            self._add_interval(index - self.last_beat)
+        self._previous_beat = self.last_beat
+        self.last_beat = index
+        self._last_height = height
+        self.beats += 1
+        self._update_envelope(index, height)
+
+    def _update_envelope(self, index, height):
+        decayed = self.envelope * self.envelope_decay ** (index - self._envelope_index)
+        if height > decayed:
+            self.envelope = height
+        else:
+            self.envelope = decayed * (1 - ENVELOPE_SMOOTHING) + height * ENVELOPE_SMOOTHING
+        self._envelope_index = index
+
+    def _add_interval(self, interval):
+        self._before_interval = (tuple(self.intervals), self.hr, self._doubled)
+        doubled, self._doubled = self._doubled, None
+        if interval > self.max_interval:
+            # Signal dropped out; start over rather than average across the gap
+            self.intervals.clear()
+            return
+        if self.intervals:
+            mean = sum(self.intervals) / len(self.intervals)
+            if 1.7 * mean <= interval <= 2.3 * mean:
+                if doubled is None:
+                    self._doubled = interval
+                    interval /= 2.0  # one beat was missed
+                else:
+                    # Twice in a row: the rate halved
+                    self.intervals.clear()
+                    self.intervals.append(doubled)
+            elif abs(interval - mean) > RATE_CHANGE_FRACTION * mean:
+                self.intervals.clear()
+        self.intervals.append(interval)
+        self.hr = 60.0 * self.rate * len(self.intervals) / sum(self.intervals)
+
+
+def benchmark_throughput(rate_hz=500, seconds=300, block_size=50, samples=None):
+    """
+    Measure how many samples per second HeartRateDetector can process
+
+    Args:
+        rate_hz: Sample rate of the waveform
+        seconds: Length of the synthetic waveform (ignored if samples are given)
+        block_size: Samples per process_block() call
+        samples: Optional recorded waveform to use instead of synthetic data
+
+    Returns:
+        dict with samples/second and the multiple of real time achieved
+    """
+    if samples is None:
+        samples = synthetic_ppg(rate_hz, seconds, bpm=(np.array([0, seconds]), np.array([60, 120])), seed=0)
+    detector = HeartRateDetector(rate_hz)
+
+    start = time.perf_counter()
+    for i in range(0, len(samples), block_size):
+        detector.process_block(samples[i:i + block_size])
+    elapsed = time.perf_counter() - start
+
+    throughput = len(samples) / elapsed
+    results = {
+        "samples_per_s": throughput,
+        "realtime_factor": throughput / rate_hz,
+        "beats": detector.beats,
+        "final_hr": detector.hr,
+    }
+    print(f"HeartRateDetector: {len(samples)} samples at {rate_hz} Hz in blocks of {block_size}")
+    print(f"Throughput  | {throughput:12.0f} samples/s ({results['realtime_factor']:.0f}x real time)")
+    print(f"Beats found | {detector.beats:12d} (final HR {detector.hr:.1f} bpm)" if detector.hr
+          else f"Beats found | {detector.beats:12d}")
+    return results
+
+
+# Usage (from PI_Vital_Dashboard): python -m PulseOX.heart_rate --rate 500
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HeartRateDetector throughput benchmark")
+    parser.add_argument("--rate", type=float, default=500, help="sample rate in Hz")
+    parser.add_argument("--seconds", type=float, default=300, help="length of the synthetic waveform")
+    parser.add_argument("--block", type=int, default=50, help="samples per block")
+    parser.add_argument("--file", help=f"recorded waveform instead of synthetic data: a {RAW_EXTENSION} "
+                                       "recording (last channel is used) or a text file with one sample per line")
+    args = parser.parse_args()
+
+    recorded = None
+    rate = args.rate
+    if args.file and args.file.endswith(RAW_EXTENSION):
+        replayer = RawReplayer(args.file)
+        recorded = replayer.records["raw"][:, -1]
+        rate = replayer.rate_hz
+    elif args.file:
+        recorded = np.loadtxt(args.file)
+    benchmark_throughput(rate, args.seconds, args.block, recorded)
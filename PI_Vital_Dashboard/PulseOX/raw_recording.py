@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+
+"""
+Raw ADC recording format (.adc)
+
+A 32 byte little-endian header followed by fixed-size records:
+
+    header: magic "NORAADC1" | uint16 version | uint16 channel count |
+            float32 sample rate | 8 x uint8 channel numbers | float64 wall-clock start
+    record: float64 monotonic timestamp | uint16 raw value per channel
+
+Records are the acquisition ring buffer's own layout, so recording is a
+straight write of ring buffer views and replay is a NumPy memmap.
+
+Timestamps are time.monotonic() of the recording session, so each session
+goes to its own file. Files written before that may hold several sessions
+appended together; replay splits them where the timestamps step back or
+jump by more than SESSION_GAP_SECONDS.
+"""
+
+import argparse
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from PulseOX.A2D import MCP3008Reader
+from PulseOX.acquisition import AcquisitionEngine, sample_dtype
+from PulseOX.ring_buffer import RingBuffer
+
+RAW_MAGIC = b"NORAADC1"
+RAW_VERSION = 1
+RAW_EXTENSION = ".adc"
+HEADER_FORMAT = "<8sHHf8sd"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SESSION_GAP_SECONDS = 1.0 # a longer jump between records starts a new session
+
+
+def record_dtype(n_channels):
+    """On-disk record layout; identical to sample_dtype() on little-endian hosts"""
+    return sample_dtype(n_channels).newbyteorder("<")
+
+
+def session_path(path):
+    """`path` if it is free, else the first free capture.2.adc, capture.3.adc, ..."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return path
+    base, extension = os.path.splitext(path)
+    number = 2
+    while os.path.exists(f"{base}.{number}{extension}"):
+        number += 1
+    return f"{base}.{number}{extension}"
+
+
+def find_sessions(timestamps):
+    """
+    Returns:
+        List of (start, end) record ranges that each come from one recording session
+    """
+    if not len(timestamps):
+        return []
+    steps = np.diff(timestamps)
+    breaks = (np.nonzero((steps <= 0) | (steps > SESSION_GAP_SECONDS))[0] + 1).tolist()
+    return list(zip([0] + breaks, breaks + [len(timestamps)]))
+
+
+def read_header(path):
+    """
+    Returns:
+        dict with version, channels, rate_hz and start_time (wall clock)
+    """
+    with open(path, "rb") as file:
+        data = file.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f"{path} is too short to be a raw ADC recording")
+    magic, version, n_channels, rate_hz, channels, start_time = struct.unpack(HEADER_FORMAT, data)
+    if magic != RAW_MAGIC:
+        raise ValueError(f"{path} is not a raw ADC recording")
+    if version != RAW_VERSION:
+        raise ValueError(f"{path} has unsupported version {version}")
+    return {
+        "version": version,
+        "channels": tuple(channels[:n_channels]),
+        "rate_hz": rate_hz,
+        "start_time": start_time,
+    }
+
+
+class RawRecorder:
+    """
+    Writes timestamped raw samples from an AcquisitionEngine to a .adc file
+
+    Every recorder starts a new file (see session_path()), since its
+    monotonic timestamps mean nothing next to another session's. Runs on
+    its own thread and copies whatever the engine has written since
+    the last flush, so disk latency never reaches the sampling loop. Samples
+    the recorder could not keep up with are counted in `dropped`.
+    """
+
+    def __init__(self, path, channels, rate_hz, flush_interval=0.5):
+        """
+        Args:
+            path: Output file; if it already holds a recording, the next free
+                numbered name is used instead (`path` holds the name used)
+            channels: MCP3008 channel numbers being recorded
+            rate_hz: Nominal sample rate
+            flush_interval: Seconds between writes
+        """
+        self.path = session_path(path)
+        self.channels = tuple(channels)
+        self.rate_hz = rate_hz
+        self.flush_interval = flush_interval
+        self.dtype = record_dtype(len(self.channels))
+        self.records_written = 0
+        self.dropped = 0
+
+        self.file = open(self.path, "wb")
+        self.file.write(struct.pack(HEADER_FORMAT, RAW_MAGIC, RAW_VERSION, len(self.channels),
+                                    rate_hz, bytes(self.channels).ljust(8, b"\0"), time.time()))
+
+        self._engine = None
+        self._cursor = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def write(self, records):
+        """Append an array of records (sample_dtype or record_dtype)"""
+        records = np.ascontiguousarray(records, dtype=self.dtype)
+        self.file.write(records.data)
+        self.records_written += len(records)
+
+    def attach(self, engine):
+        """Start recording everything the engine samples from now on"""
+        self._engine = engine
+        self._cursor = engine.buffer.count
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="RawRecorder", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        view, self._cursor, dropped = self._engine.buffer.read_since(self._cursor)
+        self.dropped += dropped
+        if len(view):
+            self.write(view)
+            self.file.flush()
+
+    def close(self):
+        """Write out any remaining samples and close the file"""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self.file.close()
+
+
+class RawReplayer:
+    """
+    Plays a .adc recording back through the same interface as AcquisitionEngine
+
+    The file is memory-mapped, so nothing is loaded up front. start() runs a
+    thread that releases records into `buffer` at their recorded spacing
+    divided by `speed`; consumers use read_since() exactly as they would with
+    live sampling. Released timestamps are moved onto this process's
+    time.monotonic(), session by session and loop after loop, so they keep
+    increasing like live ones. iter_blocks() skips the clock entirely and
+    yields zero-copy slices of the file, with the recorded timestamps, as
+    fast as the caller can take them, for benchmarks.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False, block_seconds=0.02, buffer_seconds=10):
+        """
+        Args:
+            path: .adc recording
+            speed: Playback speed multiplier for start()
+            loop: Start over after the last record
+            block_seconds: Recorded time released per wake-up
+            buffer_seconds: History held in `buffer`
+        """
+        header = read_header(path)
+        self.path = path
+        self.channels = header["channels"]
+        self.rate_hz = header["rate_hz"]
+        self.start_time = header["start_time"]
+        self.speed = speed
+        self.loop = loop
+
+        dtype = record_dtype(len(self.channels))
+        count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+        self.sessions = find_sessions(self.records["t"])
+        self.block_size = max(1, int(self.rate_hz * block_seconds))
+        self.buffer = RingBuffer(max(self.block_size, int(self.rate_hz * buffer_seconds)),
+                                 dtype=sample_dtype(len(self.channels)))
+
+        self.samples = 0
+        self.finished = False
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        """Recorded seconds between the first and last sample of each session, added up"""
+        t = self.records["t"]
+        return float(sum(t[end - 1] - t[start] for start, end in self.sessions))
+
+    def iter_blocks(self, block_size=None):
+        """Yield (timestamps, raw) views of consecutive blocks straight from the memmap"""
+        block_size = block_size or self.block_size
+        for start in range(0, len(self.records), block_size):
+            block = self.records[start:start + block_size]
+            yield block["t"], block["raw"]
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="RawReplayer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        records = self.records
+        if not len(records):
+            self.finished = True
+            return
+        period = 1.0 / (self.rate_hz * self.speed)
+        out = np.empty(self.block_size, dtype=self.buffer.dtype)
+        wall_start = time.monotonic()
+        while True:
+            for session_start, session_end in self.sessions:
+                origin = records["t"][session_start]
+                for start in range(session_start, session_end, self.block_size):
+                    block = records[start:min(start + self.block_size, session_end)]
+                    replayed = out[:len(block)]
+                    replayed["t"] = wall_start + (block["t"] - origin) / self.speed
+                    replayed["raw"] = block["raw"]
+                    if self._stop_event.wait(max(0.0, replayed["t"][-1] - time.monotonic())):
+                        return
+                    self.buffer.extend(replayed)
+                    self.samples += len(block)
+                # The next session or loop carries on one sample after this one ended
+                wall_start = replayed["t"][-1] + period
+            if not self.loop:
+                self.finished = True
+                return
+
+    def read_since(self, cursor):
+        """Same as AcquisitionEngine.read_since()"""
+        view, cursor, dropped = self.buffer.read_since(cursor)
+        return view["t"], view["raw"], cursor, dropped
+
+    def stats(self):
+        return {
+            "rate_hz": self.rate_hz,
+            "samples": self.samples,
+            "overruns": 0,
+            "dropped": 0,
+            "jitter_last_ms": 0.0,
+            "jitter_mean_ms": 0.0,
+            "jitter_max_ms": 0.0,
+        }
+
+
+# Usage (from PI_Vital_Dashboard):
+#   python -m PulseOX.raw_recording record capture.adc --seconds 60 --channels 0 1
+#   python -m PulseOX.raw_recording info capture.adc
+#   python -m PulseOX.raw_recording replay capture.adc --speed 1
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or replay raw MCP3008 samples")
+    parser.add_argument("command", choices=("record", "info", "replay"))
+    parser.add_argument("path", help=f"recording file ({RAW_EXTENSION})")
+    parser.add_argument("--seconds", type=float, default=60, help="how long to record")
+    parser.add_argument("--rate", type=float, default=250, help="sample rate in Hz when recording")
+    parser.add_argument("--channels", type=int, nargs="+", default=[0, 1], help="channels to record")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        with MCP3008Reader(channels=args.channels) as reader:
+            engine = AcquisitionEngine(reader, rate_hz=args.rate)
+            recorder = RawRecorder(args.path, args.channels, args.rate).attach(engine)
+            engine.start()
+            try:
+                time.sleep(args.seconds)
+            except KeyboardInterrupt:
+                pass
+            engine.stop()
+            recorder.close()
+        print(f"Recorded {recorder.records_written} samples to {recorder.path} "
+              f"(dropped {recorder.dropped}, engine stats {engine.stats()})")
+
+    elif args.command == "info":
+        replayer = RawReplayer(args.path)
+        print(f"{args.path}: {len(replayer)} samples, channels {replayer.channels}, "
+              f"{replayer.rate_hz:g} Hz nominal, {replayer.duration:.1f} s in {len(replayer.sessions)} session(s), "
+              f"started {time.ctime(replayer.start_time)}")
+
+    else:
+        replayer = RawReplayer(args.path, speed=args.speed)
+        replayer.start()
+        cursor = 0
+        try:
+            while not replayer.finished:
+                time.sleep(1)
+                timestamps, raw, cursor, dropped = replayer.read_since(cursor)
+                print(f"replayed={replayer.samples} new={len(raw)} "
+                      f"latest={raw[-1].tolist() if len(raw) else None}")
+        except KeyboardInterrupt:
+            replayer.stop()
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-capacity circular buffer backed by a preallocated NumPy array
+
+    Every item is stored twice, at slot i and slot i + capacity, so any run
+    of up to `capacity` consecutive items is a single contiguous slice of the
+    storage. Readers get those slices as views, oldest item first, without
+    copying.
+
+    One writer thread and any number of reader threads can share a buffer
+    without locks: the writer fills both slots before publishing the new
+    count, and readers only look at items below the count they read. Views
+    stay valid until the writer wraps around onto them; copy a view if it
+    has to outlive `capacity` further writes.
+    """
+
+    def __init__(self, capacity, dtype=np.float64, shape=()):
+        """
+        Args:
+            capacity: Number of items kept before the oldest is overwritten
+            dtype: NumPy dtype of each item (structured dtypes are allowed)
+            shape: Shape of each item, () for scalars
+        """
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.capacity = int(capacity)
+        self._data = np.zeros((2 * self.capacity,) + tuple(shape), dtype=dtype)
+        self.count = 0  # total items ever written; only the writer changes it
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, item):
+        """Write one item, overwriting the oldest once the buffer is full"""
+        slot = self.count % self.capacity
+        self._data[slot] = item
+        self._data[slot + self.capacity] = item
+        self.count += 1
+
+    def extend(self, items):
+        """Write a block of items with at most two slice copies per mirror"""
+        items = np.asarray(items, dtype=self._data.dtype)
+        n = len(items)
+        if n == 0:
+            return
+        if n > self.capacity:
+            # Only the newest `capacity` items survive; skip writing the rest
+            self.count += n - self.capacity
+            items = items[-self.capacity:]
+            n = self.capacity
+
+        cap = self.capacity
+        start = self.count % cap
+        first = min(n, cap - start)
+        self._data[start:start + first] = items[:first]
+        self._data[start + cap:start + cap + first] = items[:first]
+        rest = n - first
+        if rest:
+            self._data[:rest] = items[first:]
+            self._data[cap:cap + rest] = items[first:]
+        self.count += n
+
+    def window(self, start, stop):
+        """
+        View of the items with absolute indices [start, stop)
+
+        Indices count every item ever written. The range must lie within the
+        last `capacity` items.
+        """
+        if stop > self.count or stop - start > self.capacity or start > stop or start < 0:
+            raise IndexError(f"window [{start}, {stop}) is not held by the buffer "
+                             f"(count={self.count}, capacity={self.capacity})")
+        slot = start % self.capacity
+        return self._data[slot:slot + (stop - start)]
+
+    def view(self, n=None):
+        """View of the newest n items (all held items by default), oldest first"""
+        stop = self.count
+        held = min(stop, self.capacity)
+        n = held if n is None else min(n, held)
+        return self.window(stop - n, stop)
+
+    def read_since(self, cursor, stop=None):
+        """
+        View of everything written since a reader's cursor
+
+        Args:
+            cursor: Absolute index of the first item the reader has not seen
+            stop: Optional absolute index to read up to (defaults to count)
+
+        Returns:
+            (view, new_cursor, dropped) where dropped is the number of items
+            that were overwritten before the reader got to them
+        """
+        stop = self.count if stop is None else stop
+        dropped = 0
+        oldest = stop - min(stop, self.capacity)
+        if cursor < oldest:
+            dropped = oldest - cursor
+            cursor = oldest
+        return self.window(cursor, stop), stop, dropped
+
+    def clear(self):
+        """Forget all items (only call from the writer thread)"""
+        self.count = 0
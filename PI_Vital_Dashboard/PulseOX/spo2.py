@@ -0,0 +1,213 @@
+from collections import deque
+
+import numpy as np
+
+from PulseOX.ring_buffer import RingBuffer
+
+# Defaults match pulseOximeterSpO2.ino, which takes one RED/IR pair every
+# 100 ms: min/max over BUFFER_SIZE (80) pairs and a 15 pair moving average.
+DEFAULT_WINDOW_SECONDS = 8.0
+DEFAULT_SMOOTHING_SECONDS = 1.5
+
+# Empirical calibration from the Arduino sketch: SpO2 = 110 - 25 * R
+SPO2_INTERCEPT = 110.0
+SPO2_SLOPE = 25.0
+
+
+class SlidingWindow:
+    """
+    Min, max and mean of the last `size` samples, updated in O(1) per sample
+
+    Min and max come from monotonic deques of (index, value) pairs and the
+    mean from a running sum, instead of rescanning the window the way
+    findMinMax() and movingAverage() do in the Arduino sketch.
+
+    extend() takes a whole block at once: the block's contribution to the
+    deques and the sum is worked out with NumPy, so only the handful of
+    samples that can still become the min or max touch Python code.
+    """
+
+    def __init__(self, size, track_extremes=True):
+        """
+        Args:
+            size: Number of samples in the window
+            track_extremes: Keep min/max deques (mean-only windows can skip them)
+        """
+        if size <= 0:
+            raise ValueError(f"size must be positive, got {size}")
+        self.size = int(size)
+        self.track_extremes = track_extremes
+        self.history = RingBuffer(self.size)
+        self.total = 0.0
+        self._min = deque()  # (index, value), values increasing
+        self._max = deque()  # (index, value), values decreasing
+        self._pushes_since_resum = 0
+
+    def __len__(self):
+        return len(self.history)
+
+    @property
+    def index(self):
+        """Absolute index of the next sample"""
+        return self.history.count
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else None
+
+    @property
+    def mean(self):
+        held = len(self.history)
+        return self.total / held if held else None
+
+    def push(self, value):
+        """Add one sample"""
+        value = float(value)
+        index = self.history.count
+        if len(self.history) == self.size:
+            self.total -= self.history.view(self.size)[0]
+        self.history.append(value)
+        self.total += value
+        self._resum_if_due(1)
+
+        if self.track_extremes:
+            low, high = self._min, self._max
+            while low and low[-1][1] >= value:
+                low.pop()
+            low.append((index, value))
+            while high and high[-1][1] <= value:
+                high.pop()
+            high.append((index, value))
+            self._expire(index)
+
+    def extend(self, block):
+        """Add a block of samples"""
+        block = np.asarray(block, dtype=np.float64)
+        n = len(block)
+        if n == 0:
+            return
+        start = self.history.count
+
+        # Running sum: add the block, subtract whatever it pushes out of the window
+        held = len(self.history)
+        evicted = max(0, held + n - self.size)
+        if evicted:
+            from_history = min(evicted, held)
+            self.total -= self.history.view(held)[:from_history].sum()
+            if evicted > held:
+                self.total -= block[:evicted - held].sum()
+        self.total += block.sum()
+        self.history.extend(block)
+        self._resum_if_due(n)
+
+        if self.track_extremes:
+            indices = np.arange(start, start + n)
+            self._merge(self._min, block, indices, np.minimum, np.inf, np.less, np.greater_equal)
+            self._merge(self._max, block, indices, np.maximum, -np.inf, np.greater, np.less_equal)
+            self._expire(start + n - 1)
+
+    @staticmethod
+    def _merge(dq, block, indices, accumulate, sentinel, keeps, pops):
+        # A sample stays in a monotonic deque only if it beats every later sample,
+        # so after the block the survivors are the block's strict suffix extremes
+        suffix = accumulate.accumulate(block[::-1])[::-1]
+        later = np.append(suffix[1:], sentinel)
+        survivors = keeps(block, later)
+
+        block_extreme = suffix[0]
+        while dq and pops(dq[-1][1], block_extreme):
+            dq.pop()
+        dq.extend(zip(indices[survivors].tolist(), block[survivors].tolist()))
+
+    def _expire(self, newest_index):
+        oldest = newest_index - self.size
+        while self._min and self._min[0][0] <= oldest:
+            self._min.popleft()
+        while self._max and self._max[0][0] <= oldest:
+            self._max.popleft()
+
+    def _resum_if_due(self, n):
+        # Recompute the sum from the window once per window length so float
+        # rounding from the add/subtract updates cannot accumulate
+        self._pushes_since_resum += n
+        if self._pushes_since_resum >= self.size:
+            self.total = float(self.history.view().sum())
+            self._pushes_since_resum = 0
+
+
+class SpO2Estimator:
+    """
+    Streaming SpO2 from RED and IR photodiode samples (R-ratio method)
+
+    Port of the calculation in pulseOximeterSpO2.ino:
+        R = ((maxRED - minRED) / meanRED) / ((maxIR - minIR) / meanIR)
+        SpO2 = 110 - 25 * R
+
+    Window lengths are given in seconds so the estimate does not change
+    with the sample rate. push() costs O(1) per RED/IR pair; process_block()
+    takes arrays straight from the acquisition ring buffer.
+    """
+
+    def __init__(self, sample_rate_hz, window_seconds=DEFAULT_WINDOW_SECONDS,
+                 smoothing_seconds=DEFAULT_SMOOTHING_SECONDS):
+        """
+        Args:
+            sample_rate_hz: Rate of RED/IR pairs
+            window_seconds: Span of the min/max window
+            smoothing_seconds: Span of the moving average
+        """
+        window = max(2, int(round(sample_rate_hz * window_seconds)))
+        smoothing = max(1, int(round(sample_rate_hz * smoothing_seconds)))
+        self.red_range = SlidingWindow(window)
+        self.ir_range = SlidingWindow(window)
+        self.red_mean = SlidingWindow(smoothing, track_extremes=False)
+        self.ir_mean = SlidingWindow(smoothing, track_extremes=False)
+
+    def push(self, red, ir):
+        """Add one RED/IR pair and return the current estimate"""
+        self.red_range.push(red)
+        self.ir_range.push(ir)
+        self.red_mean.push(red)
+        self.ir_mean.push(ir)
+        return self.spo2
+
+    def process_block(self, red, ir):
+        """Add equal-length RED and IR arrays and return the estimate after the block"""
+        self.red_range.extend(red)
+        self.ir_range.extend(ir)
+        self.red_mean.extend(red)
+        self.ir_mean.extend(ir)
+        return self.spo2
+
+    def reset(self):
+        """Drop all samples, e.g. when the probe is reattached"""
+        for window in (self.red_range, self.ir_range, self.red_mean, self.ir_mean):
+            window.__init__(window.size, window.track_extremes)
+
+    @property
+    def ready(self):
+        """True once the moving averages are full"""
+        return len(self.red_mean) == self.red_mean.size
+
+    @property
+    def ratio(self):
+        """Current R value, or None if it cannot be computed yet"""
+        if not self.ready:
+            return None
+        red_mean, ir_mean = self.red_mean.mean, self.ir_mean.mean
+        ir_swing = self.ir_range.max - self.ir_range.min
+        if red_mean <= 0 or ir_mean <= 0 or ir_swing <= 0:
+            return None
+        return ((self.red_range.max - self.red_range.min) / red_mean) / (ir_swing / ir_mean)
+
+    @property
+    def spo2(self):
+        """Current SpO2 percentage clamped to 0-100, or None while warming up"""
+        ratio = self.ratio
+        if ratio is None:
+            return None
+        return min(100.0, max(0.0, SPO2_INTERCEPT - SPO2_SLOPE * ratio))
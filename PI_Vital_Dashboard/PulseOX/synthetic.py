@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def synthetic_ppg(rate_hz, seconds, bpm=72.0, amplitude=40.0, baseline=600.0, noise=2.0,
+                  wander=10.0, seed=None):
+    """
+    Generate a photoplethysmogram-like waveform in raw ADC units (0-1023)
+
+    Each beat is a fast systolic upstroke followed by a smaller dicrotic
+    wave, on top of slow baseline wander and white noise.
+
+    Args:
+        rate_hz: Sample rate
+        seconds: Length of the waveform
+        bpm: Heart rate; a (times, bpms) pair of arrays gives a rate that
+            changes over time by linear interpolation
+        amplitude: Peak-to-trough swing of a beat
+        baseline: DC level
+        noise: Standard deviation of the added noise
+        wander: Amplitude of the 0.2 Hz baseline wander
+        seed: Seed for the noise generator
+
+    Returns:
+        float64 array of samples
+    """
+    n = int(rate_hz * seconds)
+    t = np.arange(n) / rate_hz
+    if isinstance(bpm, tuple):
+        rate = np.interp(t, np.asarray(bpm[0], dtype=float), np.asarray(bpm[1], dtype=float))
+    else:
+        rate = np.full(n, float(bpm))
+
+    # Beat phase in [0, 1) from the integrated instantaneous rate
+    phase = np.cumsum(rate / 60.0) / rate_hz
+    phase -= np.floor(phase)
+    systolic = np.exp(-((phase - 0.15) / 0.06) ** 2)
+    dicrotic = 0.35 * np.exp(-((phase - 0.45) / 0.08) ** 2)
+
+    rng = np.random.default_rng(seed)
+    signal = baseline + amplitude * (systolic + dicrotic)
+    signal += wander * np.sin(2 * np.pi * 0.2 * t)
+    signal += rng.normal(0.0, noise, n)
+    return np.clip(signal, 0, 1023)
+
+
+def synthetic_red_ir(rate_hz, seconds, bpm=72.0, spo2=97.0, seed=None):
+    """
+    Generate a RED/IR pair whose R-ratio corresponds to the given SpO2
+
+    Uses the same calibration as SpO2Estimator (SpO2 = 110 - 25 * R).
+
+    Returns:
+        (red, ir) float64 arrays
+    """
+    ratio = (110.0 - spo2) / 25.0
+    ir_dc, ir_ac = 600.0, 40.0
+    red_dc = 500.0
+    red_ac = ratio * ir_ac / ir_dc * red_dc
+    ir = synthetic_ppg(rate_hz, seconds, bpm=bpm, amplitude=ir_ac, baseline=ir_dc,
+                       noise=0.5, wander=0.0, seed=seed)
+    red = synthetic_ppg(rate_hz, seconds, bpm=bpm, amplitude=red_ac, baseline=red_dc,
+                        noise=0.5, wander=0.0, seed=None if seed is None else seed + 1)
+    return red, ir
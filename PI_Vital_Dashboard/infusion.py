@@ -0,0 +1,172 @@
+"""
+Infusion volume integration
+
+update_volume_given() used to add flow_rate / 60 per call and assumed the
+calls were exactly one second apart, so a stalled Tk loop under-counted the
+volume delivered and the target-volume stop could land up to a second of
+flow late.
+
+InfusionIntegrator integrates the flow rate against measured
+time.monotonic() intervals on its own thread, `rate_hz` times a second,
+independent of the GUI. The flow rate is treated as constant between
+samples, so a change is picked up within one step. While a target is set it
+also predicts when the target will be reached and sleeps until exactly then
+instead of until the next step, so the stop lands within the thread's wake
+latency (typically well under a millisecond) of the true crossing.
+"""
+
+import threading
+import time
+
+DEFAULT_RATE_HZ = 50
+
+
+class InfusionIntegrator:
+    """
+    Volume delivered by a pump running at a time-varying flow rate
+
+    The flow rate, target and running state are read through callables so
+    the integrator always sees the values the rest of NORA is using.
+
+    Counters:
+        steps: Integration steps taken
+        targets_reached: Times the target volume was reached
+        stop_error_last: Seconds between the predicted target time and the
+            step that acted on it
+        stop_error_max: Largest stop_error_last so far
+    """
+
+    def __init__(self, flow_rate, target, running, rate_hz=DEFAULT_RATE_HZ, on_target=None, clock=time.monotonic):
+        """
+        Args:
+            flow_rate: Callable returning the flow rate in μL/min
+            target: Callable returning the target volume in μL; 0 or less for none
+            running: Callable returning whether the pump is delivering
+            rate_hz: Integration steps per second
+            on_target: Called with the volume, on the integrator thread, when the target is reached
+            clock: Function returning seconds; time.monotonic unless testing
+        """
+        self.flow_rate = flow_rate
+        self.target = target
+        self.running = running
+        self.period = 1.0 / rate_hz
+        self.on_target = on_target
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._volume = 0.0
+        self._rate = 0.0          # μL/s in effect since the last step
+        self._delivering = False  # whether the pump was delivering since the last step
+        self._last = clock()
+        self._predicted = None    # clock time the target is expected, if a step was timed to it
+        self._target_reached = False
+
+        self.steps = 0
+        self.targets_reached = 0
+        self.stop_error_last = 0.0
+        self.stop_error_max = 0.0
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+
+    @property
+    def volume(self):
+        """Volume delivered in μL, including the time since the last step"""
+        with self._lock:
+            volume = self._volume
+            if self._delivering and not self._target_reached:
+                volume += self._rate * (self.clock() - self._last)
+            target = self.target()
+            if target > 0 and volume > target:
+                volume = target
+            return volume
+
+    def reset(self, volume=0.0):
+        """Start counting again from `volume` (a new procedure)"""
+        with self._lock:
+            self._volume = volume
+            self._last = self.clock()
+            self._predicted = None
+            self._target_reached = False
+        self._wake.set()
+
+    def step(self):
+        """
+        Integrate up to now and pick up the current flow rate, target and running state
+
+        Returns:
+            Seconds until the next step should run
+        """
+        reached = None
+        with self._lock:
+            now = self.clock()
+            if self._delivering and not self._target_reached:
+                self._volume += self._rate * (now - self._last)
+            self._last = now
+            self._rate = max(0.0, self.flow_rate()) / 60.0
+            self._delivering = bool(self.running())
+            target = self.target()
+            self.steps += 1
+
+            if target > 0 and self._volume >= target and self._delivering and not self._target_reached:
+                # The step was timed to land on the crossing; what is left over is wake-up latency
+                if self._predicted is not None:
+                    self.stop_error_last = now - self._predicted
+                    self.stop_error_max = max(self.stop_error_max, self.stop_error_last)
+                self._volume = target
+                self._target_reached = True
+                self.targets_reached += 1
+                reached = self._volume
+            elif target > 0 and self._volume < target:
+                self._target_reached = False # target raised after it was reached
+
+            delay = self.period
+            self._predicted = None
+            if self._delivering and not self._target_reached and target > 0 and self._rate > 0:
+                remaining = (target - self._volume) / self._rate
+                if remaining <= self.period:
+                    delay = remaining
+                    self._predicted = now + remaining
+
+        if reached is not None and self.on_target is not None:
+            try:
+                self.on_target(reached)
+            except Exception as e:
+                print(f"Error handling target volume: {e}")
+        return delay
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._last = self.clock()
+        self._thread = threading.Thread(target=self._run, name="InfusionIntegrator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        """Step now instead of at the next period (e.g. right after the flow rate changed)"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            delay = self.step()
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def stats(self):
+        return {
+            "volume": self.volume,
+            "steps": self.steps,
+            "targets_reached": self.targets_reached,
+            "stop_error_last_ms": self.stop_error_last * 1000.0,
+            "stop_error_max_ms": self.stop_error_max * 1000.0,
+        }
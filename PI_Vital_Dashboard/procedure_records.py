@@ -0,0 +1,578 @@
+"""
+Procedure records
+
+While a procedure runs, NORA logs a vitals snapshot every LOG_INTERVAL.
+ProcedureRecordWriter takes those snapshots on the Tk thread without
+touching the disk: write() only appends to a queue. A background thread
+wakes every `flush_interval`, formats everything queued into one write on
+a single open file and flushes it, so the file is never reopened per
+record and no descriptor is leaked.
+
+Each procedure gets its own file, ProcedureRecords/procedure-<start>.txt;
+when a file grows past `max_bytes` the writer continues in
+procedure-<start>.2.txt and so on. Every record is one line:
+
+    2024-05-01T14:03:07.123456 hr=72 spo2=98 bp=120/80
+
+with "None" for a vital that was unavailable. iter_records() streams these
+files as well as the older output.txt blocks (a timestamp line followed by
+HR:, O2: and BP: lines).
+
+ProcedureRecordReader answers time-range and summary queries without
+scanning the whole file. The first time it opens a file it streams it once
+and saves a sidecar index (<file>.idx) holding the time and byte offset of
+every INDEX_STRIDE-th record; a query bisects the index, seeks to the
+nearest entry before the range and reads only from there to the end of
+the range. When the file has grown since, only the new part is indexed.
+
+The fsync policy trades durability for SD card wear:
+    always: fsync after every batch
+    interval: fsync at most every `fsync_interval` seconds (default)
+    close: fsync only when a file is rotated or the procedure ends
+    never: leave it to the OS
+"""
+
+import argparse
+import bisect
+import datetime
+import os
+import random
+import re
+import threading
+import time
+from array import array
+from collections import deque
+
+DEFAULT_DIRECTORY = "ProcedureRecords"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0 # seconds
+DEFAULT_FSYNC_INTERVAL = 5.0 # seconds, for the "interval" policy
+FSYNC_POLICIES = ("always", "interval", "close", "never")
+RECORD_PATTERN = re.compile(r"^(\S+) hr=(\S+) spo2=(\S+) bp=(\S+)$")
+INDEX_STRIDE = 64 # records between index entries
+INDEX_VERSION = 1
+EPOCH = datetime.datetime(1970, 1, 1) # index times are seconds since this, in the file's own (local) time
+VITAL_FIELDS = ("hr", "spo2", "bp_sys", "bp_dia")
+
+
+def _format_vital(value):
+    return "None" if value is None else str(int(value))
+
+
+def format_record(timestamp, snapshot):
+    """
+    One record line for a snapshot
+
+    Args:
+        timestamp: datetime of the snapshot
+        snapshot: dict with hr, spo2 and bp ((sys, dia) or None)
+    """
+    bp = snapshot.get("bp")
+    bp_text = f"{int(bp[0])}/{int(bp[1])}" if bp is not None else "None"
+    return (f"{timestamp.isoformat()} hr={_format_vital(snapshot.get('hr'))} "
+            f"spo2={_format_vital(snapshot.get('spo2'))} bp={bp_text}\n")
+
+
+def parse_record_line(line):
+    """
+    Returns:
+        (datetime, snapshot) for a one-line record, or None if the line is not one
+    """
+    match = RECORD_PATTERN.match(line.strip())
+    if match is None:
+        return None
+    try:
+        timestamp = datetime.datetime.fromisoformat(match.group(1))
+    except ValueError:
+        return None
+    hr, spo2, bp = match.group(2, 3, 4)
+    numbers = bp.split("/")
+    return timestamp, {
+        "hr": None if hr == "None" else int(hr),
+        "spo2": None if spo2 == "None" else int(spo2),
+        "bp": (int(numbers[0]), int(numbers[1])) if len(numbers) == 2 else None,
+    }
+
+
+def _parse_legacy_int(text):
+    try:
+        return int(float(text))
+    except ValueError:
+        return None  # vitals that were unavailable are written as "None"
+
+
+def iter_records(file, offset=0):
+    """
+    Stream records from a record file in either format
+
+    Args:
+        file: Record file opened in binary mode
+        offset: Byte offset of a record to start at
+
+    Yields:
+        (byte offset of the record, datetime, snapshot)
+    """
+    file.seek(offset)
+    position = offset
+    block_start, timestamp, snapshot = None, None, {}
+    for raw in file:
+        line_start = position
+        position += len(raw)
+        line = raw.decode("utf-8", "replace").strip()
+        if not line:
+            continue
+        record = parse_record_line(line)
+        if record is not None:
+            yield line_start, record[0], record[1]
+        elif line.startswith("HR:"):
+            snapshot["hr"] = _parse_legacy_int(line[3:])
+        elif line.startswith("O2:"):
+            snapshot["spo2"] = _parse_legacy_int(line[3:])
+        elif line.startswith("BP:"):
+            numbers = re.findall(r"\d+", line[3:])
+            snapshot["bp"] = (int(numbers[0]), int(numbers[1])) if len(numbers) >= 2 else None
+            if timestamp is not None:
+                yield block_start, timestamp, {"hr": None, "spo2": None, "bp": None, **snapshot}
+            timestamp, snapshot = None, {}
+        else:
+            try:
+                timestamp = datetime.datetime.fromisoformat(line)
+                block_start = line_start
+            except ValueError:
+                timestamp = None
+
+
+class ProcedureRecordWriter:
+    """
+    Background writer of one record file per procedure
+
+    Counters:
+        records: Records written to disk
+        batches: Write calls made
+        fsyncs: fsync calls made
+        files: Files opened, including rotations
+        errors: Failed writes; their records are dropped
+    """
+
+    extension = ".txt"
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, fsync="interval", fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        """
+        Args:
+            directory: Where record files are created
+            max_bytes: Size after which a procedure continues in a new file
+            flush_interval: Seconds between batched writes
+            fsync: One of FSYNC_POLICIES
+            fsync_interval: Least seconds between fsyncs for the "interval" policy
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}; expected one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        # Records and procedure boundaries in submission order, for the writer thread
+        self.queue = deque()
+        self._condition = threading.Condition()
+
+        self.file = None
+        self.path = None
+        self.procedure = None # base name of the current procedure's files
+        self.part = 0
+        self.size = 0 # bytes in the open file
+        self._last_fsync = 0.0
+
+        self.records = 0
+        self.batches = 0
+        self.fsyncs = 0
+        self.files = 0
+        self.errors = 0
+
+        self._thread = None
+        self._stopping = False
+
+    def start_procedure(self, started=None):
+        """Close any open procedure and send later records to a new file"""
+        started = started or datetime.datetime.now()
+        with self._condition:
+            self.queue.append(("start", started))
+            self._condition.notify()
+
+    def end_procedure(self):
+        """Write, sync and close the current procedure's file"""
+        with self._condition:
+            self.queue.append(("end", None))
+            self._condition.notify()
+
+    def write(self, snapshot, timestamp=None):
+        """Queue a snapshot for the current procedure; never blocks on the disk"""
+        self.queue.append(("record", (timestamp or datetime.datetime.now(), snapshot)))
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="ProcedureRecordWriter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Write everything queued, close the file and stop the thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._stopping:
+                    self._condition.wait(self.flush_interval)
+                stopping = self._stopping
+            self._drain()
+            if stopping:
+                self._close()
+                return
+
+    def _drain(self):
+        lines = []
+        while self.queue:
+            kind, item = self.queue.popleft()
+            if kind == "record":
+                lines.append(format_record(*item))
+                continue
+            self._write(lines)
+            lines = []
+            self._close()
+            if kind == "start":
+                self.procedure = "procedure-" + item.strftime("%Y%m%d-%H%M%S")
+                self.part = 0
+        self._write(lines)
+
+    def _open_next(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.procedure is None: # records without start_procedure(); start one now
+            self.procedure = "procedure-" + datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            self.part = 0
+        self.part += 1
+        suffix = "" if self.part == 1 else f".{self.part}"
+        self.path = os.path.join(self.directory, f"{self.procedure}{suffix}{self.extension}")
+        self.file = self._open_file(self.path)
+        self.size = self.file.tell()
+        self.files += 1
+
+    def _open_file(self, path):
+        return open(path, "a", encoding="utf-8")
+
+    def _sync(self):
+        # Flush a finished batch and fsync it as the policy allows
+        self.file.flush()
+        self.batches += 1
+        now = time.monotonic()
+        if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+            os.fsync(self.file.fileno())
+            self.fsyncs += 1
+            self._last_fsync = now
+
+    def _write(self, lines):
+        if not lines:
+            return
+        try:
+            start = 0
+            while start < len(lines):
+                if self.file is None:
+                    self._open_next()
+                elif self.size >= self.max_bytes:
+                    self._close(keep_procedure=True)
+                    self._open_next()
+                # As many lines as fit before max_bytes, and always at least one
+                end, chunk_size = start, 0
+                while end < len(lines) and (end == start or self.size + chunk_size < self.max_bytes):
+                    chunk_size += len(lines[end])
+                    end += 1
+                self.file.write("".join(lines[start:end]))
+                self.size += chunk_size
+                self.records += end - start
+                start = end
+            self._sync()
+        except OSError as e:
+            self.errors += 1
+            print(f"Error writing procedure records: {e}")
+
+    def _close(self, keep_procedure=False):
+        if self.file is None:
+            if not keep_procedure:
+                self.procedure = None
+            return
+        try:
+            self.file.flush()
+            if self.fsync != "never":
+                os.fsync(self.file.fileno())
+                self.fsyncs += 1
+            self.file.close()
+        except OSError as e:
+            self.errors += 1
+            print(f"Error closing procedure records: {e}")
+        self.file = None
+        if not keep_procedure:
+            self.procedure = None
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "pending": len(self.queue),
+            "records": self.records,
+            "batches": self.batches,
+            "fsyncs": self.fsyncs,
+            "files": self.files,
+            "errors": self.errors,
+        }
+
+
+def _seconds(timestamp):
+    return (timestamp - EPOCH).total_seconds()
+
+
+class ProcedureRecordReader:
+    """
+    Time-range and summary queries over one record file through a sidecar index
+
+    Records are expected in time order, as the writer appends them.
+    """
+
+    def __init__(self, path, index_path=None, stride=INDEX_STRIDE):
+        """
+        Args:
+            path: Record file in either format
+            index_path: Where the index is kept (default <path>.idx)
+            stride: Records between index entries when building one
+        """
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self.stride = stride
+        self.times = array("d")   # index entry times, seconds since EPOCH
+        self.offsets = array("q") # byte offset of each entry's record
+        self.indexed_size = 0     # file size the index covers
+        self.refresh()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "rb") as file:
+                header = array("q")
+                header.fromfile(file, 3)
+                version, size, count = header
+                if version != INDEX_VERSION:
+                    return False
+                times, offsets = array("d"), array("q")
+                times.fromfile(file, count)
+                offsets.fromfile(file, count)
+        except (OSError, EOFError):
+            return False
+        self.times, self.offsets, self.indexed_size = times, offsets, size
+        return True
+
+    def _save_index(self):
+        try:
+            with open(self.index_path, "wb") as file:
+                array("q", [INDEX_VERSION, self.indexed_size, len(self.times)]).tofile(file)
+                self.times.tofile(file)
+                self.offsets.tofile(file)
+        except OSError as e:
+            print(f"Could not save record index {self.index_path}: {e}")
+
+    def refresh(self):
+        """
+        Bring the index up to date with the file, reading only what was
+        appended since it was built
+
+        Returns:
+            Number of index entries added
+        """
+        size = os.path.getsize(self.path)
+        if not self.times and self.indexed_size == 0:
+            self._load_index()
+        if size < self.indexed_size: # truncated or replaced; start over
+            self.times, self.offsets, self.indexed_size = array("d"), array("q"), 0
+        if size == self.indexed_size:
+            return 0
+
+        # Resume at the last entry (whose record may have been incomplete) and keep its stride
+        added = 0
+        start = self.offsets[-1] if self.offsets else 0
+        with open(self.path, "rb") as file:
+            for n, (offset, timestamp, _) in enumerate(iter_records(file, start)):
+                if n % self.stride == 0 and not (n == 0 and self.offsets):
+                    self.times.append(_seconds(timestamp))
+                    self.offsets.append(offset)
+                    added += 1
+        self.indexed_size = size
+        self._save_index()
+        return added
+
+    def records(self, since=None, until=None):
+        """
+        Yields:
+            (datetime, snapshot) for records with since <= time < until
+        """
+        start = 0
+        if since is not None and self.times:
+            entry = bisect.bisect_right(self.times, _seconds(since)) - 1
+            start = self.offsets[entry] if entry >= 0 else 0
+        with open(self.path, "rb") as file:
+            for _, timestamp, snapshot in iter_records(file, start):
+                if until is not None and timestamp >= until:
+                    return
+                if since is None or timestamp >= since:
+                    yield timestamp, snapshot
+
+    def summary(self, since=None, until=None):
+        """
+        Returns:
+            {"records", "first", "last", and for each of VITAL_FIELDS
+            {"min", "max", "mean", "count"} (None values when no record had it)}
+        """
+        stats = {field: [float("inf"), float("-inf"), 0.0, 0] for field in VITAL_FIELDS}
+        count, first, last = 0, None, None
+        for timestamp, snapshot in self.records(since, until):
+            count += 1
+            first = first or timestamp
+            last = timestamp
+            bp = snapshot.get("bp")
+            values = (snapshot.get("hr"), snapshot.get("spo2"),
+                      bp[0] if bp is not None else None, bp[1] if bp is not None else None)
+            for field, value in zip(VITAL_FIELDS, values):
+                if value is not None:
+                    entry = stats[field]
+                    entry[0] = min(entry[0], value)
+                    entry[1] = max(entry[1], value)
+                    entry[2] += value
+                    entry[3] += 1
+        result = {"records": count, "first": first, "last": last}
+        for field, (low, high, total, n) in stats.items():
+            result[field] = {"min": low if n else None, "max": high if n else None,
+                             "mean": total / n if n else None, "count": n}
+        return result
+
+
+def write_sample_records(path, megabytes, legacy=False, start=None):
+    """
+    Fill `path` with about `megabytes` of 1 Hz random vitals records
+
+    Returns:
+        (first record time, last record time)
+    """
+    start = start or datetime.datetime(2024, 1, 1, 8, 0, 0)
+    target = int(megabytes * 1024 * 1024)
+    written, n = 0, 0
+    with open(path, "w", encoding="utf-8") as file:
+        while written < target:
+            timestamp = start + datetime.timedelta(seconds=n)
+            snapshot = {"hr": random.randint(55, 95), "spo2": random.randint(92, 100),
+                        "bp": (random.randint(105, 135), random.randint(65, 85))}
+            if legacy:
+                text = (f"{timestamp}\nHR: {snapshot['hr']}\nO2: {snapshot['spo2']}\n"
+                        f"BP: {snapshot['bp']}\n\n")
+            else:
+                text = format_record(timestamp, snapshot)
+            file.write(text)
+            written += len(text)
+            n += 1
+    return start, start + datetime.timedelta(seconds=n - 1)
+
+
+def benchmark_reader(megabytes=20.0, legacy=False, queries=20, window_minutes=15):
+    """
+    Compare a full scan against indexed range queries on a generated record file
+
+    Returns:
+        dict of timings in ms
+    """
+    directory = os.path.join(DEFAULT_DIRECTORY, "benchmark")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "legacy.txt" if legacy else "records.txt")
+    for stale in (path, path + ".idx"):
+        if os.path.exists(stale):
+            os.remove(stale)
+    first, last = write_sample_records(path, megabytes, legacy)
+    window = datetime.timedelta(minutes=window_minutes)
+    span = (last - first - window).total_seconds()
+
+    start = time.perf_counter()
+    with open(path, "rb") as file:
+        total = sum(1 for _ in iter_records(file))
+    results = {"records": total, "full_scan_ms": (time.perf_counter() - start) * 1000.0}
+
+    start = time.perf_counter()
+    reader = ProcedureRecordReader(path)
+    results["index_build_ms"] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    ProcedureRecordReader(path)
+    results["index_load_ms"] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    for _ in range(queries):
+        since = first + datetime.timedelta(seconds=random.uniform(0, span))
+        summary = reader.summary(since, since + window)
+    results["range_summary_ms"] = (time.perf_counter() - start) / queries * 1000.0
+    results["range_records"] = summary["records"]
+
+    print(f"{os.path.getsize(path) / 1048576:.1f} MB {'legacy' if legacy else 'one-line'} file, {total} records, "
+          f"index of {len(reader.times)} entries")
+    print(f"full scan              | {results['full_scan_ms']:9.1f} ms")
+    print(f"index build            | {results['index_build_ms']:9.1f} ms")
+    print(f"index load             | {results['index_load_ms']:9.1f} ms")
+    print(f"{window_minutes:g} min range summary   | {results['range_summary_ms']:9.2f} ms "
+          f"({results['range_records']} records)")
+    return results
+
+
+def parse_query_time(text, reference):
+    """ISO date-time, or HH:MM[:SS] on the date of `reference`"""
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        clock = datetime.time.fromisoformat(text)
+        return datetime.datetime.combine(reference.date(), clock)
+
+
+# Usage: python procedure_records.py summary ProcedureRecords/output.txt --since 10:05 --until 10:20
+#        python procedure_records.py benchmark --megabytes 20 [--legacy]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Procedure record queries")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary_parser = commands.add_parser("summary", help="min/max/mean of each vital over a time range")
+    summary_parser.add_argument("path")
+    summary_parser.add_argument("--since", help="ISO date-time or HH:MM[:SS] on the day of the first record")
+    summary_parser.add_argument("--until", help="ISO date-time or HH:MM[:SS] on the day of the first record")
+    benchmark_parser = commands.add_parser("benchmark", help="full scan vs indexed range queries")
+    benchmark_parser.add_argument("--megabytes", type=float, default=20.0, help="size of the generated file")
+    benchmark_parser.add_argument("--legacy", action="store_true", help="generate HR:/O2:/BP: blocks")
+    benchmark_parser.add_argument("--queries", type=int, default=20, help="range queries to time")
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        benchmark_reader(args.megabytes, args.legacy, args.queries)
+    else:
+        reader = ProcedureRecordReader(args.path)
+        first = next(reader.records(), (None,))[0]
+        if first is None:
+            print(f"No records in {args.path}")
+        else:
+            since = parse_query_time(args.since, first) if args.since else None
+            until = parse_query_time(args.until, first) if args.until else None
+            result = reader.summary(since, until)
+            print(f"{result['records']} records from {result['first']} to {result['last']}")
+            for field in VITAL_FIELDS:
+                entry = result[field]
+                if entry["count"]:
+                    print(f"{field:7s} min {entry['min']:5g} | max {entry['max']:5g} | mean {entry['mean']:7.2f} "
+                          f"| {entry['count']} values")
@@ -0,0 +1,438 @@
+"""
+Columnar procedure recordings
+
+ChunkRecordWriter keeps every update_vitals() tick of a procedure, and
+optionally the full-rate sensor waveform, in a compact binary file
+(ProcedureRecords/procedure-<start>.nrc) instead of one text line per
+LOG_INTERVAL. Ticks are collected in memory by the writer thread and
+written as one compressed chunk every `chunk_seconds`, so the SD card sees
+a few hundred bytes every half minute instead of a text write per record.
+
+File layout, all little-endian:
+
+    MAGIC
+    chunk*: CHUNK_HEADER (tag, rows, payload bytes, first time, last time, rate_hz)
+            zlib-compressed payload
+
+Times are wall-clock seconds (time.time()). A payload holds whole columns
+one after another, so similar values sit together and compress well:
+
+    VITL: int32 milliseconds since the previous row (the first row is at the
+          header's first time), then int16 hr, spo2, bp_sys and bp_dia
+          columns with MISSING for an unavailable vital
+    WAVE: int16 sample-to-sample differences at rate_hz (wrapping, so
+          decoding with an int16 cumulative sum is exact)
+
+A crash can only leave an incomplete chunk at the end, which the reader
+ignores. ChunkRecordReader memory-maps the file, reads only the chunk
+headers when it opens, and decompresses just the chunks a time range needs.
+"""
+
+import argparse
+import datetime
+import mmap
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from procedure_records import (DEFAULT_DIRECTORY, DEFAULT_FLUSH_INTERVAL, DEFAULT_FSYNC_INTERVAL,
+                               DEFAULT_MAX_BYTES, VITAL_FIELDS, ProcedureRecordWriter, format_record)
+
+MAGIC = b"NORACHK1"
+CHUNK_HEADER = struct.Struct("<4sIIddd")
+VITALS_TAG = b"VITL"
+WAVEFORM_TAG = b"WAVE"
+MISSING = -1
+DEFAULT_CHUNK_SECONDS = 30.0
+COMPRESSION_LEVEL = 6
+
+
+def _int16(values):
+    return np.clip(np.rint(np.nan_to_num(np.asarray(values, dtype=np.float64))), -32768, 32767).astype("<i2")
+
+
+def encode_vitals_chunk(rows):
+    """
+    Args:
+        rows: List of (time, hr, spo2, bp_sys, bp_dia), MISSING for unavailable vitals
+
+    Returns:
+        (chunk bytes, uncompressed payload size)
+    """
+    columns = np.asarray(rows, dtype=np.float64).reshape(-1, 1 + len(VITAL_FIELDS))
+    times = columns[:, 0]
+    milliseconds = np.rint((times - times[0]) * 1000.0).astype(np.int64)
+    raw = np.diff(milliseconds, prepend=0).astype("<i4").tobytes()
+    raw += b"".join(_int16(columns[:, i]).tobytes() for i in range(1, columns.shape[1]))
+    payload = zlib.compress(raw, COMPRESSION_LEVEL)
+    header = CHUNK_HEADER.pack(VITALS_TAG, len(rows), len(payload), times[0], times[-1], 0.0)
+    return header + payload, len(raw)
+
+
+def encode_waveform_chunk(start, rate_hz, values):
+    """
+    Args:
+        start: Wall-clock time of values[0]
+        rate_hz: Sample rate
+        values: Samples in ADC units; rounded and clipped to int16
+
+    Returns:
+        (chunk bytes, uncompressed payload size)
+    """
+    samples = _int16(values)
+    raw = np.diff(samples, prepend=np.int16(0)).astype("<i2").tobytes()
+    payload = zlib.compress(raw, COMPRESSION_LEVEL)
+    end = start + (len(samples) - 1) / rate_hz
+    return CHUNK_HEADER.pack(WAVEFORM_TAG, len(samples), len(payload), start, end, rate_hz) + payload, len(raw)
+
+
+class ChunkRecordWriter(ProcedureRecordWriter):
+    """
+    Background writer of every vitals tick, and optionally the waveform, as
+    compressed column chunks; one .nrc file per procedure
+
+    Procedures, rotation past `max_bytes` and the fsync policy work as in
+    ProcedureRecordWriter; a batch there is a chunk here.
+
+    Counters (besides ProcedureRecordWriter's):
+        chunks: Chunks written
+        raw_bytes: Column bytes before compression
+        stored_bytes: Chunk bytes written, headers included
+        dropped_samples: Waveform samples overwritten before they were read
+    """
+
+    extension = ".nrc"
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, fsync="interval", fsync_interval=DEFAULT_FSYNC_INTERVAL,
+                 chunk_seconds=DEFAULT_CHUNK_SECONDS, waveform=None, rate_hz=None):
+        """
+        Args:
+            chunk_seconds: Time covered by each chunk
+            waveform: RingBuffer of (t, value) records, t on time.monotonic(), to record as well,
+                or None for vitals only
+            rate_hz: Waveform sample rate
+            (the rest as for ProcedureRecordWriter)
+        """
+        super().__init__(directory, max_bytes, flush_interval, fsync, fsync_interval)
+        self.chunk_seconds = chunk_seconds
+        self.waveform = waveform if rate_hz else None
+        self.rate_hz = rate_hz
+        self.cursor = waveform.count if self.waveform is not None else 0
+        self.rows = []          # vitals ticks not yet in a chunk
+        self.samples = []       # waveform blocks not yet in a chunk
+        self.samples_start = None # wall-clock time of the first pending sample
+        # Sample times are converted to wall time with one fixed offset, so consecutive chunks stay contiguous
+        self.clock_offset = time.time() - time.monotonic()
+
+        self.chunks = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.dropped_samples = 0
+
+    def write(self, snapshot, timestamp=None):
+        """Queue a tick for the current procedure; never blocks on the disk"""
+        timestamp = timestamp if timestamp is not None else snapshot.get("timestamp") or time.time()
+        self.queue.append(("record", (timestamp, snapshot)))
+
+    def _open_file(self, path):
+        file = open(path, "ab")
+        if file.tell() == 0:
+            file.write(MAGIC)
+        return file
+
+    def _drain(self):
+        while self.queue:
+            kind, item = self.queue.popleft()
+            if kind == "record":
+                timestamp, snapshot = item
+                bp = snapshot.get("bp")
+                vitals = (snapshot.get("hr"), snapshot.get("spo2"),
+                          bp[0] if bp is not None else None, bp[1] if bp is not None else None)
+                self.rows.append((timestamp,) + tuple(MISSING if value is None else value for value in vitals))
+                continue
+            self._read_waveform()
+            self._write_chunks(final=True)
+            self._close()
+            if kind == "start":
+                self.procedure = "procedure-" + item.strftime("%Y%m%d-%H%M%S")
+                self.part = 0
+        self._read_waveform()
+        self._write_chunks(final=self._stopping)
+
+    def _read_waveform(self):
+        if self.waveform is None:
+            return
+        samples, self.cursor, dropped = self.waveform.read_since(self.cursor)
+        if self.procedure is None or not len(samples):
+            return # only recorded while a procedure is open
+        if dropped:
+            # Samples are missing, so the pending ones can't be continued; close them off
+            self.dropped_samples += dropped
+            self._write_chunks(final=True, vitals=False)
+        if self.samples_start is None:
+            self.samples_start = samples["t"][0] + self.clock_offset
+        self.samples.append(np.array(samples["value"]))
+
+    def _write_chunks(self, final=False, vitals=True):
+        if vitals and self.rows and (final or self.rows[-1][0] - self.rows[0][0] >= self.chunk_seconds):
+            self._write_chunk(*encode_vitals_chunk(self.rows))
+            self.records += len(self.rows)
+            self.rows = []
+        pending = sum(len(block) for block in self.samples)
+        if pending and (final or pending >= self.chunk_seconds * self.rate_hz):
+            values = np.concatenate(self.samples)
+            self._write_chunk(*encode_waveform_chunk(self.samples_start, self.rate_hz, values))
+            self.samples, self.samples_start = [], None
+
+    def _write_chunk(self, data, raw_size):
+        try:
+            if self.file is None:
+                self._open_next()
+            elif self.size >= self.max_bytes:
+                self._close(keep_procedure=True)
+                self._open_next()
+            self.file.write(data)
+            self.size += len(data)
+            self.chunks += 1
+            self.raw_bytes += raw_size
+            self.stored_bytes += len(data)
+            self._sync()
+        except OSError as e:
+            self.errors += 1
+            print(f"Error writing procedure chunk: {e}")
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({
+            "pending": len(self.queue) + len(self.rows),
+            "chunks": self.chunks,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+            "dropped_samples": self.dropped_samples,
+        })
+        return stats
+
+
+def _seconds(value):
+    return value.timestamp() if isinstance(value, datetime.datetime) else value
+
+
+class ChunkRecordReader:
+    """
+    Memory-mapped reader of a .nrc file
+
+    Times passed in may be datetimes (local time, like the text records) or
+    wall-clock seconds.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a chunked procedure recording")
+
+        # (tag, rows, payload offset, payload bytes, first time, last time, rate_hz) per complete chunk
+        self.chunks = []
+        position = len(MAGIC)
+        while position + CHUNK_HEADER.size <= size:
+            tag, rows, length, first, last, rate_hz = CHUNK_HEADER.unpack_from(self.data, position)
+            start = position + CHUNK_HEADER.size
+            if start + length > size:
+                break # torn final chunk
+            self.chunks.append((tag, rows, start, length, first, last, rate_hz))
+            position = start + length
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _payload(self, chunk):
+        _, _, start, length, _, _, _ = chunk
+        return zlib.decompress(memoryview(self.data)[start:start + length])
+
+    def _overlapping(self, tag, since, until):
+        since, until = _seconds(since), _seconds(until)
+        return [chunk for chunk in self.chunks if chunk[0] == tag
+                and (since is None or chunk[5] >= since) and (until is None or chunk[4] < until)]
+
+    def vitals(self, since=None, until=None):
+        """
+        Returns:
+            dict of "t" (float64 seconds) and int16 columns for VITAL_FIELDS
+            (MISSING where unavailable), for ticks with since <= t < until
+        """
+        parts = {name: [] for name in ("t",) + VITAL_FIELDS}
+        for chunk in self._overlapping(VITALS_TAG, since, until):
+            rows, first = chunk[1], chunk[4]
+            raw = self._payload(chunk)
+            parts["t"].append(first + np.cumsum(np.frombuffer(raw, "<i4", rows)) / 1000.0)
+            for i, name in enumerate(VITAL_FIELDS):
+                parts[name].append(np.frombuffer(raw, "<i2", rows, 4 * rows + 2 * rows * i))
+        columns = {name: np.concatenate(values) if values else np.zeros(0, "<i2" if name != "t" else "f8")
+                   for name, values in parts.items()}
+        mask = np.ones(len(columns["t"]), dtype=bool)
+        if since is not None:
+            mask &= columns["t"] >= _seconds(since)
+        if until is not None:
+            mask &= columns["t"] < _seconds(until)
+        return {name: values[mask] for name, values in columns.items()}
+
+    def waveform(self, since=None, until=None):
+        """
+        Returns:
+            (t, values) float64 and int16 arrays of samples with since <= t < until
+        """
+        times, values = [], []
+        for chunk in self._overlapping(WAVEFORM_TAG, since, until):
+            rows, first, rate_hz = chunk[1], chunk[4], chunk[6]
+            samples = np.cumsum(np.frombuffer(self._payload(chunk), "<i2", rows), dtype=np.int16)
+            times.append(first + np.arange(rows) / rate_hz)
+            values.append(samples)
+        t = np.concatenate(times) if times else np.zeros(0)
+        v = np.concatenate(values) if values else np.zeros(0, dtype=np.int16)
+        mask = np.ones(len(t), dtype=bool)
+        if since is not None:
+            mask &= t >= _seconds(since)
+        if until is not None:
+            mask &= t < _seconds(until)
+        return t[mask], v[mask]
+
+    def summary(self, since=None, until=None):
+        """Same result as ProcedureRecordReader.summary()"""
+        columns = self.vitals(since, until)
+        t = columns["t"]
+        result = {"records": len(t),
+                  "first": datetime.datetime.fromtimestamp(t[0]) if len(t) else None,
+                  "last": datetime.datetime.fromtimestamp(t[-1]) if len(t) else None}
+        for field in VITAL_FIELDS:
+            values = columns[field][columns[field] != MISSING]
+            n = len(values)
+            result[field] = {"min": int(values.min()) if n else None, "max": int(values.max()) if n else None,
+                             "mean": float(values.mean()) if n else None, "count": n}
+        return result
+
+    def iter_records(self):
+        """
+        Yields:
+            (datetime, snapshot) for every tick, in the format of the text records
+        """
+        columns = self.vitals()
+        for i, t in enumerate(columns["t"]):
+            hr, spo2, bp_sys, bp_dia = (int(columns[field][i]) for field in VITAL_FIELDS)
+            yield datetime.datetime.fromtimestamp(t), {
+                "hr": None if hr == MISSING else hr,
+                "spo2": None if spo2 == MISSING else spo2,
+                "bp": None if MISSING in (bp_sys, bp_dia) else (bp_sys, bp_dia),
+            }
+
+
+def benchmark_chunks(hours=4.0, rate_hz=250, log_every=10, window_minutes=15):
+    """
+    Record `hours` of 1 Hz ticks and a `rate_hz` waveform, and compare the
+    files with the text log of every `log_every`-th tick
+
+    Returns:
+        dict of sizes in bytes, write counts and read timings in ms
+    """
+    from PulseOX.synthetic import synthetic_ppg
+
+    directory = os.path.join(DEFAULT_DIRECTORY, "benchmark")
+    os.makedirs(directory, exist_ok=True)
+    ticks = int(hours * 3600)
+    t0 = time.time() - ticks
+    rng = np.random.default_rng(1)
+    hr = np.clip(72 + np.cumsum(rng.integers(-1, 2, ticks)) // 4, 40, 180)
+    spo2 = np.clip(97 + rng.integers(-1, 2, ticks), 85, 100)
+    bp_sys = np.clip(120 + np.cumsum(rng.integers(-1, 2, ticks)) // 8, 80, 200)
+    bp_dia = bp_sys - 40
+    rows = [(t0 + i, hr[i], spo2[i], bp_sys[i], bp_dia[i]) for i in range(ticks)]
+
+    results = {}
+    legacy_path = os.path.join(directory, "output.txt")
+    text_path = os.path.join(directory, "records.txt")
+    with open(legacy_path, "w") as legacy, open(text_path, "w") as text:
+        for t, h, s, sy, di in rows[::log_every]:
+            stamp = datetime.datetime.fromtimestamp(t)
+            legacy.write(f"{stamp}\nHR: {h}\nO2: {s}\nBP: {(int(sy), int(di))}\n\n")
+            text.write(format_record(stamp, {"hr": h, "spo2": s, "bp": (sy, di)}))
+    results["legacy_text_bytes"] = os.path.getsize(legacy_path)
+    results["legacy_text_writes"] = 5 * len(rows[::log_every]) # output_to_file wrote five lines per record
+    results["line_text_bytes"] = os.path.getsize(text_path)
+
+    for waveform in (False, True):
+        path = os.path.join(directory, "waveform.nrc" if waveform else "vitals.nrc")
+        writes, raw = 0, 0
+        with open(path, "wb") as file:
+            file.write(MAGIC)
+            for start in range(0, ticks, int(DEFAULT_CHUNK_SECONDS)):
+                data, size = encode_vitals_chunk(rows[start:start + int(DEFAULT_CHUNK_SECONDS)])
+                file.write(data)
+                writes, raw = writes + 1, raw + size
+                if waveform:
+                    values = synthetic_ppg(rate_hz, DEFAULT_CHUNK_SECONDS, seed=start)
+                    data, size = encode_waveform_chunk(t0 + start, rate_hz, values)
+                    file.write(data)
+                    writes, raw = writes + 1, raw + size
+        key = "chunks_waveform" if waveform else "chunks_vitals"
+        results[key + "_bytes"] = os.path.getsize(path)
+        results[key + "_raw_bytes"] = raw
+        results[key + "_writes"] = writes
+
+        start_time = time.perf_counter()
+        with ChunkRecordReader(path) as reader:
+            results[key + "_open_ms"] = (time.perf_counter() - start_time) * 1000.0
+            since = t0 + ticks / 2
+            start_time = time.perf_counter()
+            reader.summary(since, since + window_minutes * 60)
+            if waveform:
+                reader.waveform(since, since + window_minutes * 60)
+            results[key + "_range_ms"] = (time.perf_counter() - start_time) * 1000.0
+
+    print(f"{hours:g} h procedure, {ticks} ticks; text logs hold every {log_every}th tick")
+    print(f"legacy text (output.txt)       | {results['legacy_text_bytes']:10d} bytes | "
+          f"{results['legacy_text_writes']:6d} writes")
+    print(f"one-line text                  | {results['line_text_bytes']:10d} bytes |")
+    for key, label in (("chunks_vitals", "chunks, every tick"), ("chunks_waveform", f"chunks + {rate_hz} Hz waveform")):
+        print(f"{label:30s} | {results[key + '_bytes']:10d} bytes | {results[key + '_writes']:6d} writes | "
+              f"{results[key + '_raw_bytes'] / results[key + '_bytes']:4.1f}x compression | "
+              f"open {results[key + '_open_ms']:.2f} ms | {window_minutes:g} min range {results[key + '_range_ms']:.2f} ms")
+    return results
+
+
+# Usage: python record_chunks.py summary ProcedureRecords/procedure-20240501-140307.nrc
+#        python record_chunks.py benchmark --hours 4
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunked procedure recordings")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary_parser = commands.add_parser("summary", help="min/max/mean of each vital in a recording")
+    summary_parser.add_argument("path")
+    benchmark_parser = commands.add_parser("benchmark", help="size and write count against the text log")
+    benchmark_parser.add_argument("--hours", type=float, default=4.0, help="procedure length")
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        benchmark_chunks(args.hours)
+    else:
+        with ChunkRecordReader(args.path) as reader:
+            result = reader.summary()
+            t, _ = reader.waveform()
+        print(f"{result['records']} ticks from {result['first']} to {result['last']}, {len(t)} waveform samples")
+        for field in VITAL_FIELDS:
+            entry = result[field]
+            if entry["count"]:
+                print(f"{field:7s} min {entry['min']:5g} | max {entry['max']:5g} | mean {entry['mean']:7.2f} "
+                      f"| {entry['count']} values")
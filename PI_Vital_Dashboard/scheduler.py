@@ -0,0 +1,171 @@
+"""
+Periodic task scheduler
+
+NORA's periodic loops (vitals, display, volume, flow) used to reschedule
+themselves with their own root.after(period) at the end of each run, so
+every run started `period` after the previous one *finished*: each loop
+drifted by its own run time and Tk's timer slop, and a slow tick pushed
+everything behind it back without anyone noticing.
+
+PeriodicScheduler keeps one deadline per task on the time.monotonic()
+clock and advances it by exactly one period after each run, so tasks stay
+on their own fixed grid however long a run takes. A run that takes longer
+than its period is counted as an overrun; if a task falls more than a whole
+period behind, the missed runs are skipped (and counted) rather than run
+back to back to catch up.
+
+The scheduler does not own a thread. attach_tk() drives it from the Tk
+event loop with a single root.after() chain, so tasks still run on the Tk
+thread; run() drives it from a blocking loop instead.
+"""
+
+import math
+import threading
+import time
+
+
+class PeriodicTask:
+    """
+    One task's schedule and execution statistics
+
+    Counters:
+        runs: Completed runs
+        errors: Runs that raised
+        overruns: Runs that took longer than the period
+        skipped: Runs dropped because the task fell a whole period behind
+    """
+
+    def __init__(self, name, period, callback, args=(), next_due=0.0):
+        self.name = name
+        self.period = period
+        self.callback = callback
+        self.args = args
+        self.next_due = next_due
+
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.duration_last = 0.0
+        self.duration_max = 0.0
+        self._duration_total = 0.0
+        self.lateness_max = 0.0 # how long after its deadline a run started
+        self._lateness_total = 0.0
+
+    def stats(self):
+        return {
+            "period_ms": self.period * 1000.0,
+            "runs": self.runs,
+            "errors": self.errors,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "duration_last_ms": self.duration_last * 1000.0,
+            "duration_mean_ms": (self._duration_total / self.runs * 1000.0) if self.runs else 0.0,
+            "duration_max_ms": self.duration_max * 1000.0,
+            "lateness_mean_ms": (self._lateness_total / self.runs * 1000.0) if self.runs else 0.0,
+            "lateness_max_ms": self.lateness_max * 1000.0,
+        }
+
+
+class PeriodicScheduler:
+    """Runs registered tasks at fixed periods on the monotonic clock"""
+
+    def __init__(self, clock=time.monotonic):
+        """
+        Args:
+            clock: Function returning seconds; time.monotonic unless testing
+        """
+        self.clock = clock
+        self.tasks = {}
+        self._after_id = None
+        self._root = None
+
+    def add(self, name, period, callback, *args, delay=0.0):
+        """
+        Run callback(*args) every `period` seconds, first after `delay`
+
+        Returns:
+            The PeriodicTask
+        """
+        if period <= 0:
+            raise ValueError(f"period must be positive, got {period}")
+        task = PeriodicTask(name, period, callback, args, self.clock() + delay)
+        self.tasks[name] = task
+        return task
+
+    def remove(self, name):
+        self.tasks.pop(name, None)
+
+    def run_due(self):
+        """
+        Run every task whose deadline has passed, earliest deadline first
+
+        Returns:
+            Seconds until the next deadline (0 if one has already passed)
+        """
+        for task in sorted(self.tasks.values(), key=lambda task: task.next_due):
+            start = self.clock()
+            if start < task.next_due:
+                break
+            lateness = start - task.next_due
+            try:
+                task.callback(*task.args)
+            except Exception as e:
+                task.errors += 1
+                print(f"Error in scheduled task {task.name}: {e}")
+            end = self.clock()
+
+            duration = end - start
+            task.runs += 1
+            task.duration_last = duration
+            task._duration_total += duration
+            task.duration_max = max(task.duration_max, duration)
+            task._lateness_total += lateness
+            task.lateness_max = max(task.lateness_max, lateness)
+            if duration > task.period:
+                task.overruns += 1
+
+            # Stay on the task's own grid; skip whole periods that have already gone by
+            task.next_due += task.period
+            if task.next_due <= end:
+                missed = math.floor((end - task.next_due) / task.period) + 1
+                task.skipped += missed
+                task.next_due += missed * task.period
+        return self.time_to_next()
+
+    def time_to_next(self):
+        if not self.tasks:
+            return math.inf
+        return max(0.0, min(task.next_due for task in self.tasks.values()) - self.clock())
+
+    def attach_tk(self, root):
+        """Drive the scheduler from root's event loop until detach_tk()"""
+        self._root = root
+        self._pump()
+
+    def detach_tk(self):
+        if self._root is not None and self._after_id is not None:
+            self._root.after_cancel(self._after_id)
+        self._root = self._after_id = None
+
+    def _pump(self):
+        delay = self.run_due()
+        if self._root is not None:
+            delay_ms = 1000 if delay == math.inf else max(1, math.ceil(delay * 1000.0))
+            self._after_id = self._root.after(delay_ms, self._pump)
+
+    def run(self, stop_event=None):
+        """
+        Run tasks on the calling thread until stop_event is set
+
+        Args:
+            stop_event: threading.Event; a new one (never set) if None
+        """
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            delay = self.run_due()
+            stop_event.wait(1.0 if delay == math.inf else delay)
+
+    def stats(self):
+        """dict of task name -> PeriodicTask.stats()"""
+        return {name: task.stats() for name, task in self.tasks.items()}
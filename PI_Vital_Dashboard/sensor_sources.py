@@ -0,0 +1,348 @@
+"""
+Sensor sources
+
+Every source runs its own background thread and publishes a snapshot dict
+in the same format update_vitals() has always used:
+
+    {"hr": int or None, "spo2": int or None, "bp": (sys, dia) or None, "timestamp": float}
+
+latest() only returns the last published dict, so the Tk thread never waits
+on hardware. Published dicts are never modified afterwards.
+
+Sources that sample a pulse waveform also fill `waveform`, a RingBuffer of
+(t, value) records at `waveform_rate_hz`, which the display reads at its
+own refresh rate with waveform.read_since(). It is None for sources that
+only report numbers.
+"""
+
+import random as rand
+import re
+import threading
+import time
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+import numpy as np
+
+from PulseOX.A2D import MCP3008Reader
+from PulseOX.acquisition import AcquisitionEngine
+from PulseOX.spo2 import SpO2Estimator
+from PulseOX.heart_rate import HeartRateDetector
+from PulseOX.raw_recording import RawRecorder, RawReplayer
+from PulseOX.ring_buffer import RingBuffer
+from PulseOX.synthetic import synthetic_ppg
+from procedure_records import iter_records
+from record_chunks import MAGIC as CHUNK_MAGIC, ChunkRecordReader
+
+SOURCE_KINDS = ("auto", "simulated", "mcp3008", "serial", "replay", "adc_replay")
+
+WAVEFORM_DTYPE = np.dtype([("t", np.float64), ("value", np.float64)])
+WAVEFORM_SECONDS = 10 # history kept in a source's waveform buffer
+
+
+class SensorSource:
+    """Base class: calls poll() on a background thread and publishes its result"""
+
+    def __init__(self, interval=1.0):
+        """
+        Args:
+            interval: Seconds between poll() calls
+        """
+        self.interval = interval
+        self.waveform = None
+        self.waveform_rate_hz = None
+        self._snapshot = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def poll(self):
+        """Produce a new snapshot dict, or None if nothing changed"""
+        raise NotImplementedError
+
+    def latest(self):
+        """The most recent snapshot, or None before the first one (constant time)"""
+        return self._snapshot
+
+    def publish(self, snapshot):
+        snapshot["timestamp"] = time.time()
+        self._snapshot = snapshot  # single reference assignment; readers never see a partial dict
+
+    def init_waveform(self, rate_hz):
+        """Create the waveform buffer; called by sources that sample a waveform"""
+        self.waveform_rate_hz = rate_hz
+        self.waveform = RingBuffer(int(rate_hz * WAVEFORM_SECONDS), dtype=WAVEFORM_DTYPE)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.close()
+
+    def close(self):
+        """Release hardware; called by stop()"""
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                snapshot = self.poll()
+                if snapshot is not None:
+                    self.publish(snapshot)
+            except Exception as e:
+                print(f"Error reading {type(self).__name__}: {e}")
+            self._stop_event.wait(self.interval)
+
+
+class SimulatedSource(SensorSource):
+    """
+    Random vitals in normal ranges plus a synthetic PPG waveform, for running
+    without sensors
+
+    The waveform is released in small blocks every `waveform_interval` at
+    its sample timestamps; new vitals are published every `interval`.
+    """
+
+    def __init__(self, interval=1.0, waveform_rate_hz=250, waveform_interval=0.04):
+        """
+        Args:
+            interval: Seconds between new vitals
+            waveform_rate_hz: Waveform samples per second
+            waveform_interval: Seconds between waveform blocks
+        """
+        super().__init__(waveform_interval)
+        self.vitals_interval = interval
+        self.init_waveform(waveform_rate_hz)
+        # 60 s at 72 bpm is a whole number of beats and wander cycles, so it loops seamlessly
+        self._template = synthetic_ppg(waveform_rate_hz, 60, bpm=72, seed=0)
+        self._position = 0
+        self._next_sample_t = None
+        self._next_vitals_t = 0.0
+
+    def poll(self):
+        now = time.monotonic()
+        self._emit_waveform(now)
+        if now < self._next_vitals_t:
+            return None
+        self._next_vitals_t = now + self.vitals_interval
+        return {
+            "hr": rand.randint(70,80),
+            "spo2": rand.randint(96,100),
+            "bp": (rand.randint(70,80),rand.randint(90,100))
+        }
+
+    def _emit_waveform(self, now):
+        rate = self.waveform_rate_hz
+        if self._next_sample_t is None:
+            self._next_sample_t = now
+        if now < self._next_sample_t:
+            return
+        n = min(int((now - self._next_sample_t) * rate) + 1, self.waveform.capacity)
+        block = np.empty(n, dtype=WAVEFORM_DTYPE)
+        block["t"] = self._next_sample_t + np.arange(n) / rate
+        block["value"] = self._template.take(np.arange(self._position, self._position + n), mode="wrap")
+        self.waveform.extend(block)
+        self._next_sample_t = max(self._next_sample_t + n / rate, now - 1.0 / rate)
+        self._position = (self._position + n) % len(self._template)
+
+
+class MCP3008Source(SensorSource):
+    """
+    HR and SpO2 from the pulse ox RED/IR channels on the MCP3008
+
+    An AcquisitionEngine samples the ADC at a fixed rate on its own thread;
+    every `interval` this source feeds the new samples to the SpO2 estimator
+    and the heart rate detector (IR channel) and publishes the results.
+    Blood pressure is not measured and is reported as None. The IR channel
+    is also copied to `waveform` for display.
+
+    Passing a RawReplayer as `engine` runs the same pipeline on a recording
+    instead of the ADC.
+    """
+
+    def __init__(self, red_channel=0, ir_channel=1, rate_hz=250, interval=0.1, reader=None,
+                 engine=None, record_path=None):
+        """
+        Args:
+            red_channel: MCP3008 channel carrying the RED photodiode signal
+            ir_channel: MCP3008 channel carrying the IR photodiode signal
+            rate_hz: RED/IR pairs per second
+            interval: Seconds between DSP updates
+            reader: ADC reader to sample instead of opening an MCP3008Reader
+            engine: Sample source to use instead of an AcquisitionEngine (e.g. RawReplayer)
+            record_path: Also record every raw sample to this .adc file (or a numbered name)
+        """
+        super().__init__(interval)
+        if engine is not None:
+            self.reader = None
+            self.engine = engine
+            rate_hz = engine.rate_hz
+        else:
+            self.reader = reader if reader is not None else MCP3008Reader(channels=(red_channel, ir_channel)).open()
+            self.engine = AcquisitionEngine(self.reader, rate_hz=rate_hz)
+        self.recorder = None
+        if record_path is not None:
+            self.recorder = RawRecorder(record_path, self.engine.channels, rate_hz).attach(self.engine)
+        self.spo2_estimator = SpO2Estimator(rate_hz)
+        self.heart_rate_detector = HeartRateDetector(rate_hz)
+        self.init_waveform(rate_hz)
+        self.cursor = 0
+
+    def start(self):
+        self.engine.start()
+        return super().start()
+
+    def poll(self):
+        timestamps, raw, self.cursor, dropped = self.engine.read_since(self.cursor)
+        if len(raw):
+            self.spo2_estimator.process_block(raw[:, 0], raw[:, 1])
+            self.heart_rate_detector.process_block(raw[:, 1])
+            block = np.empty(len(raw), dtype=WAVEFORM_DTYPE)
+            block["t"] = timestamps
+            block["value"] = raw[:, 1]
+            self.waveform.extend(block)
+        hr = self.heart_rate_detector.hr
+        spo2 = self.spo2_estimator.spo2
+        return {
+            "hr": None if hr is None else round(hr),
+            "spo2": None if spo2 is None else round(spo2),
+            "bp": None
+        }
+
+    def close(self):
+        self.engine.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.reader is not None and hasattr(self.reader, "close"):
+            self.reader.close()
+
+
+class SerialSource(SensorSource):
+    """
+    Vitals printed over a serial port, e.g. by pulseOximeterSpO2.ino
+
+    Understands lines of the form "HR: 72", "SpO2: 97.5" and "BP: 120/80";
+    each line updates its field and republishes the snapshot.
+    """
+
+    LINE_PATTERN = re.compile(r"^\s*(HR|SpO2|O2|BP)\s*:\s*([\d.]+)(?:\s*/\s*([\d.]+))?")
+
+    def __init__(self, port="/dev/ttyACM0", baudrate=9600, timeout=1.0):
+        if serial is None:
+            raise RuntimeError("pyserial is not installed (pip install pyserial)")
+        super().__init__(interval=0)  # readline() already blocks up to `timeout`
+        self.port = serial.Serial(port, baudrate, timeout=timeout)
+        self.values = {"hr": None, "spo2": None, "bp": None}
+
+    def poll(self):
+        line = self.port.readline().decode("ascii", errors="ignore")
+        match = self.LINE_PATTERN.match(line)
+        if not match:
+            return None
+        field, first, second = match.groups()
+        if field == "HR":
+            self.values["hr"] = round(float(first))
+        elif field in ("SpO2", "O2"):
+            self.values["spo2"] = round(float(first))
+        elif second is not None:
+            self.values["bp"] = (round(float(first)), round(float(second)))
+        return dict(self.values)
+
+    def close(self):
+        self.port.close()
+
+
+def parse_procedure_records(path):
+    """
+    Read a procedure record file: a .nrc recording written by
+    ChunkRecordWriter, one-line records written by ProcedureRecordWriter, or
+    the timestamp/HR/O2/BP blocks of the older ProcedureRecords/output.txt
+
+    Returns:
+        list of (datetime, snapshot) in file order
+    """
+    with open(path, "rb") as file:
+        if file.read(len(CHUNK_MAGIC)) != CHUNK_MAGIC:
+            return [(timestamp, snapshot) for _, timestamp, snapshot in iter_records(file)]
+    with ChunkRecordReader(path) as reader:
+        return list(reader.iter_records())
+
+
+class ReplaySource(SensorSource):
+    """
+    Replays a procedure record file, keeping the recorded spacing between
+    entries (divided by `speed`)
+    """
+
+    def __init__(self, path="ProcedureRecords/output.txt", speed=1.0, loop=True, default_interval=1.0):
+        """
+        Args:
+            path: Procedure record file (see parse_procedure_records())
+            speed: Playback speed multiplier
+            loop: Start over after the last record
+            default_interval: Spacing used when two records are out of order
+        """
+        super().__init__(interval=0)
+        self.records = parse_procedure_records(path)
+        if not self.records:
+            raise ValueError(f"No procedure records found in {path}")
+        self.speed = speed
+        self.loop = loop
+        self.default_interval = default_interval
+        self.position = 0
+
+    def poll(self):
+        if self.position >= len(self.records):
+            if not self.loop:
+                self._stop_event.set()
+                return None
+            self.position = 0
+
+        timestamp, snapshot = self.records[self.position]
+        self.position += 1
+        if self.position < len(self.records):
+            gap = (self.records[self.position][0] - timestamp).total_seconds()
+            self.interval = (gap if gap > 0 else self.default_interval) / self.speed
+        else:
+            self.interval = self.default_interval / self.speed
+        return dict(snapshot)
+
+
+def create_sensor_source(kind="auto", is_raspberry_pi=False, **options):
+    """
+    Build a sensor source by name
+
+    Args:
+        kind: One of SOURCE_KINDS; "auto" picks mcp3008 on a Raspberry Pi and
+            simulated everywhere else
+        is_raspberry_pi: Whether the MCP3008 can be used
+        options: Keyword arguments for the chosen source class
+
+    Returns:
+        An unstarted SensorSource
+    """
+    if kind not in SOURCE_KINDS:
+        raise ValueError(f"Unknown sensor source {kind!r}; expected one of {SOURCE_KINDS}")
+    if kind == "auto":
+        kind = "mcp3008" if is_raspberry_pi else "simulated"
+
+    if kind == "mcp3008":
+        return MCP3008Source(**options)
+    if kind == "serial":
+        return SerialSource(**options)
+    if kind == "replay":
+        return ReplaySource(**options)
+    if kind == "adc_replay":
+        engine = RawReplayer(options.pop("path"), speed=options.pop("speed", 1.0), loop=options.pop("loop", True))
+        return MCP3008Source(engine=engine, **options)
+    return SimulatedSource(**options)
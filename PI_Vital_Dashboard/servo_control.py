@@ -0,0 +1,210 @@
+"""
+Servo motion control
+
+update_flow() used to move the syringe servo by a fixed 0.01 at most once
+a second from the Tk loop, so delivery came in 250 μL jumps up to a second
+late, and any stall in the GUI stalled the pump with it.
+
+ServoController runs on its own thread and follows the volume the infusion
+integrator says should have been given. Like update_flow(), it takes a step
+as soon as the volume given gets ahead of what the steps taken so far have
+pushed, so even a volume smaller than one step is delivered. The plunger
+position is a straight line in volume, so from the current flow rate it
+computes when the volume will pass the last step taken and sleeps until
+exactly then; flow-rate changes are followed within `poll_interval` (or at
+once, after wake()).
+
+How fine a step is worth commanding depends on how the pulses are timed.
+With gpiozero's PiGPIOFactory the pigpio daemon times the pulse with DMA,
+so the 1 μs pulse-width resolution is real; the other factories time pulses
+in software, and their jitter is larger than a fine step, so the coarser
+software step is used.
+
+Each step records when it was due (commanded) and when the new position
+had been written (achieved); stats() reports the difference.
+"""
+
+import math
+import threading
+import time
+
+SERVO_STEP_HARDWARE = 0.001 # 1 μs of a 500-2500 μs pulse range; pigpio's DMA-timed resolution
+SERVO_STEP_SOFTWARE = 0.01  # the step update_flow() has always used
+DEFAULT_POLL_INTERVAL = 0.1 # longest sleep between steps, so flow changes are picked up
+
+
+def is_hardware_timed(servo):
+    """Whether the servo's pulses are timed in hardware (gpiozero's PiGPIOFactory)"""
+    factory = getattr(servo, "pin_factory", None)
+    return factory is not None and type(factory).__name__ == "PiGPIOFactory"
+
+
+class ServoController:
+    """
+    Drives the syringe servo to follow the commanded volume
+
+    The position moves from the position at reset() towards `min_value` by
+    2 / syringe_size per μL (the servo's -1..1 range covers the syringe).
+    With servo=None the position is only tracked, for simulation mode.
+
+    Counters:
+        steps: Position steps taken
+        writes: Writes to the servo (one write may cover several steps)
+        missed_steps: Steps that were not written on their own because the
+            thread woke too late for them
+        lateness_last: Seconds between when the last step was due and when
+            its position had been written
+        lateness_max: Largest lateness_last so far
+        errors: Writes that raised
+    """
+
+    def __init__(self, servo, volume, flow_rate, syringe_size=50000, min_value=-1.0, max_value=1.0,
+                 step=None, poll_interval=DEFAULT_POLL_INTERVAL, clock=time.monotonic):
+        """
+        Args:
+            servo: gpiozero Servo, or None to simulate
+            volume: Callable returning the volume that should have been given in μL
+            flow_rate: Callable returning the flow rate in μL/min
+            syringe_size: Syringe volume in μL covered by the full servo range
+            min_value: Servo value with the syringe empty
+            max_value: Servo value with the syringe full
+            step: Position step; chosen from the pin factory if None
+            poll_interval: Longest sleep between steps
+            clock: Function returning seconds; time.monotonic unless testing
+        """
+        self.servo = servo
+        self.volume = volume
+        self.flow_rate = flow_rate
+        self.min_value = min_value
+        self.max_value = max_value
+        self.scale = (max_value - min_value) / syringe_size # position per μL
+        self.hardware_timed = is_hardware_timed(servo)
+        if step is None:
+            step = SERVO_STEP_HARDWARE if self.hardware_timed else SERVO_STEP_SOFTWARE
+        self.step_size = step
+        self.poll_interval = poll_interval
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._position = servo.value if servo is not None and servo.value is not None else max_value
+        self._origin = self._position
+        self._origin_volume = 0.0
+        self._steps_taken = 0     # steps since reset()
+        self._next_due = None     # clock time the next step is expected, if a sleep was timed to it
+
+        self.steps = 0
+        self.writes = 0
+        self.missed_steps = 0
+        self.lateness_last = 0.0
+        self.lateness_max = 0.0
+        self._lateness_total = 0.0
+        self._timed_steps = 0
+        self.errors = 0
+
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+
+    @property
+    def position(self):
+        return self._position
+
+    @property
+    def delivered(self):
+        """Volume in μL pushed by the steps taken since reset()"""
+        return self._steps_taken * self.step_size / self.scale
+
+    def reset(self):
+        """Count from the current position and volume (a new procedure); the plunger stays where it is"""
+        with self._lock:
+            self._origin = self._position
+            self._origin_volume = self.volume()
+            self._steps_taken = 0
+            self._next_due = None
+        self._wake.set()
+
+    def step(self):
+        """
+        Take the steps needed for the steps taken to cover the commanded volume
+
+        Returns:
+            Seconds until the next step is due, at most poll_interval
+        """
+        with self._lock:
+            volume = self.volume() - self._origin_volume
+            wanted = math.ceil(max(0.0, volume) * self.scale / self.step_size - 1e-9)
+            room = math.floor((self._origin - self.min_value) / self.step_size + 1e-9)
+            wanted = min(wanted, room)
+
+            if wanted > self._steps_taken:
+                position = self._origin - wanted * self.step_size
+                try:
+                    if self.servo is not None:
+                        self.servo.value = position
+                    self._position = position
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error controlling servo: {e}")
+                else:
+                    achieved = self.clock()
+                    taken = wanted - self._steps_taken
+                    self.steps += taken
+                    self.writes += 1
+                    self.missed_steps += taken - 1
+                    self._steps_taken = wanted
+                    if self._next_due is not None:
+                        self.lateness_last = achieved - self._next_due
+                        self.lateness_max = max(self.lateness_max, self.lateness_last)
+                        self._lateness_total += self.lateness_last
+                        self._timed_steps += 1
+
+            # Schedule: when will the volume pass what the steps taken have pushed, at the current flow rate?
+            delay = self.poll_interval
+            self._next_due = None
+            rate = max(0.0, self.flow_rate()) / 60.0
+            if rate > 0 and self._steps_taken < room:
+                remaining = (self.delivered - volume) / rate
+                if remaining <= self.poll_interval:
+                    delay = max(0.0, remaining)
+                    self._next_due = self.clock() + delay
+        return delay
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ServoController", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        """Reschedule now instead of at the next step (e.g. right after the flow rate changed)"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            delay = self.step()
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def stats(self):
+        return {
+            "hardware_timed": self.hardware_timed,
+            "step_size": self.step_size,
+            "position": self._position,
+            "delivered": self.delivered,
+            "steps": self.steps,
+            "writes": self.writes,
+            "missed_steps": self.missed_steps,
+            "errors": self.errors,
+            "lateness_last_ms": self.lateness_last * 1000.0,
+            "lateness_mean_ms": (self._lateness_total / self._timed_steps * 1000.0) if self._timed_steps else 0.0,
+            "lateness_max_ms": self.lateness_max * 1000.0,
+        }
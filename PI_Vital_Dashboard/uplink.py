@@ -0,0 +1,383 @@
+"""
+Telemetry uplink
+
+Sends vitals snapshots to the web server's /data endpoint from a background
+thread, so a slow or unreachable server never blocks the Tk thread.
+
+submit() only appends to a bounded queue. The worker thread takes
+everything queued (up to `max_batch` snapshots) and POSTs it in one
+request over a keep-alive requests.Session: a single snapshot is sent as
+the plain payload, several as {"batch": [...]}. When the queue is full the
+oldest snapshot is dropped, since the newest vitals matter most. A request
+that could not connect, timed out or got a 5xx puts its snapshots back at
+the front of the queue and the worker backs off before retrying. A batch
+the server rejects (4xx), or that cannot be encoded at all, is dropped:
+sending it again would fail the same way and hold up everything after it.
+
+While the Socket.IO connection is up, VitalsBatchStreamer sends the same
+snapshots plus the full-rate sensor waveform as "vitals_batch" events
+instead. Numbers travel as packed little-endian arrays in binary
+attachments rather than JSON:
+
+    rate_hz: waveform sample rate (JSON number)
+    t0: wall-clock time the float32 offsets below are relative to
+    waveform_start: offset of the first waveform sample from t0
+    waveform: int16 samples
+    vitals: float32 rows of (time offset, hr, spo2, bp_sys, bp_dia), NaN for missing
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import requests
+
+DEFAULT_MAX_QUEUE = 600 # 10 minutes of snapshots at one per second
+DEFAULT_MAX_BATCH = 50
+MAX_RETRY_DELAY = 5.0 # seconds
+STREAM_INTERVAL = 0.2 # seconds between vitals_batch events
+VITALS_FIELDS = ("hr", "spo2", "bp_sys", "bp_dia") # after the time offset in each vitals row
+
+
+def is_transient(error):
+    """Whether a failed request may succeed if sent again: no connection, a timeout or a 5xx"""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(error, "response", None)
+    return isinstance(error, requests.HTTPError) and response is not None and response.status_code >= 500
+
+
+class TelemetryUplink:
+    """
+    Background sender with a bounded drop-oldest queue
+
+    Counters:
+        sent: Snapshots the server accepted
+        dropped: Snapshots discarded because the queue was full or the server rejected them
+        failures: Requests that raised or returned an error status
+        batches: Successful requests
+        latency: Round-trip time of each successful request
+    """
+
+    def __init__(self, url, max_queue=DEFAULT_MAX_QUEUE, max_batch=DEFAULT_MAX_BATCH, timeout=2.0,
+                 retry_delay=0.5, session=None):
+        """
+        Args:
+            url: Full URL of the server's /data endpoint
+            max_queue: Snapshots held while the server is slow or down
+            max_batch: Most snapshots sent in one request
+            timeout: Seconds before a request is abandoned
+            retry_delay: First back-off after a failure; doubles up to MAX_RETRY_DELAY
+            session: requests.Session to use instead of a new one
+        """
+        self.url = url
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.session = session if session is not None else requests.Session()
+        self.queue = deque(maxlen=max_queue)
+        self._condition = threading.Condition()
+
+        self.sent = 0
+        self.dropped = 0
+        self.failures = 0
+        self.batches = 0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self._latency_total = 0.0
+
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, payload):
+        """Queue a snapshot dict for sending; never blocks on the network"""
+        with self._condition:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1 # deque(maxlen) discards the oldest on append
+            self.queue.append(payload)
+            self._condition.notify()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="TelemetryUplink", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stop the worker after one last attempt to send what is queued
+
+        Args:
+            timeout: Seconds to wait for that attempt; defaults to the request timeout
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(self.timeout if timeout is None else timeout)
+            self._thread = None
+        self.session.close()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _take_batch(self):
+        count = min(len(self.queue), self.max_batch)
+        return [self.queue.popleft() for _ in range(count)]
+
+    def _requeue(self, batch):
+        # Put a failed batch back in front of newer snapshots, keeping only what fits
+        room = self.queue.maxlen - len(self.queue)
+        if room < len(batch):
+            self.dropped += len(batch) - room
+            batch = batch[len(batch) - room:]
+        self.queue.extendleft(reversed(batch))
+
+    def _run(self):
+        delay = self.retry_delay
+        while True:
+            with self._condition:
+                while not self.queue and not self._stopping:
+                    self._condition.wait()
+                if not self.queue:
+                    return
+                stopping = self._stopping
+                batch = self._take_batch()
+
+            if self._send(batch):
+                delay = self.retry_delay
+                continue
+            with self._condition:
+                self._requeue(batch)
+                if stopping:
+                    return
+                self._condition.wait(delay) # stop() cuts the back-off short
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _send(self, batch):
+        """
+        Returns:
+            False if the batch should be retried, True once the server took it or it was dropped
+        """
+        body = batch[0] if len(batch) == 1 else {"batch": batch}
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url, json=body, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            self.failures += 1
+            print(f"Error sending data to server: {e}")
+            if is_transient(e):
+                return False
+            self.dropped += len(batch)
+            return True
+        latency = time.perf_counter() - start
+        self.latency_last = latency
+        self._latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.batches += 1
+        self.sent += len(batch)
+        return True
+
+    def stats(self):
+        """Snapshot of the queue depth, counters and request latency"""
+        return {
+            "queue_depth": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "failures": self.failures,
+            "batches": self.batches,
+            "latency_last_ms": self.latency_last * 1000.0,
+            "latency_mean_ms": (self._latency_total / self.batches * 1000.0) if self.batches else 0.0,
+            "latency_max_ms": self.latency_max * 1000.0,
+        }
+
+
+def pack_vitals_batch(snapshots, waveform_start=None, waveform=None, rate_hz=None):
+    """
+    Build a vitals_batch event payload
+
+    Args:
+        snapshots: List of send_data() payloads, oldest first
+        waveform_start: Wall-clock time of the first waveform sample
+        waveform: Waveform samples in ADC units; rounded and clipped to int16
+        rate_hz: Waveform sample rate
+
+    Returns:
+        dict with the packed binary blocks described in the module docstring
+    """
+    if snapshots:
+        t0 = float(snapshots[0]["timestamp"])
+    else:
+        t0 = float(waveform_start) if waveform_start is not None else time.time()
+
+    rows = np.full((len(snapshots), 1 + len(VITALS_FIELDS)), np.nan, dtype="<f4")
+    for row, snapshot in zip(rows, snapshots):
+        row[0] = snapshot["timestamp"] - t0
+        for column, field in enumerate(VITALS_FIELDS, 1):
+            if snapshot.get(field) is not None:
+                row[column] = snapshot[field]
+
+    if waveform is not None and len(waveform):
+        samples = np.clip(np.rint(np.nan_to_num(waveform)), -32768, 32767).astype("<i2")
+        start = waveform_start - t0
+    else:
+        samples = np.zeros(0, dtype="<i2")
+        start = 0.0
+    return {
+        "rate_hz": float(rate_hz) if rate_hz else 0.0,
+        "t0": t0,
+        "waveform_start": start,
+        "waveform": samples.tobytes(),
+        "vitals": rows.tobytes(),
+    }
+
+
+class VitalsBatchStreamer:
+    """
+    Sends vitals snapshots and the sensor waveform as binary vitals_batch
+    Socket.IO events from a background thread
+
+    Every `interval` it packs the snapshots submitted since the last event
+    and the waveform samples written since then into one event. While the
+    socket is down nothing is buffered here; NORA sends snapshots through
+    TelemetryUplink instead, and the waveform is simply skipped. Snapshots
+    only leave the queue once their event was emitted: if the socket drops
+    first or the emit raises, they go to `fallback` (or back to the front
+    of the queue without one), and so do any left over at stop().
+
+    Counters:
+        batches: Events emitted
+        samples: Waveform samples emitted
+        bytes: Binary payload bytes emitted
+        dropped: Waveform samples overwritten before they could be sent
+        errors: Emits that raised
+        snapshots_dropped: Snapshots discarded because the queue was full
+    """
+
+    def __init__(self, sio, waveform=None, rate_hz=None, interval=STREAM_INTERVAL, max_snapshots=DEFAULT_MAX_QUEUE,
+                 fallback=None):
+        """
+        Args:
+            sio: Connected (or connecting) socketio.Client
+            waveform: RingBuffer of (t, value) records to stream, t on time.monotonic(), or None for vitals only
+            rate_hz: Waveform sample rate
+            interval: Seconds between events
+            max_snapshots: Snapshots held between events; the oldest is dropped beyond this
+            fallback: Where snapshots go when they cannot be emitted (e.g. a TelemetryUplink), or None
+        """
+        self.sio = sio
+        self.waveform = waveform
+        self.rate_hz = rate_hz
+        self.interval = interval
+        self.fallback = fallback
+        self.snapshots = deque(maxlen=max_snapshots)
+        self._lock = threading.Lock()
+        self.cursor = waveform.count if waveform is not None else 0
+        # Sample times are converted to wall time with one fixed offset, so consecutive blocks stay contiguous
+        self.clock_offset = time.time() - time.monotonic()
+
+        self.batches = 0
+        self.samples = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.errors = 0
+        self.snapshots_dropped = 0
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def submit(self, payload):
+        """Queue a snapshot dict for the next event; never blocks"""
+        with self._lock:
+            if len(self.snapshots) == self.snapshots.maxlen:
+                self.snapshots_dropped += 1
+            self.snapshots.append(payload)
+
+    def _take_snapshots(self):
+        with self._lock:
+            snapshots = list(self.snapshots)
+            self.snapshots.clear()
+        return snapshots
+
+    def _give_back(self, snapshots):
+        # Snapshots that were not emitted: to the fallback, or back in front of newer ones, keeping only what fits
+        if self.fallback is not None:
+            for snapshot in snapshots:
+                self.fallback.submit(snapshot)
+            return
+        with self._lock:
+            pending = snapshots + list(self.snapshots)
+            overflow = max(0, len(pending) - self.snapshots.maxlen)
+            self.snapshots_dropped += overflow
+            self.snapshots.clear()
+            self.snapshots.extend(pending[overflow:])
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="VitalsBatchStreamer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.fallback is not None:
+            self._give_back(self._take_snapshots())
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._emit()
+            except Exception as e:
+                print(f"Error streaming vitals: {e}")
+
+    def _emit(self):
+        samples = None
+        if self.waveform is not None:
+            samples, self.cursor, dropped = self.waveform.read_since(self.cursor)
+            self.dropped += dropped
+        if not self.sio.connected:
+            if self.fallback is not None:
+                self._give_back(self._take_snapshots())
+            return
+
+        snapshots = self._take_snapshots()
+        if not snapshots and (samples is None or not len(samples)):
+            return
+        waveform_start = None
+        if samples is not None and len(samples):
+            waveform_start = samples["t"][0] + self.clock_offset
+            samples = samples["value"]
+        else:
+            samples = None
+
+        payload = pack_vitals_batch(snapshots, waveform_start, samples, self.rate_hz)
+        try:
+            self.sio.emit("vitals_batch", payload)
+        except Exception:
+            self.errors += 1
+            self._give_back(snapshots)
+            raise
+        self.batches += 1
+        self.samples += 0 if samples is None else len(samples)
+        self.bytes += len(payload["waveform"]) + len(payload["vitals"])
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "samples": self.samples,
+            "bytes": self.bytes,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "snapshots_dropped": self.snapshots_dropped,
+            "pending_snapshots": len(self.snapshots),
+        }
@@ -0,0 +1,214 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+import unittest
+
+import numpy as np
+
+os.environ["NORA_SERVER_MODE"] = "development" # threading workers; no gevent monkey patching in tests
+import server
+from history_store import TimeSeries, WAVEFORM_SERIES
+
+logging.getLogger("nora.server").setLevel(logging.WARNING) # connect/disconnect lines would drown the test output
+
+# To run type (from Web_Vital_Dashboard): python -m unittest Server_tests.py
+
+
+class TimeSeries_tests(unittest.TestCase):
+
+    def filled(self, capacity, count):
+        series = TimeSeries(capacity)
+        for i in range(count):
+            series.append(1000.0 + i, float(i))
+        return series
+
+    def test_raw_and_stepped_query(self):
+        series = self.filled(100, 50)
+        self.assertEqual(series.query(1010, 1013), {"t": [1010, 1011, 1012], "value": [10, 11, 12]})
+        stepped = series.query(1010, 1020, 5)
+        self.assertEqual(stepped["t"], [1010, 1015])
+        self.assertEqual(stepped["mean"], [12, 17])
+        self.assertEqual((stepped["min"], stepped["max"], stepped["count"]), ([10, 15], [14, 19], [5, 5]))
+
+    def test_query_across_the_wrap(self):
+        series = self.filled(10, 15)
+        self.assertEqual(series.query()["value"], list(range(5, 15)))
+        self.assertEqual(series.query(step=5)["mean"], [7, 12])
+
+    def test_out_of_order_points_are_dropped(self):
+        series = self.filled(10, 3)
+        series.append(1000.5, 99.0)
+        self.assertEqual((len(series), series.out_of_order), (3, 1))
+
+    def test_extend_regular_drops_only_the_overlap(self):
+        series = TimeSeries(100)
+        series.extend_regular(0.0, 10, [0, 1, 2, 3, 4])
+        series.extend_regular(0.3, 10, [3, 4, 5, 6]) # first two samples already stored
+        result = series.query()
+        self.assertEqual(result["value"], [0, 1, 2, 3, 4, 5, 6])
+        np.testing.assert_allclose(result["t"], np.arange(7) / 10)
+        self.assertEqual(series.out_of_order, 2)
+        series.extend_regular(0.0, 10, [9, 9]) # wholly old
+        self.assertEqual((len(series), series.out_of_order), (7, 4))
+
+    def test_extend_regular_longer_than_capacity(self):
+        series = TimeSeries(4)
+        series.extend_regular(0.0, 1, list(range(10)))
+        self.assertEqual(series.query(), {"t": [6, 7, 8, 9], "value": [6, 7, 8, 9]})
+
+    def test_huge_range_is_clamped(self):
+        series = self.filled(100, 50)
+        result = series.query(-1e308, 1e308, 1)
+        self.assertTrue(all(math.isfinite(t) for t in result["t"]))
+        self.assertEqual((result["t"][0], sum(result["count"])), (1000, 50))
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        server.DEVICES.clear()
+        server.SID_DEVICES.clear()
+        self.client = server.app.test_client()
+
+    def post(self, body):
+        return self.client.post("/data", json=body)
+
+    def snapshot(self, device_id, timestamp, hr=70):
+        return {"device_id": device_id, "timestamp": timestamp, "hr": hr, "spo2": 98, "bp_sys": 120, "bp_dia": 80}
+
+
+class Http_tests(ServerTestCase):
+
+    def test_post_and_get(self):
+        response = self.post(self.snapshot("a", 1000.0, hr=72))
+        self.assertEqual(response.status_code, 200)
+        state = self.client.get("/data?device_id=a").get_json()
+        self.assertEqual((state["device_id"], state["heart_rate"], state["spo2"]), ("a", 72, 98))
+        self.assertIn("a", self.client.get("/devices").get_json())
+
+    def test_batch_post(self):
+        batch = [self.snapshot("a", 1000.0 + i, hr=60 + i) for i in range(3)]
+        state = self.post({"batch": batch}).get_json()
+        self.assertEqual(state["heart_rate"], 62)
+        history = self.client.get("/history?device_id=a&vitals=heart_rate").get_json()
+        self.assertEqual(history["series"]["heart_rate"]["value"], [60, 61, 62])
+
+    def test_unknown_device(self):
+        self.post(self.snapshot("a", 1000.0))
+        for url in ("/data?device_id=b", "/history?device_id=b"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertIn("unknown device 'b'", response.get_json()["error"])
+        self.assertNotIn("b", server.DEVICES) # reads never create state
+
+    def test_etag_and_not_modified(self):
+        self.post(self.snapshot("a", 1000.0))
+        response = self.client.get("/data?device_id=a")
+        tag = response.headers["ETag"].strip('"')
+        self.assertEqual(tag, response.get_json()["version"])
+        self.assertTrue(tag.startswith(server.BOOT_ID + "-"))
+
+        response = self.client.get("/data?device_id=a", headers={"If-None-Match": f'"{tag}"'})
+        self.assertEqual((response.status_code, response.data), (304, b""))
+        self.assertEqual(self.client.get(f"/data?device_id=a&version={tag}").status_code, 304)
+
+        self.post(self.snapshot("a", 1001.0))
+        response = self.client.get("/data?device_id=a", headers={"If-None-Match": f'"{tag}"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.get_json()["version"], tag)
+
+    def test_long_poll(self):
+        self.post(self.snapshot("a", 1000.0))
+        tag = self.client.get("/data?device_id=a").get_json()["version"]
+
+        start = time.monotonic()
+        response = self.client.get(f"/data?device_id=a&version={tag}&wait=0.1")
+        self.assertEqual(response.status_code, 304) # nothing changed within the wait
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+        timer = threading.Timer(0.1, lambda: server.get_device("a").mark_changed())
+        timer.start()
+        start = time.monotonic()
+        response = self.client.get(f"/data?device_id=a&version={tag}&wait=5")
+        timer.join()
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - start, 2.0) # answered on the change, not after the wait
+        self.assertEqual(self.client.get("/data?device_id=a&wait=nan").status_code, 400)
+
+    def test_history_ranges(self):
+        self.post({"batch": [self.snapshot("a", 1000.0 + i, hr=60 + i) for i in range(10)]})
+        history = self.client.get("/history?device_id=a&vitals=heart_rate&since=1002&until=1008&step=3").get_json()
+        self.assertEqual(history["series"]["heart_rate"]["mean"], [63, 66])
+
+        response = self.client.get("/history?device_id=a&since=-1e308&until=1e308&step=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b"Infinity", response.data)
+        json.loads(response.data, parse_constant=lambda name: self.fail(f"{name} in /history response"))
+
+        for query in ("since=inf", "step=0", "step=nan", "vitals=nope"):
+            self.assertEqual(self.client.get(f"/history?device_id=a&{query}").status_code, 400, query)
+
+    def test_metrics(self):
+        self.post(self.snapshot("a", 1000.0))
+        self.client.get("/data?device_id=a")
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('nora_http_requests_total{route="/data",method="POST",status="200"}', text)
+        self.assertIn('nora_vitals_updates_total{device_id="a"}', text)
+        self.assertIn("nora_devices 1", text)
+        self.assertIn("# TYPE nora_http_request_duration_seconds histogram", text)
+
+
+class SocketIO_tests(ServerTestCase):
+
+    def connect(self, device_id):
+        client = server.socketio.test_client(server.app, query_string=f"device_id={device_id}")
+        client.get_received()
+        return client
+
+    def test_updates_stay_in_the_device_room(self):
+        self.post(self.snapshot("a", 1000.0))
+        self.post(self.snapshot("b", 1000.0))
+        a1, a2, b = self.connect("a"), self.connect("a"), self.connect("b")
+
+        ack = a1.emit("update_flow_rate", {"flow_rate": 12}, callback=True)
+        self.assertEqual(ack, {"status": "success", "flow_rate": 12})
+        self.assertEqual([(event["name"], event["args"]) for event in a2.get_received()],
+                         [("flow_rate_update", [{"flow_rate": 12}])])
+        self.assertEqual(a1.get_received(), [])
+        self.assertEqual(b.get_received(), [])
+        self.assertEqual((server.get_device("a").flow_rate, server.get_device("b").flow_rate), (12, 0))
+        for client in (a1, a2, b):
+            client.disconnect()
+
+    def test_unknown_device(self):
+        client = self.connect("nobody")
+        self.assertEqual(client.emit("update_flow_rate", {"flow_rate": 5}, callback=True)["status"], "error")
+        self.assertEqual(client.emit("select_device", {"device_id": "other"}, callback=True)["status"], "error")
+        self.assertEqual(server.DEVICES, {})
+        client.disconnect()
+
+    def test_vitals_batch(self):
+        client = self.connect("a")
+        vitals = np.array([[0.0, 72, 98, np.nan, np.nan], [1.0, 73, 97, 120, 80]], dtype="<f4")
+        waveform = np.arange(50, dtype="<i2")
+        ack = client.emit("vitals_batch", {"device_id": "a", "t0": 1000.0, "rate_hz": 250.0, "waveform_start": 0.5,
+                                           "vitals": vitals.tobytes(), "waveform": waveform.tobytes()}, callback=True)
+        self.assertEqual(ack, {"status": "success", "vitals": 2, "samples": 50})
+
+        device = server.get_device("a")
+        self.assertEqual((device.data["heart_rate"], device.data["bp_sys"]), (73, 120))
+        pleth = device.history.series[WAVEFORM_SERIES].query()
+        self.assertEqual(pleth["value"], list(range(50)))
+        self.assertAlmostEqual(pleth["t"][0], 1000.5)
+        client.disconnect()
+
+    def test_subscribe_vitals_sends_current_state(self):
+        self.post(self.snapshot("a", 1000.0, hr=81))
+        client = self.connect("a")
+        self.assertEqual(client.emit("subscribe_vitals", callback=True), {"status": "success"})
+        frames = [event for event in client.get_received() if event["name"] == "vitals_frame"]
+        self.assertEqual(json.loads(frames[0]["args"][0])["heart_rate"], 81)
+        client.disconnect()
@@ -0,0 +1,280 @@
+"""
+In-memory vitals history
+
+Each series is a fixed-capacity ring of (timestamp, value) pairs held in two
+array("d") buffers, so memory use is set at startup (16 bytes per point) and
+never grows. Points are appended in time order; range queries find their
+ends with bisect over the ring in logical order and aggregate each time
+bucket with the C-level min()/max()/sum() on array slices.
+"""
+
+import argparse
+import bisect
+import math
+import random
+import threading
+import time
+from array import array
+
+VITAL_SERIES = ("heart_rate", "spo2", "bp_sys", "bp_dia")
+WAVEFORM_SERIES = "pleth"
+VITALS_HISTORY_SECONDS = 8 * 3600      # at about one snapshot per second
+WAVEFORM_HISTORY_SECONDS = 600     # per device; 2.4 MB at 250 Hz
+WAVEFORM_RATE_HZ = 250
+MAX_RAW_POINTS = 5000                  # larger unstepped queries are bucketed automatically
+MAX_BUCKETS = 5000
+
+
+class _LogicalTimes:
+    """Read-only sequence view of a ring's timestamps, oldest first, for bisect"""
+
+    def __init__(self, series):
+        self.series = series
+
+    def __len__(self):
+        return self.series.count
+
+    def __getitem__(self, i):
+        series = self.series
+        return series.times[(series.start + i) % series.capacity]
+
+
+class TimeSeries:
+    """
+    Ring buffer of (timestamp, value) points with range queries
+
+    Counters:
+        out_of_order: Points dropped because they were older than the newest point
+    """
+
+    def __init__(self, capacity):
+        """
+        Args:
+            capacity: Points kept before the oldest is overwritten
+        """
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.capacity = int(capacity)
+        self.times = array("d", bytes(8 * self.capacity))
+        self.values = array("d", bytes(8 * self.capacity))
+        self.start = 0
+        self.count = 0
+        self.out_of_order = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def _last_time(self):
+        return self.times[(self.start + self.count - 1) % self.capacity] if self.count else float("-inf")
+
+    def append(self, t, value):
+        with self._lock:
+            if t < self._last_time():
+                self.out_of_order += 1
+                return
+            end = (self.start + self.count) % self.capacity
+            self.times[end] = t
+            self.values[end] = value
+            if self.count < self.capacity:
+                self.count += 1
+            else:
+                self.start = (self.start + 1) % self.capacity
+
+    def extend_regular(self, t0, rate_hz, values):
+        """
+        Append evenly spaced samples (e.g. a waveform block)
+
+        Leading samples at or before the newest point (a block overlapping
+        the previous one) are dropped; the rest of the block is kept.
+
+        Args:
+            t0: Timestamp of values[0]
+            rate_hz: Samples per second
+            values: Sequence of numbers
+        """
+        period = 1.0 / rate_hz
+        n = len(values)
+        if n == 0:
+            return
+        with self._lock:
+            # Samples up to and including the newest point's time (within rounding) are already stored
+            skip = 0
+            if self.count:
+                skip = min(n, max(0, math.floor((self._last_time() - t0) * rate_hz + 1e-6) + 1))
+            if skip:
+                self.out_of_order += skip
+                if skip == n:
+                    return
+                t0 += skip * period
+                values = values[skip:]
+                n -= skip
+            if n > self.capacity:
+                t0 += (n - self.capacity) * period
+                values = values[n - self.capacity:]
+                n = self.capacity
+            times = array("d", [t0 + i * period for i in range(n)])
+            values = array("d", values)
+
+            end = (self.start + self.count) % self.capacity
+            first = min(n, self.capacity - end)
+            self.times[end:end + first] = times[:first]
+            self.values[end:end + first] = values[:first]
+            if first < n:
+                self.times[:n - first] = times[first:]
+                self.values[:n - first] = values[first:]
+
+            total = self.count + n
+            if total > self.capacity:
+                self.start = (self.start + total - self.capacity) % self.capacity
+            self.count = min(total, self.capacity)
+
+    def _segments(self, lo, hi):
+        # Physical slices covering logical points [lo, hi); two when the range wraps
+        a = (self.start + lo) % self.capacity
+        b = a + (hi - lo)
+        if b <= self.capacity:
+            return [(a, b)]
+        return [(a, self.capacity), (0, b - self.capacity)]
+
+    def index_range(self, since=None, until=None):
+        """Logical indices [lo, hi) of points with since <= t < until"""
+        times = _LogicalTimes(self)
+        lo = 0 if since is None else bisect.bisect_left(times, since)
+        hi = self.count if until is None else bisect.bisect_left(times, until)
+        return lo, max(lo, hi)
+
+    def query(self, since=None, until=None, step=None):
+        """
+        Points in [since, until), raw or aggregated into buckets of `step` seconds
+
+        The points are copied out under the lock and aggregated after it is
+        released, so appends never wait for a long query.
+
+        Returns:
+            {"t": [...], "value": [...]} for raw points, or
+            {"t": [bucket starts], "mean": [...], "min": [...], "max": [...], "count": [...]}
+            when stepped. Buckets start at `since`, or at the first point if
+            that is later. Unstepped ranges of more than MAX_RAW_POINTS are
+            stepped automatically; at most MAX_BUCKETS buckets are returned.
+        """
+        with self._lock:
+            lo, hi = self.index_range(since, until)
+            (a, b), *wrapped = self._segments(lo, hi)
+            times, values = self.times[a:b], self.values[a:b]
+            for a, b in wrapped:
+                times += self.times[a:b]
+                values += self.values[a:b]
+        n = len(times)
+        if n == 0:
+            return {"t": [], "value": []} if not step else \
+                {"t": [], "mean": [], "min": [], "max": [], "count": []}
+
+        # Clamp to the points found, so a huge finite range cannot overflow the bucket arithmetic
+        first, last = times[0], times[-1]
+        origin = first if since is None else max(since, first)
+        end = last if until is None else min(until, last)
+        if not step and n > MAX_RAW_POINTS:
+            step = (end - origin) / MAX_BUCKETS
+        if not step:
+            return {"t": times.tolist(), "value": values.tolist()}
+
+        step = max(step, (end - origin) / MAX_BUCKETS)
+        result = {"t": [], "mean": [], "min": [], "max": [], "count": []}
+        bucket = int((first - origin) // step)
+        i = 0
+        while i < n:
+            bucket_start = origin + bucket * step
+            j = bisect.bisect_left(times, bucket_start + step, i, n)
+            if j > i:
+                chunk = values[i:j]
+                result["t"].append(bucket_start)
+                result["mean"].append(sum(chunk) / (j - i))
+                result["min"].append(min(chunk))
+                result["max"].append(max(chunk))
+                result["count"].append(j - i)
+                i = j
+                bucket += 1
+            else:
+                # Jump over empty buckets straight to the next point
+                bucket = max(bucket + 1, int((times[i] - origin) // step))
+        return result
+
+
+class HistoryStore:
+    """Named TimeSeries for every vital plus the streamed waveform"""
+
+    def __init__(self, vitals_capacity=VITALS_HISTORY_SECONDS,
+                 waveform_capacity=WAVEFORM_HISTORY_SECONDS * WAVEFORM_RATE_HZ):
+        self.series = {name: TimeSeries(vitals_capacity) for name in VITAL_SERIES}
+        self.series[WAVEFORM_SERIES] = TimeSeries(waveform_capacity)
+
+    def append(self, name, t, value):
+        self.series[name].append(t, value)
+
+    def query(self, names=None, since=None, until=None, step=None):
+        """
+        Returns:
+            dict of series name -> TimeSeries.query() result
+        """
+        names = names or VITAL_SERIES
+        unknown = [name for name in names if name not in self.series]
+        if unknown:
+            raise KeyError(f"Unknown series {', '.join(unknown)}")
+        return {name: self.series[name].query(since, until, step) for name in names}
+
+
+def benchmark_history(hours=4.0, queries=100):
+    """
+    Fill 1 Hz vitals and 250 Hz waveform series with `hours` of data and time
+    range queries against them
+
+    Returns:
+        dict of timings in ms (fill time in seconds)
+    """
+    rate = WAVEFORM_RATE_HZ
+    store = HistoryStore(vitals_capacity=int(hours * 3600),
+                         waveform_capacity=int(hours * 3600 * rate))
+    vitals = store.series["heart_rate"]
+    waveform = store.series[WAVEFORM_SERIES]
+    t0 = 1.7e9
+    n_vitals = int(hours * 3600)
+
+    start = time.perf_counter()
+    for i in range(n_vitals):
+        vitals.append(t0 + i, 60 + 20 * random.random())
+    block = [512.0 + 100.0 * random.random() for _ in range(rate)]
+    for second in range(n_vitals):
+        waveform.extend_regular(t0 + second, rate, block)
+    fill_s = time.perf_counter() - start
+
+    results = {"fill_s": fill_s, "vitals_points": len(vitals), "waveform_points": len(waveform)}
+    span = hours * 3600
+    cases = {
+        "vitals_last_5min_raw": (vitals, 300, None),
+        "vitals_full_1min_step": (vitals, span, 60),
+        "waveform_last_10s_raw": (waveform, 10, None),
+        "waveform_last_1h_1s_step": (waveform, min(span, 3600), 1),
+    }
+    for label, (series, window, step) in cases.items():
+        end = t0 + span
+        start = time.perf_counter()
+        for _ in range(queries):
+            result = series.query(end - window, end, step)
+        results[label + "_ms"] = (time.perf_counter() - start) / queries * 1000.0
+        results[label + "_points"] = len(result["t"])
+
+    print(f"History store: {hours:g} h of 1 Hz vitals ({results['vitals_points']} points) and "
+          f"{rate} Hz waveform ({results['waveform_points']} points), filled in {fill_s:.1f} s")
+    for label in cases:
+        print(f"{label:28s} | {results[label + '_ms']:9.3f} ms/query | {results[label + '_points']:6d} points")
+    return results
+
+
+# Usage: python history_store.py --hours 4
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="History store range query benchmark")
+    parser.add_argument("--hours", type=float, default=4.0, help="hours of data to hold")
+    parser.add_argument("--queries", type=int, default=100, help="repetitions per query type")
+    args = parser.parse_args()
+    benchmark_history(args.hours, args.queries)
@@ -0,0 +1,170 @@
+"""
+Load test for server.py: connection capacity and broadcast latency
+
+For each server mode, starts server.py on its own port and opens dashboard
+viewers (Socket.IO clients subscribed to vitals) in batches of --ramp until
+--clients are connected or a batch mostly fails. Then a simulated NORA unit
+posts --updates vitals snapshots and every viewer records when the matching
+vitals_frame arrives. Latency is measured from the POST to each arrival.
+
+Viewers are socketio.AsyncClient instances, so this script needs aiohttp
+(pip install aiohttp); production mode needs gevent (pip install gevent
+gevent-websocket) or eventlet on the server side.
+
+Usage: python loadtest.py --clients 300 --modes development production
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+import aiohttp
+import socketio
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+FIRST_SEQUENCE = 1000 # hr values used as sequence numbers for the posted snapshots
+
+
+def start_server(mode, port, broadcast_interval):
+    """Run server.py in a subprocess and wait until it answers GET /data"""
+    env = dict(os.environ, NORA_SERVER_MODE=mode, NORA_SERVER_PORT=str(port),
+               NORA_BROADCAST_INTERVAL=str(broadcast_interval))
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/data", timeout=1).read()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f"server.py exited with code {process.returncode} in {mode} mode")
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"server.py did not start in {mode} mode")
+
+
+class Viewer:
+    """One dashboard: a Socket.IO connection subscribed to vitals frames"""
+
+    def __init__(self, arrivals):
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.client.on("vitals_frame", self.on_frame)
+        self.arrivals = arrivals
+
+    async def on_frame(self, frame):
+        sequence = json.loads(frame)["heart_rate"]
+        if sequence >= FIRST_SEQUENCE:
+            self.arrivals.setdefault(sequence, []).append(time.perf_counter())
+
+    async def connect(self, url, timeout):
+        await self.client.connect(url, transports=["websocket"], wait_timeout=timeout)
+        await self.client.call("subscribe_vitals", timeout=timeout)
+
+
+async def connect_viewers(url, total, ramp, timeout, arrivals):
+    """
+    Returns:
+        (connected viewers, connect times in seconds, failed attempts)
+    """
+    viewers, connect_times, failures = [], [], 0
+
+    async def attempt():
+        viewer = Viewer(arrivals)
+        start = time.perf_counter()
+        try:
+            await viewer.connect(url, timeout)
+        except Exception:
+            return None, None
+        return viewer, time.perf_counter() - start
+
+    while len(viewers) < total:
+        batch = min(ramp, total - len(viewers))
+        results = await asyncio.gather(*(attempt() for _ in range(batch)))
+        succeeded = [(viewer, t) for viewer, t in results if viewer is not None]
+        failures += batch - len(succeeded)
+        for viewer, t in succeeded:
+            viewers.append(viewer)
+            connect_times.append(t)
+        if len(succeeded) < batch / 2:
+            break # server has stopped accepting connections in time
+    return viewers, connect_times, failures
+
+
+async def run_mode(mode, port, args):
+    url = f"http://127.0.0.1:{port}"
+    process = start_server(mode, port, args.broadcast_interval)
+    arrivals = {}
+    try:
+        viewers, connect_times, failures = await connect_viewers(url, args.clients, args.ramp,
+                                                                 args.timeout, arrivals)
+        await asyncio.sleep(1.0)
+
+        sent = {}
+        async with aiohttp.ClientSession() as session:
+            for k in range(args.updates):
+                sequence = FIRST_SEQUENCE + k
+                sent[sequence] = time.perf_counter()
+                async with session.post(f"{url}/data", json={"timestamp": time.time(), "hr": sequence}) as response:
+                    await response.read()
+                await asyncio.sleep(args.update_interval)
+        await asyncio.sleep(2.0)
+
+        latencies = [arrival - sent[sequence] for sequence, times in arrivals.items() for arrival in times]
+        expected = len(viewers) * args.updates
+        for viewer in viewers:
+            try:
+                await viewer.client.disconnect()
+            except Exception:
+                pass
+    finally:
+        process.terminate()
+        process.wait(10)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "connected": len(viewers),
+        "failed": failures,
+        "connect_ms_p50": statistics.median(connect_times) * 1000 if connect_times else 0.0,
+        "delivered": len(latencies) / expected if expected else 0.0,
+        "latency_ms_p50": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "latency_ms_p95": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        "latency_ms_max": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+async def main(args):
+    results = []
+    for i, mode in enumerate(args.modes):
+        print(f"Testing {mode} mode with up to {args.clients} viewers...")
+        results.append(await run_mode(mode, args.port + i, args))
+
+    print(f"{'mode':12s} | {'connected':>9s} | {'failed':>6s} | {'connect p50':>11s} | {'delivered':>9s} | "
+          f"{'latency p50':>11s} | {'p95':>9s} | {'max':>9s}")
+    for r in results:
+        print(f"{r['mode']:12s} | {r['connected']:9d} | {r['failed']:6d} | {r['connect_ms_p50']:8.1f} ms | "
+              f"{r['delivered']:8.1%} | {r['latency_ms_p50']:8.1f} ms | {r['latency_ms_p95']:6.1f} ms | "
+              f"{r['latency_ms_max']:6.1f} ms")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare server.py modes under many dashboard viewers")
+    parser.add_argument("--modes", nargs="+", default=["development", "production"],
+                        choices=["development", "production"])
+    parser.add_argument("--clients", type=int, default=300, help="viewers to try to connect")
+    parser.add_argument("--ramp", type=int, default=50, help="viewers connected at once")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds allowed per connection")
+    parser.add_argument("--updates", type=int, default=20, help="vitals snapshots to post")
+    parser.add_argument("--update-interval", type=float, default=0.5, help="seconds between snapshots")
+    parser.add_argument("--broadcast-interval", type=float, default=0.05,
+                        help="server NORA_BROADCAST_INTERVAL during the test")
+    parser.add_argument("--port", type=int, default=5100, help="first port; one per mode")
+    asyncio.run(main(parser.parse_args()))
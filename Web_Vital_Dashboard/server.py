@@ -1,28 +1,237 @@
-import time
 import os
+
+# production (default): serve on gevent, or eventlet, so one process holds
+# hundreds of WebSocket connections as cheap greenlets; without either of them
+# production warns and falls back to Werkzeug without the debugger.
+# development: the Flask/Werkzeug server with debugger and reloader, one
+# thread per connection.
+# The async library has to patch the standard library before anything else
+# imports it, so the choice is made here, from NORA_SERVER_MODE.
+SERVER_MODE = os.environ.get("NORA_SERVER_MODE", "production")
+ASYNC_MODE = "threading"
+if SERVER_MODE == "production":
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+        ASYNC_MODE = "gevent"
+    except ImportError:
+        try:
+            import eventlet
+            eventlet.monkey_patch()
+            ASYNC_MODE = "eventlet"
+        except ImportError:
+            pass # warned about in __main__; falls back to Werkzeug
+
+import time
+import sys
 import json
-from flask import Flask, request, jsonify, send_from_directory
+import math
+import functools
+import logging
+import threading
+from array import array
+from flask import Flask, request, jsonify, send_from_directory, g
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from history_store import HistoryStore, VITAL_SERIES, WAVEFORM_SERIES
+from server_logging import configure_logging, socketio_logger
+from server_metrics import Counter, Gauge, Histogram, SIZE_BUCKETS, render
+
+log_handler = configure_logging()
+log = logging.getLogger("nora.server")
 
 app = Flask(__name__, static_folder="build", static_url_path="")
 CORS(app, resources={r"/*": {"origins": "*"}})
-socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
-
-# Store for sensor data
-DATA_STORE = {
-    "timestamp": 0.0,
-    "heart_rate": 0,
-    "spo2": 0,
-    "bp_sys": 0,
-    "bp_dia": 0
-}
-
-# Separate storage for synchronized variables - managed exclusively via WebSockets
-FLOW_RATE = 0          # Flow rate in μL/min
-DESIRED_VOL = 0        # Desired volume in μL
-VOL_GIVEN = 0.0        # Current volume given in μL
-PROCEDURE_RUNNING = False  # Procedure state (running or stopped)
+socketio = SocketIO(app, async_mode=ASYNC_MODE, cors_allowed_origins="*",
+                    logger=socketio_logger(), engineio_logger=socketio_logger())
+
+VITALS_ROW = ("timestamp", "hr", "spo2", "bp_sys", "bp_dia") # float32 columns of a vitals_batch row
+
+# Push updates: every BROADCAST_INTERVAL seconds, each device whose state
+# changed gets one JSON frame, serialized once and emitted to its vitals room
+BROADCAST_INTERVAL = float(os.environ.get("NORA_BROADCAST_INTERVAL", "0.25"))
+broadcaster_started = False
+
+# GET /data long-polls (?wait=) are held open at most this many seconds.
+# Versions served to clients (body "version" and ETag) carry BOOT_ID, so a
+# client's version from before a restart never matches.
+MAX_WAIT = 30.0
+BOOT_ID = f"{int(time.time()):x}"
+
+# One server can serve many NORA units. Every unit (and every dashboard
+# watching it) names its device ID in the Socket.IO connect URL
+# (?device_id=...), in HTTP query strings, or in posted snapshots; clients
+# that don't are attached to DEFAULT_DEVICE_ID. A device's state (about 4 MB
+# of preallocated history) is only created by NORA's own writes, POST /data
+# and vitals_batch; reads of a device that has not reported get a 404.
+DEFAULT_DEVICE_ID = "default"
+
+class DeviceState:
+    """Sensor data, synchronized variables and history of one NORA unit"""
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        # Store for sensor data
+        self.data = {
+            "timestamp": 0.0,
+            "heart_rate": 0,
+            "spo2": 0,
+            "bp_sys": 0,
+            "bp_dia": 0
+        }
+        # Fixed-size history of every vital and of the waveform streamed in vitals_batch events
+        self.history = HistoryStore()
+        self.version = 0        # bumped by mark_changed() whenever current_state() changes
+        self.sent_version = 0   # version of the last broadcast frame
+        self.changed = threading.Condition()
+
+        # Separate storage for synchronized variables - managed exclusively via WebSockets
+        self.flow_rate = 0          # Flow rate in μL/min
+        self.desired_vol = 0        # Desired volume in μL
+        self.vol_given = 0.0        # Current volume given in μL
+        self.procedure_running = False  # Procedure state (running or stopped)
+
+    def mark_changed(self):
+        """Advance the state version and wake long-polling GET /data requests"""
+        with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        """
+        Block until the state version differs from `version`
+
+        Returns:
+            The current version, which is still `version` after a timeout
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    @property
+    def room(self):
+        return device_room(self.device_id)
+
+    @property
+    def vitals_room(self):
+        return vitals_room(self.device_id)
+
+def device_room(device_id):
+    """Socket.IO room of everyone attached to a device (control updates), whether or not it has reported yet"""
+    return f"device:{device_id}"
+
+def vitals_room(device_id):
+    """Socket.IO room of subscribers to a device's vitals frames"""
+    return f"vitals:{device_id}"
+
+DEVICES = {}            # device ID -> DeviceState
+SID_DEVICES = {}        # Socket.IO session ID -> device ID
+devices_lock = threading.Lock()
+
+def get_device(device_id=None, create=False):
+    """
+    DeviceState for device_id
+
+    Args:
+        create: Create the device if it is new (only for NORA's own writes)
+
+    Returns:
+        The DeviceState, or None for an unknown device when not creating
+    """
+    device_id = str(device_id or DEFAULT_DEVICE_ID)
+    device = DEVICES.get(device_id)
+    if device is None and create:
+        with devices_lock:
+            device = DEVICES.get(device_id)
+            if device is None:
+                device = DEVICES[device_id] = DeviceState(device_id)
+    return device
+
+def request_device_id(body=None):
+    """Device ID a request refers to: the body's device_id, the socket's device, or ?device_id="""
+    device_id = (body or {}).get("device_id")
+    if device_id is None and getattr(request, "sid", None) is not None:
+        device_id = SID_DEVICES.get(request.sid)
+    if device_id is None:
+        device_id = request.args.get("device_id")
+    return str(device_id or DEFAULT_DEVICE_ID)
+
+def request_device(body=None, create=False):
+    """DeviceState a request refers to (see request_device_id()), or None if unknown and not creating"""
+    return get_device(request_device_id(body), create)
+
+def unknown_device(device_id):
+    log.debug("Request for unknown device %s", device_id)
+    return {"status": "error", "message": f"unknown device {device_id!r}"}
+
+# Metrics served at GET /metrics (see server_metrics.py)
+HTTP_LATENCY = Histogram("nora_http_request_duration_seconds",
+                         "HTTP request latency; GET /data long-polls are reported as route /data?wait",
+                         ("route", "method"))
+HTTP_REQUESTS = Counter("nora_http_requests_total", "HTTP requests by status", ("route", "method", "status"))
+HTTP_REQUEST_BYTES = Histogram("nora_http_request_bytes", "HTTP request body size", ("route",), SIZE_BUCKETS)
+HTTP_RESPONSE_BYTES = Histogram("nora_http_response_bytes", "HTTP response body size", ("route",), SIZE_BUCKETS)
+SOCKET_EVENTS = Counter("nora_socketio_events_total", "Socket.IO events received", ("event",))
+SOCKET_EVENT_LATENCY = Histogram("nora_socketio_event_duration_seconds", "Socket.IO event handler time", ("event",))
+SOCKET_PAYLOAD_BYTES = Histogram("nora_socketio_binary_payload_bytes", "Binary attachment bytes per event",
+                                 ("event",), SIZE_BUCKETS)
+VITALS_UPDATES = Counter("nora_vitals_updates_total", "Vitals snapshots applied", ("device_id",))
+FANOUT_LATENCY = Histogram("nora_broadcast_fanout_seconds", "Time to emit one event to a device room", ("event",))
+FRAME_BYTES = Histogram("nora_vitals_frame_bytes", "Size of each serialized vitals_frame", (), SIZE_BUCKETS)
+
+def room_sizes(room_of):
+    """Clients in each device's room, keyed by (device_id,)"""
+    rooms = socketio.server.manager.rooms.get("/", {})
+    return {(device.device_id,): len(rooms.get(room_of(device), ()))
+            for device in list(DEVICES.values())}
+
+Gauge("nora_devices", "NORA units the server holds state for", lambda: len(DEVICES))
+Gauge("nora_connected_clients", "Socket.IO clients attached to each device",
+      lambda: room_sizes(lambda device: device.room), ("device_id",))
+Gauge("nora_vitals_subscribers", "Clients subscribed to each device's vitals frames",
+      lambda: room_sizes(lambda device: device.vitals_room), ("device_id",))
+Gauge("nora_log_records_suppressed", "Log records dropped by the rate limit",
+      lambda: log_handler.filters[0].suppressed)
+Gauge("nora_log_records_dropped", "Log records dropped because the log queue was full",
+      lambda: log_handler.dropped)
+
+def observed_event(event):
+    """socketio.on(event) that also counts the event and times its handler"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def observed(*args):
+            SOCKET_EVENTS.inc(event)
+            with SOCKET_EVENT_LATENCY.time(event):
+                return handler(*args)
+        return socketio.on(event)(observed)
+    return decorator
+
+def metrics_route():
+    """Route label for the current request"""
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    if route == "/data" and request.method == "GET" and request.args.get("wait"):
+        route = "/data?wait"
+    return route
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    route = metrics_route()
+    HTTP_LATENCY.observe(time.perf_counter() - g.request_start, route, request.method)
+    HTTP_REQUESTS.inc(route, request.method, response.status_code)
+    HTTP_REQUEST_BYTES.observe(request.content_length or 0, route)
+    HTTP_RESPONSE_BYTES.observe(response.content_length or 0, route)
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Prometheus scrape endpoint
+    """
+    return app.response_class(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.route("/nora", methods=["GET"])
 def serve_react_app():
@@ -31,158 +240,406 @@ def serve_react_app():
     """
     return send_from_directory(app.static_folder, "index.html")
 
-@app.route("/data", methods=["POST"])
-def data_endpoint():
+def apply_snapshot(device, body):
     """
-    Endpoint where the pi pushes sensor data
-    Flow rate is handled separately via WebSockets
+    Copy one vitals snapshot from the pi into the device's data; missing vitals keep their last value
     """
-    global DATA_STORE
-    body = request.get_json()
-    incoming_ts = float(body["timestamp"])
+    store = device.data
+    store["timestamp"] = float(body["timestamp"])
     incoming_hr = body.get("hr", None)
     incoming_spo2 = body.get("spo2", None)
     incoming_sys = body.get("bp_sys", None)
     incoming_dia = body.get("bp_dia", None)
 
-    # Update sensor data 
-    DATA_STORE["timestamp"] = incoming_ts
     if incoming_hr is not None:
-        DATA_STORE["heart_rate"] = incoming_hr
+        store["heart_rate"] = incoming_hr
     if incoming_spo2 is not None:
-        DATA_STORE["spo2"] = incoming_spo2
+        store["spo2"] = incoming_spo2
     if incoming_sys is not None:
-        DATA_STORE["bp_sys"] = incoming_sys
+        store["bp_sys"] = incoming_sys
     if incoming_dia is not None:
-        DATA_STORE["bp_dia"] = incoming_dia
+        store["bp_dia"] = incoming_dia
+    for name, value in zip(VITAL_SERIES, (incoming_hr, incoming_spo2, incoming_sys, incoming_dia)):
+        if value is not None:
+            device.history.append(name, store["timestamp"], float(value))
+    device.mark_changed()
+    VITALS_UPDATES.inc(device.device_id)
+
+def state_etag(device, version):
+    """ETag of a device's state at `version`"""
+    return f"{BOOT_ID}-{device.device_id}-{version}"
+
+def current_state(device):
+    """
+    Sensor data along with current synchronized variables, as served by /data
+    """
+    version = device.version # read first, so the data is never older than the version
+    response = device.data.copy()
+    response["device_id"] = device.device_id
+    response["version"] = state_etag(device, version)
+    response["flow_rate"] = device.flow_rate
+    response["desired_vol"] = device.desired_vol
+    response["vol_given"] = device.vol_given
+    response["procedure_running"] = device.procedure_running
+    return response
+
+def vitals_broadcaster():
+    """
+    Background task pushing vitals to each device's vitals room
+
+    All snapshots a device applied during one BROADCAST_INTERVAL are
+    coalesced into a single frame, serialized once and shared by that
+    device's subscribers only, so the cost follows the update rate and the
+    size of each room rather than the total number of viewers.
+    """
+    while True:
+        socketio.sleep(BROADCAST_INTERVAL)
+        for device in list(DEVICES.values()):
+            if device.version == device.sent_version:
+                continue
+            device.sent_version = device.version
+            frame = json.dumps(current_state(device))
+            with FANOUT_LATENCY.time("vitals_frame"):
+                socketio.emit("vitals_frame", frame, to=device.vitals_room)
+            FRAME_BYTES.observe(len(frame))
+
+def start_broadcaster():
+    """Start vitals_broadcaster once, when the first client subscribes"""
+    global broadcaster_started
+    if not broadcaster_started:
+        broadcaster_started = True
+        socketio.start_background_task(vitals_broadcaster)
+
+@app.route("/data", methods=["POST"])
+def data_endpoint():
+    """
+    Endpoint where the pi pushes sensor data, either one snapshot or
+    {"batch": [snapshot, ...]} oldest first when it is catching up
+    Flow rate is handled separately via WebSockets
+    """
+    body = request.get_json()
+    snapshots = body.get("batch", [body])
+    device = request_device(snapshots[0] if snapshots else body, create=True)
+    for snapshot in snapshots:
+        apply_snapshot(device, snapshot)
 
     # Return sensor data along with current synchronized variables
-    response = DATA_STORE.copy()
-    response["flow_rate"] = FLOW_RATE
-    response["desired_vol"] = DESIRED_VOL
-    response["vol_given"] = VOL_GIVEN
-    response["procedure_running"] = PROCEDURE_RUNNING
-    
-    return jsonify(response), 200
+    return jsonify(current_state(device)), 200
     
 @app.route("/data", methods=["GET"])
 def get_data():
     """
-    React uses this endpoint to fetch sensor data
+    React uses this endpoint to fetch sensor data (?device_id= selects the unit)
+
+    Every response carries the device's state version (see state_etag()),
+    in the body and as its ETag. A client that sends the version back
+    (If-None-Match, or ?version= where it cannot set headers) gets an empty
+    304 Not Modified
+    while nothing has changed. With ?wait=<seconds> (at most MAX_WAIT) the
+    request is held open until the version advances, so a dashboard that
+    cannot use WebSockets gets each update as it happens and costs nothing
+    in between.
     """
-    # Include all synchronized variables in the response
-    response = DATA_STORE.copy()
-    response["flow_rate"] = FLOW_RATE
-    response["desired_vol"] = DESIRED_VOL
-    response["vol_given"] = VOL_GIVEN
-    response["procedure_running"] = PROCEDURE_RUNNING
-    
-    return jsonify(response), 200
+    device = request_device()
+    if device is None:
+        return jsonify({"error": unknown_device(request_device_id())["message"]}), 404
+    try:
+        wait = min(max(optional_float("wait") or 0.0, 0.0), MAX_WAIT)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    version = device.version
+    tag = state_etag(device, version)
+    known = request.args.get("version")
+    if known is None and request.if_none_match.contains(tag):
+        known = tag
+    if known == tag and wait > 0:
+        version = device.wait_for_change(version, wait)
+        tag = state_etag(device, version)
+
+    if known == tag:
+        response = app.response_class(status=304)
+    else:
+        # Include all synchronized variables in the response
+        state = current_state(device)
+        tag = state["version"]
+        response = jsonify(state)
+    response.set_etag(tag)
+    response.headers["Cache-Control"] = "no-cache" # browsers must revalidate, never reuse silently
+    return response
+
+@app.route("/devices", methods=["GET"])
+def get_devices():
+    """
+    Units the server has heard from, with the time of their latest vitals
+    """
+    return jsonify({device_id: {"timestamp": device.data["timestamp"],
+                                "procedure_running": device.procedure_running}
+                    for device_id, device in list(DEVICES.items())}), 200
+
+def optional_float(name):
+    """Query parameter as a finite float, or None when absent; ValueError otherwise"""
+    value = request.args.get(name)
+    if value in (None, ""):
+        return None
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be a finite number, got {value!r}")
+    return number
+
+@app.route("/history", methods=["GET"])
+def get_history():
+    """
+    Trend data for a dashboard that opens mid-procedure
+
+    Query parameters (all optional):
+        since, until: Wall-clock range [since, until) in seconds
+        step: Aggregate into buckets of this many seconds (mean/min/max/count)
+        vitals: Comma-separated series names; default all vitals (add "pleth" for the waveform)
+        device_id: Unit to read; default DEFAULT_DEVICE_ID
+    """
+    device = request_device()
+    if device is None:
+        return jsonify({"error": unknown_device(request_device_id())["message"]}), 404
+    try:
+        since = optional_float("since")
+        until = optional_float("until")
+        step = optional_float("step")
+        if step is not None and step <= 0:
+            raise ValueError("step must be positive")
+        names = [name for name in request.args.get("vitals", "").split(",") if name]
+        series = device.history.query(names, since, until, step)
+    except (ValueError, KeyError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"since": since, "until": until, "step": step, "series": series}), 200
 
 # WebSocket event handlers
+def attach_device(device_id):
+    """
+    Put this socket in the device's room and send it the device's current
+    state; a device that has not reported yet gets its state sent through
+    the room once it does
+    """
+    SID_DEVICES[request.sid] = device_id
+    join_room(device_room(device_id))
+    device = get_device(device_id)
+    if device is None:
+        return
+
+    # Send current state to the newly attached client
+    emit("flow_rate_update", {"flow_rate": device.flow_rate})
+    emit("desired_vol_update", {"desired_vol": device.desired_vol})
+    emit("vol_given_update", {"vol_given": device.vol_given})
+    emit("procedure_state_update", {"running": device.procedure_running})
+
 @socketio.on("connect")
 def handle_connect():
-    print(f"Client connected: {request.sid}")
-    
-    # Send current state to the newly connected client
-    emit("flow_rate_update", {"flow_rate": FLOW_RATE})
-    emit("desired_vol_update", {"desired_vol": DESIRED_VOL})
-    emit("vol_given_update", {"vol_given": VOL_GIVEN})
-    emit("procedure_state_update", {"running": PROCEDURE_RUNNING})
+    SOCKET_EVENTS.inc("connect")
+    device_id = str(request.args.get("device_id") or DEFAULT_DEVICE_ID)
+    log.info("Client connected: %s (device %s)", request.sid, device_id)
+    attach_device(device_id)
 
 @socketio.on("disconnect")
 def handle_disconnect():
-    print(f"Client disconnected: {request.sid}")
+    SOCKET_EVENTS.inc("disconnect")
+    SID_DEVICES.pop(request.sid, None)
+    log.info("Client disconnected: %s", request.sid)
+
+@observed_event("select_device")
+def handle_select_device(data):
+    """Move this client to another device's rooms (e.g. a dashboard switching units)"""
+    device_id = str(data.get("device_id") or DEFAULT_DEVICE_ID)
+    if get_device(device_id) is None:
+        return unknown_device(device_id)
+    old = request_device_id()
+    leave_room(device_room(old))
+    leave_room(vitals_room(old))
+    attach_device(device_id)
+    return {"status": "success", "device_id": device_id}
+
+def native_view(data, typecode):
+    """
+    View little-endian binary attachment bytes as typed values without copying
+    (a byte-swapped copy on big-endian hosts)
+    """
+    view = memoryview(data).cast(typecode)
+    if sys.byteorder == "little":
+        return view
+    swapped = array(typecode, view)
+    swapped.byteswap()
+    return memoryview(swapped)
+
+@observed_event("vitals_batch")
+def handle_vitals_batch(data):
+    """
+    Handle packed vitals and waveform samples from NORA.py
+
+    Expects rate_hz, t0 and waveform_start as numbers, waveform as int16 bytes
+    and vitals as float32 bytes holding rows of VITALS_ROW (time as an offset
+    from t0, NaN for a missing vital)
+    """
+    try:
+        device = request_device(data, create=True)
+        t0 = float(data["t0"])
+        SOCKET_PAYLOAD_BYTES.observe(len(data.get("vitals", b"")) + len(data.get("waveform", b"")), "vitals_batch")
+        vitals = native_view(data.get("vitals", b""), "f")
+        waveform = native_view(data.get("waveform", b""), "h")
+        width = len(VITALS_ROW)
+        if len(vitals) % width:
+            raise ValueError(f"vitals block holds {len(vitals)} values, not rows of {width}")
+
+        for start in range(0, len(vitals), width):
+            row = vitals[start:start + width]
+            snapshot = {"timestamp": t0 + row[0]}
+            for field, value in zip(VITALS_ROW[1:], row[1:]):
+                snapshot[field] = None if math.isnan(value) else int(round(value))
+            apply_snapshot(device, snapshot)
+
+        if len(waveform):
+            # The one copy: straight from the attachment into the history ring
+            device.history.series[WAVEFORM_SERIES].extend_regular(t0 + float(data["waveform_start"]),
+                                                           float(data["rate_hz"]), waveform)
+
+        return {"status": "success", "vitals": len(vitals) // width, "samples": len(waveform)}
+    except Exception as e:
+        log.error("Error decoding vitals batch: %s", e)
+        return {"status": "error", "message": str(e)}
+
+@observed_event("subscribe_vitals")
+def handle_subscribe_vitals():
+    """Start pushing this client's device's vitals_frame events to it"""
+    join_room(vitals_room(request_device_id()))
+    start_broadcaster()
+    device = request_device()
+    if device is not None:
+        emit("vitals_frame", json.dumps(current_state(device))) # current values right away, not after the next change
+    return {"status": "success"}
+
+@observed_event("unsubscribe_vitals")
+def handle_unsubscribe_vitals():
+    """Stop pushing vitals_frame events to this client"""
+    leave_room(vitals_room(request_device_id()))
+    return {"status": "success"}
 
-@socketio.on("update_flow_rate")
+@observed_event("update_flow_rate")
 def handle_flow_rate_update(data):
     """Handle flow rate updates from any client"""
-    global FLOW_RATE
     try:
-        new_flow_rate = int(round(float(data.get("flow_rate", FLOW_RATE))))
+        device = request_device()
+        if device is None:
+            return unknown_device(request_device_id())
+        new_flow_rate = int(round(float(data.get("flow_rate", device.flow_rate))))
         # Ensure it's within valid range (0-30)
         new_flow_rate = max(0, min(30, new_flow_rate))
         
-        # Update the global flow rate
-        FLOW_RATE = new_flow_rate
-        print(f"Flow rate updated via WebSocket to: {FLOW_RATE} μL/min by client {request.sid}")
+        # Update the device's flow rate
+        device.flow_rate = new_flow_rate
+        device.mark_changed()
+        log.info("Flow rate updated via WebSocket to: %s μL/min by client %s", device.flow_rate, request.sid)
         
-        # Broadcast to all clients EXCEPT the sender
-        emit("flow_rate_update", {"flow_rate": FLOW_RATE}, broadcast=True, include_self=False)
-        return {"status": "success", "flow_rate": FLOW_RATE}
+        # Broadcast to the device's clients EXCEPT the sender
+        with FANOUT_LATENCY.time("flow_rate_update"):
+            emit("flow_rate_update", {"flow_rate": device.flow_rate}, to=device.room, include_self=False)
+        return {"status": "success", "flow_rate": device.flow_rate}
     except Exception as e:
-        print(f"Error updating flow rate: {e}")
+        log.error("Error updating flow rate: %s", e)
         return {"status": "error", "message": str(e)}
 
-@socketio.on("update_desired_vol")
+@observed_event("update_desired_vol")
 def handle_desired_vol_update(data):
     """Handle desired volume updates from any client"""
-    global DESIRED_VOL
     try:
-        new_desired_vol = int(round(float(data.get("desired_vol", DESIRED_VOL))))
+        device = request_device()
+        if device is None:
+            return unknown_device(request_device_id())
+        new_desired_vol = int(round(float(data.get("desired_vol", device.desired_vol))))
         # Ensure it's within valid range (0-50)
         new_desired_vol = max(0, min(50, new_desired_vol))
         
-        # Update the global desired volume
-        DESIRED_VOL = new_desired_vol
-        print(f"Desired volume updated via WebSocket to: {DESIRED_VOL} μL by client {request.sid}")
+        # Update the device's desired volume
+        device.desired_vol = new_desired_vol
+        device.mark_changed()
+        log.info("Desired volume updated via WebSocket to: %s μL by client %s", device.desired_vol, request.sid)
         
-        # Broadcast to all clients EXCEPT the sender
-        emit("desired_vol_update", {"desired_vol": DESIRED_VOL}, broadcast=True, include_self=False)
-        return {"status": "success", "desired_vol": DESIRED_VOL}
+        # Broadcast to the device's clients EXCEPT the sender
+        with FANOUT_LATENCY.time("desired_vol_update"):
+            emit("desired_vol_update", {"desired_vol": device.desired_vol}, to=device.room, include_self=False)
+        return {"status": "success", "desired_vol": device.desired_vol}
     except Exception as e:
-        print(f"Error updating desired volume: {e}")
+        log.error("Error updating desired volume: %s", e)
         return {"status": "error", "message": str(e)}
 
-@socketio.on("update_vol_given")
+@observed_event("update_vol_given")
 def handle_vol_given_update(data):
     """Handle volume given updates (typically from NORA.py)"""
-    global VOL_GIVEN
     try:
-        new_vol_given = float(data.get("vol_given", VOL_GIVEN))
+        device = request_device()
+        if device is None:
+            return unknown_device(request_device_id())
+        new_vol_given = float(data.get("vol_given", device.vol_given))
         # Ensure it's not negative
         new_vol_given = max(0, new_vol_given)
         
-        # Update the global volume given
-        VOL_GIVEN = new_vol_given
-        print(f"Volume given updated via WebSocket to: {VOL_GIVEN} μL by client {request.sid}")
+        # Update the device's volume given
+        device.vol_given = new_vol_given
+        device.mark_changed()
+        log.debug("Volume given updated via WebSocket to: %s μL by client %s", device.vol_given, request.sid)
         
-        # Broadcast to all clients EXCEPT the sender
-        emit("vol_given_update", {"vol_given": VOL_GIVEN}, broadcast=True, include_self=False)
-        return {"status": "success", "vol_given": VOL_GIVEN}
+        # Broadcast to the device's clients EXCEPT the sender
+        with FANOUT_LATENCY.time("vol_given_update"):
+            emit("vol_given_update", {"vol_given": device.vol_given}, to=device.room, include_self=False)
+        return {"status": "success", "vol_given": device.vol_given}
     except Exception as e:
-        print(f"Error updating volume given: {e}")
+        log.error("Error updating volume given: %s", e)
         return {"status": "error", "message": str(e)}
 
-@socketio.on("procedure_state")
+@observed_event("procedure_state")
 def handle_procedure_state_update(data):
     """Handle procedure state updates from any client"""
-    global PROCEDURE_RUNNING
     try:
-        new_state = bool(data.get("running", PROCEDURE_RUNNING))
+        device = request_device()
+        if device is None:
+            return unknown_device(request_device_id())
+        new_state = bool(data.get("running", device.procedure_running))
         
         # Log the incoming update
-        print(f"DEBUG: Received procedure state update: {'Running' if new_state else 'Stopped'}")
-        print(f"DEBUG: Current state: {'Running' if PROCEDURE_RUNNING else 'Stopped'}")
+        log.debug("Received procedure state update: %s (currently %s)", "Running" if new_state else "Stopped",
+                  "Running" if device.procedure_running else "Stopped")
         
-        # Update the global procedure state
-        if new_state != PROCEDURE_RUNNING:
-            PROCEDURE_RUNNING = new_state
-            print(f"DEBUG: Procedure state updated to: {'Running' if PROCEDURE_RUNNING else 'Stopped'} by client {request.sid}")
+        # Update the device's procedure state
+        if new_state != device.procedure_running:
+            device.procedure_running = new_state
+            device.mark_changed()
+            log.info("Procedure state updated to: %s by client %s",
+                     "Running" if device.procedure_running else "Stopped", request.sid)
             
-            # Broadcast to all clients EXCEPT the sender
-            emit("procedure_state_update", {"running": PROCEDURE_RUNNING}, broadcast=True, include_self=False)
-            print(f"DEBUG: Broadcasted procedure state update to other clients")
+            # Broadcast to the device's clients EXCEPT the sender
+            with FANOUT_LATENCY.time("procedure_state_update"):
+                emit("procedure_state_update", {"running": device.procedure_running}, to=device.room, include_self=False)
         else:
-            print(f"DEBUG: No change in procedure state, still: {'Running' if PROCEDURE_RUNNING else 'Stopped'}")
+            log.debug("No change in procedure state, still: %s", "Running" if device.procedure_running else "Stopped")
             
-        return {"status": "success", "running": PROCEDURE_RUNNING}
+        return {"status": "success", "running": device.procedure_running}
     except Exception as e:
-        print(f"Error updating procedure state: {e}")
+        log.error("Error updating procedure state: %s", e)
         return {"status": "error", "message": str(e)}
 
+# Usage: python server.py (production) or NORA_SERVER_MODE=development python server.py
 if __name__ == "__main__":
-    print(f"Starting server on http://localhost:5000")
-    print(f"WebSocket endpoint for variable synchronization at ws://localhost:5000")
-    print(f"HTTP endpoints for sensor data at http://localhost:5000/data")
-    socketio.run(app, host="0.0.0.0", port=5000, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    if SERVER_MODE not in ("production", "development"):
+        sys.exit(f"Unknown NORA_SERVER_MODE {SERVER_MODE!r}; expected production or development")
+    if SERVER_MODE == "production" and ASYNC_MODE == "threading":
+        log.warning("gevent and eventlet are not installed; serving production on the Werkzeug "
+                    "development server, one thread per connection. Install one of them "
+                    "(pip install gevent gevent-websocket) to hold many connections.")
+    port = int(os.environ.get("NORA_SERVER_PORT", "5000"))
+    print(f"Starting server on http://localhost:{port} ({SERVER_MODE} mode, {ASYNC_MODE} workers)")
+    print(f"WebSocket endpoint for variable synchronization at ws://localhost:{port}")
+    print(f"HTTP endpoints for sensor data at http://localhost:{port}/data")
+    if SERVER_MODE == "development":
+        socketio.run(app, host="0.0.0.0", port=port, debug=True, allow_unsafe_werkzeug=True)
+    elif ASYNC_MODE == "threading":
+        # No debugger or reloader, on Werkzeug
+        socketio.run(app, host="0.0.0.0", port=port, allow_unsafe_werkzeug=True)
+    else:
+        # No debugger or reloader, on gevent or eventlet
+        socketio.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+Logging for server.py
+
+Event handlers log through the "nora" logger instead of print(). A record
+below the configured level costs one level check; one that passes goes
+through RateLimitFilter and is put on a bounded queue without blocking.
+A QueueListener thread does the formatting and the stdout writes, so a
+slow terminal or pipe never stalls a handler. When the queue is full,
+records are dropped and counted rather than waited for.
+
+Environment:
+    NORA_LOG_LEVEL: DEBUG, INFO (default), WARNING, ...
+    NORA_LOG_RATE: Records of one message type allowed per second (default 20, 0 for no limit)
+    NORA_SOCKETIO_LOG: 1 to also log every Socket.IO/Engine.IO packet (default off)
+"""
+
+import argparse
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.environ.get("NORA_LOG_LEVEL", "INFO").upper()
+LOG_RATE = float(os.environ.get("NORA_LOG_RATE", "20"))
+SOCKETIO_LOG = os.environ.get("NORA_SOCKETIO_LOG", "0") == "1"
+LOG_QUEUE_SIZE = 10000
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `rate` records per second for each message type
+
+    The type is the unformatted message (the format string before its
+    arguments), so "Flow rate updated to %s" is one type however many
+    values it is logged with. The first record after a suppressed burst
+    says how many were dropped.
+    """
+
+    def __init__(self, rate=LOG_RATE, period=1.0):
+        super().__init__()
+        self.limit = rate * period
+        self.period = period
+        self.windows = {} # message type -> [window start, passed, suppressed]
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.limit <= 0:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                dropped = window[2] if window is not None else 0
+                self.windows[key] = [now, 1, 0]
+                if dropped:
+                    record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.suppressed += 1
+            return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=LOG_LEVEL, rate=LOG_RATE, stream=None):
+    """
+    Route the "nora" logger through a rate-limited queue to `stream`
+
+    Safe to call again; later calls replace the level, rate limit and stream.
+
+    Args:
+        level: Level name or number
+        rate: Records of one message type per second; 0 disables the limit
+        stream: Where the listener thread writes (default sys.stdout)
+
+    Returns:
+        The DroppingQueueHandler, whose `dropped` and filter counters can be read
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter(rate))
+
+    output = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+
+    logger = logging.getLogger("nora")
+    for old in list(logger.handlers):
+        logger.removeHandler(old)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return handler
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def socketio_logger():
+    """Logger for SocketIO(logger=..., engineio_logger=...): packet logging only when NORA_SOCKETIO_LOG=1"""
+    return logging.getLogger("nora.socketio") if SOCKETIO_LOG else False
+
+
+def benchmark_logging(events=5000):
+    """
+    Time server.py's control event handlers through the Socket.IO test
+    client with handler logging at several levels
+
+    Records are written to os.devnull, so the numbers show what logging
+    costs the handlers themselves rather than how fast the terminal is.
+
+    Returns:
+        dict of case -> events per second
+    """
+    os.environ.setdefault("NORA_SERVER_MODE", "development") # no monkey-patching after threading is imported
+    import server
+
+    cases = {
+        "DEBUG, no rate limit": ("DEBUG", 0),
+        "DEBUG, rate limited": ("DEBUG", LOG_RATE or 20),
+        "INFO, rate limited": ("INFO", LOG_RATE or 20),
+        "WARNING": ("WARNING", LOG_RATE or 20),
+    }
+    results = {}
+    with open(os.devnull, "w") as devnull:
+        client = server.socketio.test_client(server.app)
+        for label, (level, rate) in cases.items():
+            handler = configure_logging(level, rate, devnull)
+            start = time.perf_counter()
+            for i in range(events):
+                if i % 2:
+                    client.emit("update_flow_rate", {"flow_rate": i % 30})
+                else:
+                    client.emit("procedure_state", {"running": i % 4 == 0})
+            elapsed = time.perf_counter() - start
+            results[label] = events / elapsed
+            print(f"{label:22s} | {results[label]:9.0f} events/s | "
+                  f"{handler.filters[0].suppressed:6d} suppressed | {handler.dropped:6d} dropped")
+        client.disconnect()
+    stop_logging()
+    return results
+
+
+# Usage: python server_logging.py --events 5000
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Socket.IO handler throughput with logging on and off")
+    parser.add_argument("--events", type=int, default=5000, help="events emitted per case")
+    args = parser.parse_args()
+    benchmark_logging(args.events)
@@ -0,0 +1,163 @@
+"""
+Metrics for server.py in the Prometheus text format
+
+Counters and histograms keep their numbers in plain dicts and lists and
+update them in place with no lock, so recording a value costs about a
+microsecond and can stay on in production. Under gevent or eventlet
+greenlets never interrupt each other mid-update, so counts are exact; in
+development (threading) mode an increment can very rarely be lost when
+two threads update the same series at once, which is fine for monitoring.
+Gauges are computed by a callback when /metrics is scraped.
+"""
+
+import bisect
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds and bytes; +Inf is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count per combination of label values"""
+
+    kind = "counter"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in list(self.values.items()):
+            yield self.name, _labels(self.labels, label_values), value
+
+
+class Gauge:
+    """Value read from `callback` at scrape time: a number, or a dict of label values tuple -> number"""
+
+    kind = "gauge"
+
+    def __init__(self, name, description, callback, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.callback = callback
+        REGISTRY.append(self)
+
+    def samples(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield self.name, _labels(self.labels, label_values), value
+
+
+class Histogram:
+    """Distribution of observed values in fixed buckets per combination of label values"""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {} # label values -> [count per bucket..., count above the last bucket, sum]
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series.setdefault(label_values, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        """Observe the wall time spent in a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self):
+        for label_values, series in list(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield self.name + "_bucket", _labels(self.labels, label_values, f'le="{_number(bound)}"'), cumulative
+            yield self.name + "_sum", _labels(self.labels, label_values), series[-1]
+            yield self.name + "_count", _labels(self.labels, label_values), cumulative
+
+
+def render():
+    """
+    Returns:
+        Every registered metric in the Prometheus text exposition format (version 0.0.4)
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def benchmark_metrics(iterations=200000):
+    """
+    Time Counter.inc() and Histogram.observe() on a private registry entry
+
+    Returns:
+        dict of operation -> microseconds per call
+    """
+    counter = Counter("benchmark_total", "benchmark counter", ("event",))
+    histogram = Histogram("benchmark_seconds", "benchmark histogram", ("event",))
+    results = {}
+    try:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            counter.inc("update_flow_rate")
+        results["counter_inc_us"] = (time.perf_counter() - start) / iterations * 1e6
+        start = time.perf_counter()
+        for i in range(iterations):
+            histogram.observe(i * 1e-7, "update_flow_rate")
+        results["histogram_observe_us"] = (time.perf_counter() - start) / iterations * 1e6
+    finally:
+        REGISTRY.remove(counter)
+        REGISTRY.remove(histogram)
+    for label, value in results.items():
+        print(f"{label:22s} | {value:6.3f} us")
+    return results
+
+
+# Usage: python server_metrics.py
+if __name__ == "__main__":
+    benchmark_metrics()
@@ -1,34 +1,18 @@
 import React, { useState, useEffect } from "react";
-import axios from "axios";
+import { subscribeVitals } from "./vitalsFeed";
 import TextRow from "./TextRow";
 
 function BloodPressureCard() {
   const [data, setData] = useState({ SYS: "...", DIA: "..." });
 
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const response = await axios.get("/data");
-        
-        if (response.data) {
-          setData({
-            SYS: response.data.bp_sys,
-            DIA: response.data.bp_dia
-          });
-        }
-      } catch (error) {
-        console.error("Error fetching blood pressure data:", error);
-      }
-    };
-
-    // Set up polling interval (every 1 second)
-    const interval = setInterval(fetchData, 1000);
-    
-    // Initial fetch
-    fetchData();
-    
-    // Clean up interval on component unmount
-    return () => clearInterval(interval);
+    // Vitals are pushed by the server; clean up subscription on component unmount
+    return subscribeVitals((vitals) => {
+      setData({
+        SYS: vitals.bp_sys,
+        DIA: vitals.bp_dia
+      });
+    });
   }, []);
 
   function displayValue(key) {
@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from "react";
 import { io } from "socket.io-client";
+import { DEVICE_ID } from "./device";
 import "./FlowRateCard.css";
 
 function FlowRateCard() {
@@ -18,6 +19,7 @@ function FlowRateCard() {
     // Initialize Socket.IO connection
     const socket = io(serverUrl, {
       transports: ["websocket", "polling"],
+      query: { device_id: DEVICE_ID },
       withCredentials: false
     });
     
@@ -61,7 +63,7 @@ function FlowRateCard() {
     // Initial data fetch to get current flow rate
     const fetchInitialData = async () => {
       try {
-        const response = await fetch("/data");
+        const response = await fetch(`/data?device_id=${encodeURIComponent(DEVICE_ID)}`);
         const data = await response.json();
         
         if (data) {
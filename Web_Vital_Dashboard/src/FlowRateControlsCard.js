@@ -3,6 +3,7 @@ import FlowRateCard from "./FlowRateCard";
 import React, { useState, useEffect, useRef } from "react";
 
 import { io } from "socket.io-client";
+import { DEVICE_ID } from "./device";
 import "./FlowRateCard.css";
 
 
@@ -24,6 +25,7 @@ function FlowRateControlsCard() {
       // Initialize Socket.IO connection
       const socket = io(serverUrl, {
         transports: ["websocket", "polling"],
+        query: { device_id: DEVICE_ID },
         withCredentials: false
       });
       
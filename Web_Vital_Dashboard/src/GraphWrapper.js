@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from "react";
 import ECGChart from "./ECGChart";
-import axios from "axios";
+import { subscribeVitals } from "./vitalsFeed";
 
 import "./GraphWrapper.css";
 
@@ -17,17 +17,21 @@ function GraphWrapper() {
   const MAX_POINTS = 150;
 
   useEffect(() => {
+    // Latest vitals pushed by the server; sampled into the log every 10 seconds
+    let latestVitals = null;
 
-    // Function to fetch the latest data
-    const fetchData = async () => {
+    // Function to add the latest vitals to the log
+    const addPoint = () => {
       try {
-        const response = await axios.get("/data");
-        
-        // Extract heart rate from response
-        const newHeartRate = response.data.heart_rate;
-        const newSpo2Rate = response.data.spo2;
-        const newBpDiaRate = response.data.bp_dia;
-        const newBpSysRate = response.data.bp_sys;
+        if (latestVitals === null) {
+          return;
+        }
+
+        // Extract heart rate from the latest vitals
+        const newHeartRate = latestVitals.heart_rate;
+        const newSpo2Rate = latestVitals.spo2;
+        const newBpDiaRate = latestVitals.bp_dia;
+        const newBpSysRate = latestVitals.bp_sys;
 
         
         // Create a new data point
@@ -103,18 +107,26 @@ function GraphWrapper() {
           return updatedData;
         });
       } catch (error) {
-        console.error("Error fetching data:", error);
+        console.error("Error adding data point:", error);
       }
     };
 
-    // Set up polling interval (every 10 seconds)
-    const interval = setInterval(fetchData, 10000);
-    
-    // Initial fetch
-    fetchData();
+    const unsubscribe = subscribeVitals((vitals) => {
+      const first = latestVitals === null;
+      latestVitals = vitals;
+      if (first) {
+        addPoint(); // first point right away, as the initial fetch used to do
+      }
+    });
 
-    // Clean up interval on component unmount
-    return () => clearInterval(interval);
+    // Log a point every 10 seconds
+    const interval = setInterval(addPoint, 10000);
+
+    // Clean up interval and subscription on component unmount
+    return () => {
+      clearInterval(interval);
+      unsubscribe();
+    };
   }, []);
 
   return (
@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from "react";
 import { io } from "socket.io-client";
+import { DEVICE_ID } from "./device";
 import "./FlowRateCard.css";
 
 
@@ -24,6 +25,7 @@ function ProcedureControlCard() {
     // Initialize Socket.IO connection
     const socket = io(serverUrl, {
       transports: ["websocket", "polling"],
+      query: { device_id: DEVICE_ID },
       withCredentials: false
     });
     
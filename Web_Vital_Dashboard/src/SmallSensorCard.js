@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from "react";
 import { FontAwesomeIcon } from "@fortawesome/react-fontawesome";
-import axios from "axios";
+import { subscribeVitals } from "./vitalsFeed";
 
 import "./SmallSensorCard.css";
 import TextRow from "./TextRow";
@@ -8,36 +8,22 @@ import TextRow from "./TextRow";
 function SmallSensorCard({ iconName, title, path, unit }) {
   const [data, setData] = useState("...");
 
-  // Fetch data from the backend based on the path prop
+  // Receive data pushed by the backend and pick the field for the path prop
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const response = await axios.get("/data");
-
-        // Map the path to the appropriate field in the response
-        // We'll use a mapping object to handle different paths
-        const dataMapping = {
-          "/heart_rate_val": "heart_rate",
-          "/sp02_val": "spo2"
-        };
-        
-        const field = dataMapping[path];
-        if (field && response.data && response.data[field] !== undefined) {
-          setData(response.data[field]);
-        }
-      } catch (error) {
-        console.error("Error fetching data:", error);
-      }
+    // Map the path to the appropriate field in the response
+    // We'll use a mapping object to handle different paths
+    const dataMapping = {
+      "/heart_rate_val": "heart_rate",
+      "/sp02_val": "spo2"
     };
+    const field = dataMapping[path];
 
-    // Set up polling interval
-    const interval = setInterval(fetchData, 1000);
-    
-    // Initial fetch
-    fetchData();
-    
-    // Clean up interval on component unmount
-    return () => clearInterval(interval);
+    // Clean up subscription on component unmount
+    return subscribeVitals((vitals) => {
+      if (field && vitals[field] !== undefined) {
+        setData(vitals[field]);
+      }
+    });
   }, [path]);
 
   function displayValue() {
@@ -0,0 +1,3 @@
+// NORA unit this page shows, chosen with /nora?device=<id>.
+// Must match the unit's NORA_DEVICE_ID; units without one are "default".
+export const DEVICE_ID = new URLSearchParams(window.location.search).get("device") || "default";
@@ -0,0 +1,120 @@
+import axios from "axios";
+import { io } from "socket.io-client";
+import { DEVICE_ID } from "./device";
+
+// One shared feed for every component that shows vitals.
+// The server pushes "vitals_frame" (the same JSON as GET /data) to the
+// device's vitals room whenever its vitals change, so each page parses one frame per
+// update no matter how many cards are listening. While the socket is down
+// the feed falls back to long-polling /data: each request names the last
+// state version seen and the server holds it open until that version
+// changes, so updates still arrive promptly and an idle page costs one
+// request per LONG_POLL_WAIT. Everything is for the unit named in the page
+// URL (see device.js).
+
+const SERVER_URL = "http://localhost:5000";
+const LONG_POLL_WAIT = 25; // seconds the server may hold a poll open
+const RETRY_DELAY = 1000;
+
+const listeners = new Set();
+let socket = null;
+let polling = false;
+let pollRun = 0; // bumped to end the running poll loop
+let latest = null;
+
+function publish(data) {
+  latest = data;
+  listeners.forEach((listener) => listener(data));
+}
+
+async function pollLoop(run) {
+  while (run === pollRun) {
+    const params = { device_id: DEVICE_ID };
+    if (latest !== null && latest.version !== undefined) {
+      params.version = latest.version;
+      params.wait = LONG_POLL_WAIT;
+    }
+    try {
+      const response = await axios.get("/data", {
+        params,
+        timeout: (LONG_POLL_WAIT + 5) * 1000,
+        // 304: nothing changed while the server held the request
+        validateStatus: (status) => status === 200 || status === 304
+      });
+      if (run === pollRun && response && response.status === 200 && response.data) {
+        publish(response.data);
+      }
+    } catch (error) {
+      console.error("Error fetching data:", error);
+      await new Promise((resolve) => setTimeout(resolve, RETRY_DELAY));
+    }
+  }
+}
+
+function startPolling() {
+  if (!polling) {
+    polling = true;
+    pollRun += 1;
+    pollLoop(pollRun);
+  }
+}
+
+function stopPolling() {
+  if (polling) {
+    polling = false;
+    pollRun += 1;
+  }
+}
+
+function connect() {
+  socket = io(SERVER_URL, {
+    transports: ["websocket", "polling"],
+    query: { device_id: DEVICE_ID },
+    withCredentials: false
+  });
+
+  socket.on("connect", () => {
+    socket.emit("subscribe_vitals");
+    stopPolling();
+  });
+
+  socket.on("disconnect", () => {
+    if (listeners.size > 0) {
+      startPolling();
+    }
+  });
+
+  socket.on("connect_error", () => {
+    if (listeners.size > 0) {
+      startPolling();
+    }
+  });
+
+  // Frames arrive pre-serialized; parse once here for all listeners
+  socket.on("vitals_frame", (frame) => {
+    publish(typeof frame === "string" ? JSON.parse(frame) : frame);
+  });
+}
+
+// Call listener with every vitals update; returns a function that unsubscribes
+export function subscribeVitals(listener) {
+  listeners.add(listener);
+  if (latest !== null) {
+    listener(latest);
+  }
+  if (socket === null) {
+    connect();
+  }
+  if (!socket.connected) {
+    startPolling();
+  }
+
+  return () => {
+    listeners.delete(listener);
+    if (listeners.size === 0) {
+      stopPolling();
+      socket.disconnect();
+      socket = null;
+    }
+  };
+}
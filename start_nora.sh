@@ -19,13 +19,16 @@ if [[ $(uname -m) == arm* ]] || [[ $(uname -m) == aarch* ]]; then
   IS_RASPBERRY_PI=true
 fi
 
-# Install dependencies if needed
-if [ ! -f "$VENV_DIR/.dependencies_installed" ]; then
+# Install dependencies if needed. Bump DEPENDENCIES_VERSION whenever the
+# packages below change, so venvs set up by an older script install them too.
+DEPENDENCIES_VERSION=2
+DEPENDENCIES_MARKER="$VENV_DIR/.dependencies_installed-v$DEPENDENCIES_VERSION"
+if [ ! -f "$DEPENDENCIES_MARKER" ]; then
   echo "Installing dependencies..."
   # NORA.py dependencies
-  pip install matplotlib pillow python-socketio requests tk
+  pip install matplotlib numpy pillow python-socketio requests tk
   # server.py dependencies
-  pip install flask flask-cors flask-socketio
+  pip install flask flask-cors flask-socketio gevent gevent-websocket
   
   # Install GPIO libraries for Raspberry Pi
   if [ "$IS_RASPBERRY_PI" = true ]; then
@@ -40,7 +43,8 @@ if [ ! -f "$VENV_DIR/.dependencies_installed" ]; then
   fi
   
   # Mark dependencies as installed
-  touch "$VENV_DIR/.dependencies_installed"
+  rm -f "$VENV_DIR"/.dependencies_installed*
+  touch "$DEPENDENCIES_MARKER"
   echo "Dependencies installed successfully"
 else
   echo "Dependencies already installed"